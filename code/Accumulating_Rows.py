@@ -0,0 +1,90 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+# rows that the accumulators of large tables hold in memory before spilling
+SPILL_ROWS = 1000000
+
+def normal_value(value):
+    # 1, 1.0 and True are equal in Python, so they get the same key
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+class RowAccumulator:
+    """An ordered set of output rows for the processors.
+    add() keeps the first copy of a row, with a hash lookup instead of a
+    scan of the rows added so far, and iterating, e.g. by
+    Saving_Tables.save_table(), returns the rows in the order they were
+    first added.
+
+    Rows are compared by key(), a 16 byte digest of their normalized
+    values, which is all that is kept of the rows added so far. With
+    "spill_rows" set, the rows themselves are written to a temporary file
+    on disk once that many are held in memory, and the same digests tell
+    the duplicates of rows in memory and on disk apart."""
+    def __init__(self, spill_rows=None):
+        self.spill_rows = spill_rows
+        self.digests = set()
+        self.rows = []
+        self.spill_file = None
+        self.num_spilled = 0
+
+    def key(self, row):
+        values = tuple(normal_value(v) for v in row)
+        return hashlib.blake2b(repr(values).encode(), digest_size=16).digest()
+
+    def __contains__(self, row):
+        return self.key(row) in self.digests
+
+    def __len__(self):
+        return len(self.digests)
+
+    def add(self, row):
+        """Adds "row" unless an equal row was added before.
+        Returns whether it was added."""
+        key = self.key(row)
+        if key in self.digests:
+            return False
+        self.digests.add(key)
+        self.rows.append(row)
+        if self.spill_rows and len(self.rows) >= self.spill_rows:
+            self.spill()
+        return True
+
+    def update(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def spill(self):
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile()
+        self.spill_file.seek(0, os.SEEK_END)
+        pickle.dump(self.rows, self.spill_file)
+        self.num_spilled += len(self.rows)
+        self.rows = []
+
+    def __iter__(self):
+        if self.spill_file is not None:
+            self.spill_file.seek(0)
+            while True:
+                try:
+                    batch = pickle.load(self.spill_file)
+                except EOFError:
+                    break
+                yield from batch
+        yield from list(self.rows)
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+        self.rows = []
+        self.digests = set()
+        self.num_spilled = 0
+
+if __name__ == "__main__":
+    print("This script should not be run by itself. It is used by the Processing_ scripts.")
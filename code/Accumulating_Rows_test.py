@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+from Accumulating_Rows import RowAccumulator
+
+
+def test_first_copy_in_order():
+    rows = RowAccumulator()
+    assert rows.add(['64500', 1.5, 'PDB'])
+    assert not rows.add(('64500', 1.5, 'PDB'))
+    rows.update([['64501', 2, 'PDB'], ['64501', 2.0, 'PDB'], ['64500', 1.5, 'PCH']])
+    # numbers that are equal are one row, a number and its text are not
+    assert ['64501', 2.0, 'PDB'] in rows
+    assert [64501, 2, 'PDB'] not in rows
+    assert list(rows) == [['64500', 1.5, 'PDB'], ['64501', 2, 'PDB'], ['64500', 1.5, 'PCH']]
+    assert len(rows) == 3
+
+
+def test_spill():
+    rows = RowAccumulator(spill_rows=3)
+    added = [rows.add([i % 7, float(i % 7), 'x']) for i in range(20)]
+    assert added == [True] * 7 + [False] * 13
+    # two batches of three rows went to disk, the last row is in memory
+    assert rows.num_spilled == 6
+    assert len(rows) == 7
+    # the duplicates of spilled rows are found the same way as those in memory
+    assert [0, 0, 'x'] in rows and [6, 6.0, 'x'] in rows
+    assert list(rows) == [[i, float(i), 'x'] for i in range(7)]
+    # and the rows can be read again
+    assert len(list(rows)) == 7
+    rows.close()
+    assert list(rows) == []
@@ -0,0 +1,175 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import dbStructure as db
+
+class Stage:
+    """A step of the database build that derives "outputs" tables
+    from "inputs" tables and "input_files", by calling func(*args).
+    "writes_db" is False for a stage that only reads the database."""
+    def __init__(self, name, func, args=(), inputs=(), input_files=(), outputs=(), writes_db=True):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.inputs = list(inputs)
+        self.input_files = list(input_files)
+        self.outputs = list(outputs)
+        self.writes_db = writes_db
+
+def run_stage(stage):
+    start = time.time()
+    stage.func(*stage.args)
+    return time.time() - start
+
+class BuildingStages:
+    """Runs the stages that follow the load of the processed files.
+
+    A stage depends on the earlier stages that output one of its input
+    tables, and otherwise on the rows loaded from the processed files.
+    Each stage gets a fingerprint from the manifest hashes of its loaded
+    input tables, the fingerprints of the stages it depends on and the
+    hashes of its input files. A stage whose fingerprint is the one
+    recorded by its last successful run, and whose outputs exist, is
+    skipped. Stages that do not depend on each other run in parallel
+    processes, except that the stages writing the database run one at
+    a time, since SQLite takes a single writer."""
+    def __init__(self, db_file, stages, jobs=None):
+        self.db_file = db_file
+        self.stages = stages
+        self.jobs = jobs if jobs else os.cpu_count()
+        self.fingerprints = {}
+        self.timings = {}
+        conn = sqlite3.connect(self.db_file)
+        conn.execute(db.sql_create_build_stages_table)
+        conn.commit()
+        conn.close()
+
+    def dependencies(self, stage):
+        """Returns the names of the earlier stages that output an input of "stage"."""
+        producers = {}
+        for s in self.stages:
+            if s is stage:
+                break
+            for t in s.outputs:
+                producers[t] = s.name
+        return {producers[t] for t in stage.inputs if t in producers}
+
+    def table_fingerprint(self, conn, stage, table):
+        """The fingerprint of the latest stage before "stage" that outputs
+        "table", or the manifest hashes of the files loaded into it.
+        "stage" itself is never one of them, so a table that it both
+        reads and writes, such as city_points of cloud_regions, is
+        fingerprinted by the rows it starts from, and not by its own writes."""
+        for s in reversed(self.stages[:self.stages.index(stage)]):
+            if table in s.outputs:
+                return self.fingerprints[s.name]
+        cur = conn.execute("SELECT file_name, sha256 FROM load_manifest WHERE table_name = ? ORDER BY file_name",
+                (table,))
+        return json.dumps(cur.fetchall())
+
+    def file_fingerprint(self, f_name):
+        sha = hashlib.sha256()
+        with open(f_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def fingerprint(self, conn, stage):
+        sha = hashlib.sha256(stage.name.encode())
+        for t in stage.inputs:
+            sha.update(f"{t}:{self.table_fingerprint(conn, stage, t)}".encode())
+        for f in stage.input_files:
+            sha.update(f"{f}:{self.file_fingerprint(f)}".encode())
+        return sha.hexdigest()
+
+    def is_up_to_date(self, conn, stage):
+        cur = conn.execute("SELECT fingerprint FROM build_stages WHERE stage_name = ?", (stage.name,))
+        row = cur.fetchone()
+        if row is None or row[0] != self.fingerprints[stage.name]:
+            return False
+        for t in stage.outputs:
+            cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (t,))
+            if cur.fetchone() is None:
+                return False
+        return True
+
+    def record_stage(self, stage, seconds):
+        conn = sqlite3.connect(self.db_file, timeout=60)
+        conn.execute("INSERT OR REPLACE INTO build_stages VALUES(?, ?, ?, ?)",
+                (stage.name, self.fingerprints[stage.name], json.dumps(stage.outputs), seconds))
+        conn.commit()
+        conn.close()
+
+    def run_steps(self):
+        """Runs the stages that are out of date and returns the names of
+        the stages that failed."""
+        start = time.time()
+        waiting = {s.name: self.dependencies(s) for s in self.stages}
+        stages = {s.name: s for s in self.stages}
+        failed = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            running = {}
+            while waiting or running:
+                for name in [n for n, deps in waiting.items() if not deps]:
+                    if stages[name].writes_db and any(stages[n].writes_db for n in running.values()):
+                        # waits for the stage that is writing the database
+                        continue
+                    del waiting[name]
+                    if self.check_stage(stages[name]):
+                        print(f"Stage {name} is up to date.")
+                        self.finished(name, waiting)
+                    else:
+                        print(f"Running stage {name}.")
+                        running[executor.submit(run_stage, stages[name])] = name
+                if not running:
+                    continue
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.timings[name] = future.result()
+                    except Exception as e:
+                        print(f"Stage {name} failed: {e}")
+                        failed.append(name)
+                        self.drop_dependents(name, waiting, failed)
+                        continue
+                    self.record_stage(stages[name], self.timings[name])
+                    print(f"Stage {name} finished in {self.timings[name]:.1f} seconds.")
+                    self.finished(name, waiting)
+
+        self.print_summary(time.time() - start, failed)
+        return failed
+
+    def check_stage(self, stage):
+        """Computes the fingerprint of "stage" and returns whether it is up to date."""
+        conn = sqlite3.connect(self.db_file)
+        self.fingerprints[stage.name] = self.fingerprint(conn, stage)
+        up_to_date = self.is_up_to_date(conn, stage)
+        conn.close()
+        return up_to_date
+
+    def finished(self, name, waiting):
+        for deps in waiting.values():
+            deps.discard(name)
+
+    def drop_dependents(self, name, waiting, failed):
+        for n in [n for n, deps in waiting.items() if name in deps]:
+            print(f"Stage {n} is not run, because {name} failed.")
+            del waiting[n]
+            failed.append(n)
+            self.drop_dependents(n, waiting, failed)
+
+    def print_summary(self, elapsed, failed):
+        print("Stage timings:")
+        for s in self.stages:
+            if s.name in failed:
+                status = "failed"
+            elif s.name in self.timings:
+                status = f"{self.timings[s.name]:.1f} s"
+            else:
+                status = "up to date"
+            print(f"\t{s.name}: {status}")
+        print(f"Finished the stages in {elapsed:.1f} seconds.")
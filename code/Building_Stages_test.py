@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import sqlite3
+import time
+
+import Building_Stages
+import dbStructure as db
+
+
+def write_log(log_file, line):
+    with open(log_file, 'a') as f:
+        f.write(line + '\n')
+
+
+def add_stage_row(db_file, log_file):
+    write_log(log_file, 'ran')
+    conn = sqlite3.connect(db_file)
+    conn.execute("CREATE TABLE IF NOT EXISTS stage_output(value integer)")
+    conn.execute("INSERT INTO stage_output VALUES(1)")
+    conn.commit()
+    conn.close()
+
+
+def fail_stage(db_file, log_file):
+    write_log(log_file, 'ran')
+    raise sqlite3.IntegrityError("the write failed")
+
+
+def run_stage(db_file, func, input_file, log_file):
+    stages = [Building_Stages.Stage('test_stage', func, (db_file, log_file),
+            input_files=[input_file], outputs=['stage_output'])]
+    return Building_Stages.BuildingStages(db_file, stages, jobs=1).run_steps()
+
+
+def test_stage_skip(tmp_path):
+    db_file = tmp_path / 'test.db'
+    sqlite3.connect(db_file).close()
+    input_file = tmp_path / 'input.csv'
+    input_file.write_text('a\n')
+    log_file = tmp_path / 'stage.log'
+
+    assert run_stage(db_file, add_stage_row, input_file, log_file) == []
+    assert run_stage(db_file, add_stage_row, input_file, log_file) == []
+    assert log_file.read_text().count('ran') == 1
+
+    # a changed input file runs the stage again
+    input_file.write_text('b\n')
+    assert run_stage(db_file, add_stage_row, input_file, log_file) == []
+    assert log_file.read_text().count('ran') == 2
+
+    # a stage that fails is not recorded, so it runs again next time
+    input_file.write_text('c\n')
+    assert run_stage(db_file, fail_stage, input_file, log_file) == ['test_stage']
+    assert run_stage(db_file, fail_stage, input_file, log_file) == ['test_stage']
+    assert log_file.read_text().count('ran') == 4
+
+
+def add_city(db_file, log_file):
+    write_log(log_file, 'ran')
+    conn = sqlite3.connect(db_file)
+    conn.execute("INSERT INTO city_points (city_name) VALUES('aws:eu-south-2')")
+    conn.commit()
+    conn.close()
+
+
+def test_stage_own_outputs(tmp_path):
+    db_file = tmp_path / 'test.db'
+    conn = sqlite3.connect(db_file)
+    conn.execute(db.tables['city_points'])
+    conn.execute(db.sql_create_load_manifest_table)
+    conn.execute("INSERT INTO load_manifest (file_name, table_name, sha256) VALUES(?, ?, ?)",
+            ('city_points/city_points.csv', 'city_points', 'a'))
+    conn.commit()
+    conn.close()
+    log_file = tmp_path / 'stage.log'
+    # like cloud_regions, the stage adds rows to a table that it reads
+    stages = [Building_Stages.Stage('add_city', add_city, (db_file, log_file),
+            inputs=['city_points'], outputs=['city_points'])]
+    for _ in range(2):
+        assert Building_Stages.BuildingStages(db_file, stages, jobs=1).run_steps() == []
+    # its own rows do not make it out of date
+    assert log_file.read_text().count('ran') == 1
+
+    # a new load of the table does
+    conn = sqlite3.connect(db_file)
+    conn.execute("UPDATE load_manifest SET sha256 = 'b'")
+    conn.commit()
+    conn.close()
+    assert Building_Stages.BuildingStages(db_file, stages, jobs=1).run_steps() == []
+    assert log_file.read_text().count('ran') == 2
+
+
+def write_slowly(db_file, log_file, name):
+    write_log(log_file, f'start {name}')
+    time.sleep(0.2)
+    write_log(log_file, f'end {name}')
+
+
+def test_writers_run_one_at_a_time(tmp_path):
+    db_file = tmp_path / 'test.db'
+    sqlite3.connect(db_file).close()
+    log_file = tmp_path / 'stage.log'
+    # independent stages, which would otherwise run in parallel
+    stages = [Building_Stages.Stage(n, write_slowly, (db_file, log_file, n), outputs=[n])
+            for n in ['first', 'second', 'third']]
+    assert Building_Stages.BuildingStages(db_file, stages, jobs=3).run_steps() == []
+    lines = log_file.read_text().split('\n')[:-1]
+    assert [l.split()[0] for l in lines] == ['start', 'end'] * 3
+    assert [l.split()[1] for l in lines[::2]] == [l.split()[1] for l in lines[1::2]]
@@ -3,12 +3,16 @@
 import logging
 import math
 from typing import Optional
+import sqlite3
 import sys
 
+import shapely
 from haversine import haversine
 from shapely import wkt
 from shapely.geometry import LineString
 
+from Querying_Database import read_connection
+
 Coordinate = tuple[float, float]
 Location = tuple[str, str, str]
 
@@ -27,6 +31,38 @@ def parse_wkt_linestring(wkt_string: str) -> LineString:
         logging.warning(f"wkt string {wkt_string} is not valid: {ex}")
         return None
 
+def wkt_to_wkb(wkt_string: str) -> Optional[bytes]:
+    """Encode a wkt string as wkb, for the binary geometry columns."""
+    geometry = shapely.from_wkt(wkt_string, on_invalid='ignore')
+    return shapely.to_wkb(geometry) if geometry is not None else None
+
+def decode_geometries(values: list) -> list:
+    """Decode a column of wkb blobs, or wkt strings, in one vectorised call.
+
+        Values that cannot be decoded become None."""
+    if any(isinstance(v, bytes) for v in values):
+        return list(shapely.from_wkb(values, on_invalid='ignore'))
+    return list(shapely.from_wkt(values, on_invalid='ignore'))
+
+def has_column(cursor: sqlite3.Cursor, table: str, column: str) -> bool:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return column in [row[1] for row in cursor.fetchall()]
+
+def get_all_paths(db_file: str, table: str) -> list[tuple]:
+    """Read a table in the standard path format.
+
+        Returns (from_city, from_state, from_country, to_city, to_state, to_country, distance_km, path) rows,
+        where path is the decoded geometry, read from the path_wkb column when the table has one."""
+    cursor = read_connection(db_file).cursor()
+    path_column = 'path_wkb' if has_column(cursor, table, 'path_wkb') else 'path_wkt'
+    cursor.execute(f"""
+    SELECT from_city, from_state, from_country, to_city, to_state, to_country, distance_km, {path_column}
+    FROM {table}
+    """)
+    rows = cursor.fetchall()
+    paths = decode_geometries([row[7] for row in rows])
+    return [row[:7] + (path,) for row, path in zip(rows, paths)]
+
 def are_coordinates_close(coordinate1: Coordinate, coordinate2: Coordinate,
                           max_distance_km: Optional[float] = None) -> bool:
     """Check whether two coordinates are close to each other.
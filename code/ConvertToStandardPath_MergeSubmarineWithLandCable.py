@@ -5,14 +5,15 @@ import sqlite3
 from haversine import haversine
 from shapely.geometry import LineString
 
-from Common import are_coordinates_close, init_logging, parse_wkt_linestring
+from Querying_Database import read_connection
+from Common import are_coordinates_close, get_all_paths, init_logging, wkt_to_wkb
 from ConvertToStandardPath_SubmarineCable import coord_list_to_linestring
 
 
 def get_landing_point_coord_from_database(db_file):
     logging.info("\tGetting landing point coordinates from database...")
     landing_point_coord = []
-    conn = sqlite3.connect(db_file)
+    conn = read_connection(db_file)
     cursor = conn.cursor()
     cursor.execute(
         """SELECT lp.latitude, lp.longitude, clp.city_name, clp.state_province, clp.country
@@ -23,17 +24,12 @@ def get_landing_point_coord_from_database(db_file):
     for data in datas:
         landing_point_coord.append(data)
 
-    conn.close()
     return set(landing_point_coord)
 
 
 def get_standard_path_city_coord_from_database(db_file):
     logging.info("\tGetting standard path city coordinates from database...")
-    with sqlite3.connect(db_file) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''SELECT from_city, from_state, from_country, to_city, to_state, to_country, path_wkt
-                        FROM standard_paths;''')
-        all_rows = cursor.fetchall()
+    all_rows = get_all_paths(db_file, 'standard_paths')
 
     def _add_to_mapping(mapping, city, state, country, lat, lon):
         key = (city, state, country)
@@ -47,8 +43,9 @@ def get_standard_path_city_coord_from_database(db_file):
                                 f'distance: {haversine(orig_value, value)}km')
 
     city_to_coordinate_mapping = {}
-    for from_city, from_state, from_country, to_city, to_state, to_country, path_wkt in all_rows:
-        ls: LineString = parse_wkt_linestring(path_wkt)
+    for from_city, from_state, from_country, to_city, to_state, to_country, _, ls in all_rows:
+        if ls is None:
+            continue
         # wkt path is (lon, lat)
         from_lon, from_lat = ls.coords[0]
         to_lon, to_lat = ls.coords[-1]
@@ -81,7 +78,8 @@ def insert_submarine_city_mapping_to_standard_path_city_database(db_file, city_m
         to_state TEXT, \
         to_country TEXT, \
         distance_km REAL, \
-        path_wkt TEXT \
+        path_wkt TEXT, \
+        path_wkb BLOB \
     );")
 
     for landing_point, standard_path_city_nodes in city_mapping.items():
@@ -90,8 +88,8 @@ def insert_submarine_city_mapping_to_standard_path_city_database(db_file, city_m
             to_city, to_state, to_country, to_coord, distance = standard_path_city_node
             path_wkt = coord_list_to_linestring([from_coord, to_coord])
             # Execute insert query
-            cursor.execute("INSERT INTO submarine_to_standard_paths (from_city, from_state, from_country, to_city, to_state, to_country, distance_km, path_wkt) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                       (from_city, from_state, from_country, to_city, to_state, to_country, distance, path_wkt))
+            cursor.execute("INSERT INTO submarine_to_standard_paths (from_city, from_state, from_country, to_city, to_state, to_country, distance_km, path_wkt, path_wkb) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (from_city, from_state, from_country, to_city, to_state, to_country, distance, path_wkt, wkt_to_wkb(path_wkt)))
 
     conn.commit()
     conn.close()
@@ -99,17 +97,7 @@ def insert_submarine_city_mapping_to_standard_path_city_database(db_file, city_m
 
 def get_all_submarine_to_standard_paths_pairs(db_file):
     logging.info('Loading submarine to standard paths pairs from database ...')
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-    sql_query = """
-    SELECT stsp.from_city, stsp.from_state, stsp.from_country, stsp.to_city, stsp.to_state, stsp.to_country, stsp.distance_km, stsp.path_wkt
-    FROM submarine_to_standard_paths stsp
-    """
-    cursor.execute(sql_query)
-    datas = cursor.fetchall()
-    conn.close()
-
-    return datas
+    return get_all_paths(db_file, 'submarine_to_standard_paths')
 
 def map_landing_point_to_standard_path_cities(landing_point_coords, standard_path_coords) -> dict[tuple, list[tuple]]:
     logging.info("\tMapping landing point cities to nearby standard path cities...")
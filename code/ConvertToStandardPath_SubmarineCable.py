@@ -9,7 +9,8 @@ from networkx.exception import NetworkXNoPath
 from geopy.distance import geodesic
 import ast
 
-from Common import init_logging
+from Querying_Database import read_connection
+from Common import decode_geometries, get_all_paths, has_column, init_logging, wkt_to_wkb
 
 
 def floatFormatter(number):
@@ -89,6 +90,15 @@ def convert_multilinestring_to_list(multilinestring):
 
     return list_of_linestring_lists
 
+def convert_geometry_to_list(geometry):
+    """
+    The same as convert_multilinestring_to_list, for a decoded (multi)linestring geometry.
+    """
+    if geometry is None:
+        return []
+    lines = geometry.geoms if hasattr(geometry, 'geoms') else [geometry]
+    return [[(floatFormatter(x), floatFormatter(y)) for x, y in line.coords] for line in lines]
+
 # Helper function to add edge
 
 
@@ -204,10 +214,11 @@ def get_data_from_database(db_file):
     """
     logging.info("\tGetting submarine cable data from database...")
     global whole_data
-    conn = sqlite3.connect(db_file)
+    conn = read_connection(db_file)
     cursor = conn.cursor()
-    sql_query = """
-    SELECT sc.cable_id, sc.cable_wkt, clp.city_name, clp.state_province, clp.country, lp.latitude, lp.longitude
+    cable_column = 'cable_wkb' if has_column(cursor, 'submarine_cables', 'cable_wkb') else 'cable_wkt'
+    sql_query = f"""
+    SELECT sc.cable_id, sc.{cable_column}, clp.city_name, clp.state_province, clp.country, lp.latitude, lp.longitude
     FROM submarine_cables sc, cable_landing_points clp, landing_points lp
     WHERE sc.cable_id = clp.cable_id 
     AND clp.city_name = lp.city_name 
@@ -217,10 +228,13 @@ def get_data_from_database(db_file):
     datas = cursor.fetchall()
     cable_id_to_cities = {}
     cable_id_to_wkt = {}
-    for cable_id, cable_wkt, _, _, _, _, _ in datas:
+    # each cable geometry is repeated for every landing point, so decode it only once
+    cable_geometries = list(set((cable_id, cable_geometry) for cable_id, cable_geometry, _, _, _, _, _ in datas))
+    decoded = decode_geometries([cable_geometry for _, cable_geometry in cable_geometries])
+    for (cable_id, _), geometry in zip(cable_geometries, decoded):
         if cable_id not in cable_id_to_wkt:
             cable_id_to_wkt[cable_id] = set()
-        for path in convert_multilinestring_to_list(cable_wkt):
+        for path in convert_geometry_to_list(geometry):
             cable_id_to_wkt[cable_id].add(str(path))
 
     for cable_id, _, city_name, city_state, city_country, city_latitude, city_longitude in datas:
@@ -228,7 +242,6 @@ def get_data_from_database(db_file):
             cable_id_to_cities[cable_id] = set()
         cable_id_to_cities[cable_id].add(
             (city_name, city_state, city_country, city_latitude, city_longitude))
-    conn.close()
 
     for cable_id, cable_wkt, _, _, _, _, _ in datas:
         cable_id_to_wkt[cable_id] = [ast.literal_eval(
@@ -337,12 +350,15 @@ def insert_submarine_standard_paths_to_database(db_file, submarine_standard_path
         to_state TEXT, \
         to_country TEXT, \
         distance_km REAL, \
-        path_wkt TEXT \
+        path_wkt TEXT, \
+        path_wkb BLOB \
     );")
 
     for submarine_standard_path in submarine_standard_paths:
+        path_wkb = wkt_to_wkb(submarine_standard_path[7])
         # Execute insert query
-        cursor.execute("INSERT INTO submarine_standard_paths (from_city, from_state, from_country, to_city, to_state, to_country, distance_km, path_wkt) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", submarine_standard_path)
+        cursor.execute("INSERT INTO submarine_standard_paths (from_city, from_state, from_country, to_city, to_state, to_country, distance_km, path_wkt, path_wkb) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       submarine_standard_path + (path_wkb,))
 
     conn.commit()
     conn.close()
@@ -350,16 +366,7 @@ def insert_submarine_standard_paths_to_database(db_file, submarine_standard_path
 
 def get_all_submarine_standard_paths(db_file: str) -> list[tuple]:
     logging.info('Loading submarine standard paths from database ...')
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-    sql_query = """
-    SELECT ssp.from_city, ssp.from_state, ssp.from_country, ssp.to_city, ssp.to_state, ssp.to_country, ssp.distance_km, ssp.path_wkt
-    FROM submarine_standard_paths ssp
-    """
-    cursor.execute(sql_query)
-    datas = cursor.fetchall()
-    conn.close()
-    return datas
+    return get_all_paths(db_file, 'submarine_standard_paths')
 
 
 def add_submarine_cable_like_standard_path(db_file: str):
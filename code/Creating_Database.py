@@ -2,35 +2,167 @@ import dbStructure as db
 import sqlite3
 from sqlite3 import Error
 from pathlib import Path
+import concurrent.futures
+import multiprocessing
+import queue
+import hashlib
+import json
 import os
 import csv
+import re
+import time
+import pyarrow.parquet as pq
+import shapely
+
+# number of rows handed from a parser process to the writer at a time
+BATCH_SIZE = 10000
+# number of parsed batches buffered per input file before its parser blocks
+MAX_QUEUED_BATCHES = 8
+# how often the writer reports its progress within a large file
+PROGRESS_ROWS = 100000
+# seconds the writer waits for a batch before it checks that the parser is alive
+QUEUE_POLL_SECONDS = 1
+
+# set in each parser process by _init_parser
+_batch_queues = None
+
+def _init_parser(queues):
+    global _batch_queues
+    _batch_queues = queues
+
+def convert_value(value, column_type):
+    """Converts a csv string into the typed value bound to the INSERT.
+    Empty numeric fields, and the 'NULL' placeholder written by older
+    processors, become real NULLs. Text is bound as it is, so single
+    quotes are not escaped."""
+    if value == 'NULL':
+        return None
+    if column_type in ('integer', 'real'):
+        if value == '':
+            return None
+        try:
+            return int(value) if column_type == 'integer' else float(value)
+        except ValueError:
+            try:
+                return float(value)
+            except ValueError:
+                return value
+    return value
+
+def convert_row(row, column_types):
+    return [convert_value(v, t) for v, t in zip(row, column_types)]
+
+def wkt_bounds(wkt):
+    """Returns (min_lon, max_lon, min_lat, max_lat) of a wkt geometry,
+    or None if it has no coordinates. Only the numbers are read,
+    which is all a bounding box needs."""
+    if not wkt:
+        return None
+    numbers = [float(n) for n in re.findall(r"-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?", wkt)]
+    lons = numbers[0::2]
+    lats = numbers[1::2]
+    if not lats:
+        return None
+    return min(lons), max(lons), min(lats), max(lats)
+
+def read_csv_batches(f_name, table_columns):
+    """Parses a processed csv file and yields its header,
+    followed by lists of at most BATCH_SIZE converted rows.
+    "table_columns" maps the lower case column names of the
+    table to their declared types."""
+    with open(f_name, 'r') as f:
+        csv_reader = csv.reader(f, delimiter=',')
+        # the header values must correspond to attribute fields in the DB
+        header = next(csv_reader)
+        yield header
+        column_types = [table_columns.get(h.lower(), 'text') for h in header]
+        batch = []
+        for row in csv_reader:
+            if len(row) != len(header):
+                print(f"\tSkipping malformed row in {f_name}: {row}")
+                continue
+            batch.append(convert_row(row, column_types))
+            if len(batch) >= BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def read_parquet_batches(f_name, table_columns):
+    """Reads a processed parquet file a record batch at a time and yields
+    its column names, followed by lists of at most BATCH_SIZE rows.
+    The columns are already typed, and their text is not escaped,
+    so the values are bound as they are."""
+    parquet_file = pq.ParquetFile(f_name)
+    yield parquet_file.schema_arrow.names
+    for record_batch in parquet_file.iter_batches(batch_size=BATCH_SIZE):
+        yield list(zip(*(column.to_pylist() for column in record_batch.columns)))
+
+def read_batches(f_name, table_columns):
+    """Yields the header and row batches of a processed csv or parquet file."""
+    if Path(f_name).suffix == '.parquet':
+        return read_parquet_batches(f_name, table_columns)
+    return read_csv_batches(f_name, table_columns)
+
+def _parse_file(index, f_name, table_columns):
+    """Runs in a parser process and feeds the batches of one file
+    through its bounded queue. None marks the end of the file."""
+    queue = _batch_queues[index]
+    try:
+        for batch in read_batches(f_name, table_columns):
+            queue.put(batch)
+    except Exception as e:
+        queue.put(e)
+    finally:
+        queue.put(None)
 
 class CreatingDatabase:
     """This class is called by iGDB.py to create a new database
     using the format described in dbStructure.py and
-    load data into each table from processed files."""
-    def __init__(self, in_path, out_path, f_name):
+    load data into each table from processed files.
+    The csv or parquet files are parsed by a pool of processes while
+    this process is the single writer to the SQLite file.
+
+    With "incremental" set, an existing database is kept and only the
+    rows that came from processed files whose hash changed since the last
+    load are replaced. The names of the tables whose rows changed are
+    available in "changed_tables" afterwards, and those of the tables
+    that were emptied and loaded again in full in "reloaded_tables"."""
+    def __init__(self, in_path, out_path, f_name, jobs=None, incremental=False):
         if not os.path.isdir(out_path):
             os.makedirs(out_path)
-        db_file = out_path / f_name
-        if os.path.isfile(db_file):
-            os.remove(db_file)
-        print(f"Creating DB here: {db_file}")
+        self.db_file = out_path / f_name
+        if os.path.isfile(self.db_file) and not incremental:
+            os.remove(self.db_file)
+        if os.path.isfile(self.db_file):
+            print(f"Updating DB here: {self.db_file}")
+        else:
+            print(f"Creating DB here: {self.db_file}")
         self.input_path = in_path
-        db_conn = self.create_connection(db_file)
+        self.jobs = jobs if jobs else os.cpu_count()
+        self.changed_tables = set()
+        self.reloaded_tables = set()
+        # (hash, stat) of the files that plan_table_update scheduled for loading
+        self.pending_hashes = {}
+        db_conn = self.create_connection(self.db_file)
+        print(f"SQLite version: {sqlite3.version}")
         # create the tables and add the data
+        self.create_table(db_conn, db.sql_create_load_manifest_table)
+        self.add_missing_columns(db_conn, 'load_manifest', db.sql_create_load_manifest_table)
         for t in db.tables.keys():
-            #print(f"Creating {t}")
             self.create_table(db_conn, db.tables[t])
-            #input("Done with creation. ENTER to continue.")
-            self.load_table(db_conn, t)
+            self.add_missing_columns(db_conn, t)
+        inputs = []
+        for t in db.tables.keys():
+            inputs += self.plan_table_update(db_conn, t)
+        self.load_tables(db_conn, inputs)
+        db_conn.close()
 
     def create_connection(self, db_file):
         """ create a database connection to a SQLite database """
         conn = None
         try:
             conn = sqlite3.connect(db_file)
-            print(f"SQLite version: {sqlite3.version}")
             #conn = spatialite.connect(db_file)
             #print(f"SpatiaLite version: {spatialite.version}")
         except Error as e:
@@ -49,41 +181,392 @@ class CreatingDatabase:
         except Error as e:
             print(e)
 
-    def load_table(self, conn, table_type):
-        """This is a more general version of the loading function.
-        It assumes that the columns of the input csv file are the same as the
-        attributes in the table we are inserting into.
-        "table_type" should be the name of a table in the DB."""
-        cur = conn.cursor()
+    def add_missing_columns(self, conn, table_type, create_sql=None):
+        """Adds the columns of dbStructure that a table of an existing
+        database was created without, e.g. approximate_location."""
+        columns = self.table_columns(conn, table_type)
+        for row in (create_sql or db.tables[table_type]).split('\n')[1:-1]:
+            name, column_type = row.split()[:2]
+            if name.lower() not in columns:
+                print(f"Adding column {name} to {table_type}.")
+                conn.execute(f"ALTER TABLE {table_type} ADD COLUMN {name} {column_type.rstrip(',')}")
+        conn.commit()
+
+    def find_input_files(self, table_type):
+        """Lists the processed files for a table, in a stable order.
+        Hidden files, e.g. a table that a processor is still merging, are left out."""
         local_path = self.input_path / table_type
         if not os.path.isdir(local_path):
             print(f"No existing data of type {table_type}.")
-            return
-
-        for f in os.listdir(local_path):
-            print(f"Loading data from: {f}")
-            sql_base = f"INSERT INTO {table_type}("
-            with open(local_path / f, 'r') as f:
-                csv_reader = csv.reader(f, delimiter=',')
-                # read in the header and add all the header values to the SQL query
-                # the header values must correspond to attribute fields in the DB
-                header = next(csv_reader)
-                for v in header:
-                    sql_base += f"{v},"
-                sql_base = sql_base[:-1]
-                sql_base += ") VALUES("
-
-                for row in csv_reader:
-                    sql = sql_base
-                    for r in row:
-                        sql += f"'{r}',"
-                    sql = sql[:-1]
-                    sql += ")"
-                    try:
-                        cur.execute(sql)
-                    except Error as e:
-                        print(f"{e}: {row}")
+            return []
+        return [local_path / f for f in sorted(os.listdir(local_path)) if not f.startswith('.')]
+
+    def hash_file(self, f_name):
+        sha = hashlib.sha256()
+        with open(f_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def file_stat(self, f_name):
+        st = os.stat(f_name)
+        return (st.st_size, st.st_mtime_ns)
+
+    def file_hash(self, f_name, entry):
+        """Returns (sha256, stat) of a file, reusing the sha256 of its
+        manifest entry when its size and modification time are unchanged."""
+        stat = self.file_stat(f_name)
+        if entry is not None and entry[0] is not None and entry[2] == stat:
+            return entry[0], stat
+        return self.hash_file(f_name), stat
+
+    def manifest_name(self, f_name):
+        return Path(os.path.relpath(f_name, self.input_path)).as_posix()
+
+    def read_manifest(self, conn, table_type):
+        """Returns {file_name: (sha256, sources, (size, mtime))} for the files loaded into a table."""
+        cur = conn.cursor()
+        cur.execute("""SELECT file_name, sha256, sources, file_size, file_mtime
+                FROM load_manifest WHERE table_name = ?""", (table_type,))
+        return {r[0]: (r[1], set(json.loads(r[2])), (r[3], r[4])) for r in cur.fetchall()}
+
+    def table_columns(self, conn, table_type):
+        """Returns {column name: declared type} of a table, both in lower case."""
+        cur = conn.cursor()
+        cur.execute(f"PRAGMA table_info({table_type})")
+        return {r[1].lower(): r[2].lower() for r in cur.fetchall()}
+
+    def plan_table_update(self, conn, table_type):
+        """Compares the processed files of a table with the manifest and
+        deletes the rows that are about to be replaced.
+        Returns the (table, file) pairs that have to be loaded.
+        Rows are replaced per source when the table has a source column
+        and the changed files do not share a source with unchanged files;
+        otherwise the whole table is reloaded."""
+        manifest = self.read_manifest(conn, table_type)
+        files = self.find_input_files(table_type)
+        hashes = {self.manifest_name(f): self.file_hash(f, manifest.get(self.manifest_name(f)))
+                for f in files}
+        changed = [f for f in files if
+                manifest.get(self.manifest_name(f), (None,))[0] != hashes[self.manifest_name(f)][0]]
+        removed = [n for n in manifest.keys() if n not in hashes]
+        # an unchanged file that was touched, or recorded without its stat,
+        # gets its current stat so that it is not hashed again next time
+        restat = [stat + (n,) for n, (sha, stat) in hashes.items()
+                if n in manifest and manifest[n][0] == sha and manifest[n][2] != stat]
+        if restat:
+            conn.executemany("UPDATE load_manifest SET file_size = ?, file_mtime = ? WHERE file_name = ?",
+                    restat)
+            conn.commit()
+        if not changed and not removed:
+            print(f"{table_type} is up to date.")
+            return []
+
+        self.changed_tables.add(table_type)
+        if not manifest:
+            # nothing of this table was loaded through the manifest before,
+            # so any existing rows are of unknown origin
+            conn.execute(f"DELETE FROM {table_type}")
+            conn.commit()
+            self.reloaded_tables.add(table_type)
+            for f in changed:
+                self.pending_hashes[f] = hashes[self.manifest_name(f)]
+            return [(table_type, f) for f in changed]
+
+        cur = conn.cursor()
+        changed_names = [self.manifest_name(f) for f in changed] + removed
+        old_sources = set()
+        kept_sources = set()
+        for n, (sha, sources, stat) in manifest.items():
+            if n in changed_names:
+                old_sources |= sources
+            else:
+                kept_sources |= sources
+        if 'source' in self.table_columns(conn, table_type) and not (old_sources & kept_sources):
+            print(f"Replacing {table_type} rows from {len(changed_names)} changed files.")
+            for source in sorted(old_sources):
+                cur.execute(f"DELETE FROM {table_type} WHERE source = ?", (source,))
+        else:
+            print(f"Reloading all of {table_type}.")
+            cur.execute(f"DELETE FROM {table_type}")
+            self.reloaded_tables.add(table_type)
+            changed = files
+            changed_names = list(manifest.keys())
+        for n in changed_names:
+            cur.execute("DELETE FROM load_manifest WHERE file_name = ?", (n,))
+        conn.commit()
+        for f in changed:
+            self.pending_hashes[f] = hashes[self.manifest_name(f)]
+        return [(table_type, f) for f in changed]
+
+    def record_load(self, conn, table_type, f_name, sources, complete):
+        """Adds a loaded file to the manifest. A file that failed part way
+        is recorded without a hash, so that its rows are replaced next time."""
+        sha, stat = self.pending_hashes.pop(f_name, None) or self.file_hash(f_name, None)
+        if not complete:
+            sha = None
+        conn.execute("""INSERT OR REPLACE INTO load_manifest(file_name, table_name, sha256, sources,
+                file_size, file_mtime) VALUES(?, ?, ?, ?, ?, ?)""",
+                (self.manifest_name(f_name), table_type, sha, json.dumps(sorted(sources))) + stat)
+        conn.commit()
+
+    def reload_tables(self, table_types):
+        """Drops the rows of the given tables and loads them again
+        from all of their processed files, unless this run already did.
+        Raises an error if a file could not be loaded completely."""
+        db_conn = self.create_connection(self.db_file)
+        inputs = []
+        for t in table_types:
+            if t in self.reloaded_tables:
+                print(f"{t} was already reloaded by this run.")
+                continue
+            db_conn.execute(f"DELETE FROM {t}")
+            db_conn.execute("DELETE FROM load_manifest WHERE table_name = ?", (t,))
+            db_conn.commit()
+            inputs += [(t, f) for f in self.find_input_files(t)]
+            self.changed_tables.add(t)
+            self.reloaded_tables.add(t)
+        failed = self.load_tables(db_conn, inputs)
+        db_conn.close()
+        if failed:
+            raise RuntimeError(f"Could not load {', '.join(str(f) for f in failed)}.")
+
+    def table_exists(self, table_type):
+        db_conn = self.create_connection(self.db_file)
+        cur = db_conn.cursor()
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_type,))
+        exists = cur.fetchone() is not None
+        db_conn.close()
+        return exists
+
+    def build_spatial_indexes(self, table_types=None):
+        """(Re)builds the R*Tree index of each spatial table in "table_types",
+        or of all of them. Indexes refer to rowids, so they have to be
+        rebuilt whenever rows of their table are replaced."""
+        if table_types is None:
+            table_types = db.spatial_indexes.keys()
+        db_conn = self.create_connection(self.db_file)
+        cur = db_conn.cursor()
+        for t in table_types:
+            if t not in db.spatial_indexes:
+                continue
+            print(f"Building the spatial index of {t}.")
+            cur.execute(f"DROP TABLE IF EXISTS {t}_rtree")
+            cur.execute(db.sql_create_rtree_table.format(t))
+            columns = db.spatial_indexes[t]
+            if len(columns) == 2:
+                lon, lat = columns
+                cur.execute(f"""INSERT INTO {t}_rtree
+                        SELECT rowid, {lon}, {lon}, {lat}, {lat} FROM {t}
+                        WHERE {lon} IS NOT NULL AND {lat} IS NOT NULL""")
+            else:
+                cur.execute(f"SELECT rowid, {columns[0]} FROM {t}")
+                boxes = []
+                for rowid, wkt in cur.fetchall():
+                    bounds = wkt_bounds(wkt)
+                    if bounds:
+                        boxes.append((rowid,) + bounds)
+                cur.executemany(f"INSERT INTO {t}_rtree VALUES(?, ?, ?, ?, ?)", boxes)
+            db_conn.commit()
+        db_conn.close()
+
+    def build_lookup_indexes(self):
+        """Creates the indexes of dbStructure.lookup_indexes that do not exist yet.
+        Unlike the spatial and text indexes, SQLite keeps them up to date."""
+        db_conn = self.create_connection(self.db_file)
+        for t, columns in db.lookup_indexes.items():
+            for c in columns:
+                db_conn.execute(f"CREATE INDEX IF NOT EXISTS {t}_{c} ON {t}({c})")
+        db_conn.commit()
+        db_conn.close()
+
+    def build_text_indexes(self, table_types=None):
+        """(Re)builds the FTS5 index of each table of dbStructure.text_indexes
+        in "table_types", or of all of them. Like the spatial indexes, they
+        refer to rowids and are rebuilt whenever rows of their table change.
+        A table is skipped if this SQLite lacks FTS5 or its trigram tokenizer,
+        and its names are then searched without the index."""
+        if table_types is None:
+            table_types = db.text_indexes.keys()
+        db_conn = self.create_connection(self.db_file)
+        cur = db_conn.cursor()
+        for t in table_types:
+            if t not in db.text_indexes:
+                continue
+            print(f"Building the text index of {t}.")
+            cur.execute(f"DROP TABLE IF EXISTS {t}_fts")
+            try:
+                cur.execute(db.sql_create_fts_table.format(t, db.text_indexes[t]))
+            except sqlite3.OperationalError as e:
+                print(f"Skipping the text index of {t}: {e}")
+                db_conn.commit()
+                continue
+            cur.execute(f"INSERT INTO {t}_fts({t}_fts) VALUES('rebuild')")
+            db_conn.commit()
+        db_conn.close()
+
+    def resolve_city_ids(self, table_types=None):
+        """Adds the city id columns of dbStructure.city_references to the
+        tables in "table_types", or to all of them, and sets them for the
+        rows that do not have one yet. Cities missing from the cities
+        table are added first, and existing cities keep their id."""
+        if table_types is None:
+            table_types = db.city_references.keys()
+        db_conn = self.create_connection(self.db_file)
+        cur = db_conn.cursor()
+        cur.execute(db.sql_create_cities_table)
+        cur.execute(db.sql_create_cities_index)
+        for t in table_types:
+            if t not in db.city_references or not self.table_exists(t):
+                continue
+            print(f"Resolving the city ids of {t}.")
+            columns = self.table_columns(db_conn, t)
+            for id_column, (city, state, country) in db.city_references[t].items():
+                if id_column not in columns:
+                    cur.execute(f"ALTER TABLE {t} ADD COLUMN {id_column} integer")
+                # IS instead of = so that NULL states match each other
+                match = f"""c.city_name IS t.{city} AND c.state_province IS t.{state}
+                        AND c.country_code IS t.{country}"""
+                cur.execute(f"""INSERT INTO cities(city_name, state_province, country_code)
+                        SELECT DISTINCT t.{city}, t.{state}, t.{country} FROM {t} t
+                        WHERE t.{id_column} IS NULL AND t.{city} IS NOT NULL AND t.{city} != ''
+                        AND NOT EXISTS (SELECT 1 FROM cities c WHERE {match})""")
+                cur.execute(f"""UPDATE {t} AS t SET {id_column} =
+                        (SELECT c.city_id FROM cities c WHERE {match})
+                        WHERE t.{id_column} IS NULL""")
+                cur.execute(f"CREATE INDEX IF NOT EXISTS {t}_{id_column} ON {t}({id_column})")
+                db_conn.commit()
+        db_conn.close()
+
+    def add_geometry_blobs(self, table_types=None):
+        """Adds the wkb column of each table in dbStructure.geometry_columns
+        and fills it for the rows that do not have one yet."""
+        if table_types is None:
+            table_types = db.geometry_columns.keys()
+        db_conn = self.create_connection(self.db_file)
+        cur = db_conn.cursor()
+        for t in table_types:
+            wkt_column, wkb_column = db.geometry_columns[t]
+            if wkb_column not in self.table_columns(db_conn, t):
+                cur.execute(f"ALTER TABLE {t} ADD COLUMN {wkb_column} blob")
+            cur.execute(f"SELECT rowid, {wkt_column} FROM {t} WHERE {wkb_column} IS NULL")
+            rows = cur.fetchall()
+            if not rows:
+                continue
+            print(f"Adding {wkb_column} to {len(rows)} rows of {t}.")
+            geometries = shapely.from_wkt([r[1] for r in rows], on_invalid='ignore')
+            blobs = shapely.to_wkb(geometries)
+            cur.executemany(f"UPDATE {t} SET {wkb_column} = ? WHERE rowid = ?",
+                    [(b, r[0]) for b, r in zip(blobs, rows)])
+            db_conn.commit()
+        db_conn.close()
+
+    def load_tables(self, conn, inputs):
+        """Loads the processed files in "inputs", a list of (table, file) pairs.
+        Files are parsed in parallel, but their batches are written
+        in file order, so the resulting rows do not depend on timing.
+        Returns the files that could not be loaded completely."""
+        if not inputs:
+            return []
+
+        columns = {t: self.table_columns(conn, t) for t, f in inputs}
+        table_stats = {}
+        failed = []
+        if self.jobs == 1:
+            print(f"Loading {len(inputs)} files.")
+            for t, f in inputs:
+                self.finish_file(conn, table_stats, failed, t, f,
+                        self.load_file(conn, t, f, read_batches(f, columns[t])))
+        else:
+            print(f"Loading {len(inputs)} files with {self.jobs} parser processes.")
+            queues = [multiprocessing.Queue(MAX_QUEUED_BATCHES) for i in inputs]
+            with concurrent.futures.ProcessPoolExecutor(self.jobs, initializer=_init_parser,
+                    initargs=(queues,)) as executor:
+                # tasks are handed out in order, so the file the writer waits on
+                # is always being parsed and the pool cannot deadlock
+                parsers = [executor.submit(_parse_file, i, f, columns[t]) for i, (t, f) in enumerate(inputs)]
+                for i, (t, f) in enumerate(inputs):
+                    self.finish_file(conn, table_stats, failed, t, f,
+                            self.load_file(conn, t, f, self.iter_queue(queues[i], parsers[i])))
+
+        print("Rows loaded per table:")
+        for t, (num_rows, elapsed) in table_stats.items():
+            print(f"\t{t}: {num_rows} rows in {elapsed:.1f}s ({self.rate(num_rows, elapsed):.0f} rows/s)")
+        return failed
+
+    def finish_file(self, conn, table_stats, failed, table_type, f_name, file_stats):
+        file_rows, file_elapsed, sources, complete = file_stats
+        if not complete:
+            failed.append(f_name)
+        num_rows, elapsed = table_stats.get(table_type, (0, 0.0))
+        table_stats[table_type] = (num_rows + file_rows, elapsed + file_elapsed)
+        self.record_load(conn, table_type, f_name, sources, complete)
+
+    def rate(self, num_rows, elapsed):
+        return num_rows / elapsed if elapsed > 0 else num_rows
+
+    def iter_queue(self, batch_queue, parser):
+        """Yields the batches that the "parser" future puts in its queue.
+        A parser process that was killed, e.g. by the OOM killer, never sends
+        the end of its file, but breaks the pool, which fails its future."""
+        while True:
+            try:
+                batch = batch_queue.get(timeout=QUEUE_POLL_SECONDS)
+            except queue.Empty:
+                if parser.done() and parser.exception() is not None:
+                    raise parser.exception()
+                continue
+            if batch is None:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            yield batch
+
+    def load_file(self, conn, table_type, f_name, batches):
+        """This is a more general version of the loading function.
+        It assumes that the columns of the input file are the same as the
+        attributes in the table we are inserting into.
+        "table_type" should be the name of a table in the DB and
+        "batches" yields the file's header followed by lists of rows."""
+        print(f"Loading data from: {f_name.name}")
+        start = time.time()
+        num_rows = 0
+        sources = set()
+        complete = False
+        try:
+            header = next(batches)
+            lower_header = [h.lower() for h in header]
+            source_index = lower_header.index('source') if 'source' in lower_header else None
+            columns = ",".join(header)
+            placeholders = ",".join(["?"] * len(header))
+            sql = f"INSERT INTO {table_type}({columns}) VALUES({placeholders})"
+            cur = conn.cursor()
+            for batch in batches:
+                cur.execute("SAVEPOINT batch")
+                try:
+                    cur.executemany(sql, batch)
+                except Error:
+                    # redo the batch row by row to report the offending rows
+                    cur.execute("ROLLBACK TO batch")
+                    for row in batch:
+                        try:
+                            cur.execute(sql, row)
+                        except Error as e:
+                            print(f"{e}: {row}")
+                cur.execute("RELEASE batch")
+                if source_index is not None:
+                    sources.update(row[source_index] for row in batch
+                            if row[source_index] is not None)
+                num_rows += len(batch)
+                if num_rows % PROGRESS_ROWS < len(batch):
+                    print(f"\t{num_rows} rows ({self.rate(num_rows, time.time() - start):.0f} rows/s).")
+            complete = True
+        except Exception as e:
+            print(f"\tCould not load {f_name}: {e}")
         conn.commit()
+        elapsed = time.time() - start
+        print(f"\t{num_rows} rows into {table_type} in {elapsed:.1f}s ({self.rate(num_rows, elapsed):.0f} rows/s).")
+        return num_rows, elapsed, sources, complete
 
 if __name__ == "__main__":
     print("You should not run this script by itself. It should be called from iGDB.py")
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+
+import shapely
+
+import Common
+import Creating_Database
+
+
+def write_csv(f_name, lines):
+    os.makedirs(f_name.parent, exist_ok=True)
+    with open(f_name, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def create_db(tmp_path, incremental=True, jobs=1):
+    return Creating_Database.CreatingDatabase(tmp_path / 'processed', tmp_path / 'database', 'test.db',
+            jobs=jobs, incremental=incremental)
+
+
+def rows(db_file, query, params=()):
+    conn = sqlite3.connect(db_file)
+    result = conn.execute(query, params).fetchall()
+    conn.close()
+    return result
+
+
+def write_standard_paths(processed):
+    write_csv(processed / 'standard_paths' / 'standard_paths.csv',
+            ['from_city,from_state,from_country,to_city,to_state,to_country,distance_km,path_wkt,asof_date',
+             'Lisbon,,PT,Porto,,PT,274.5,"LINESTRING (-9.14 38.72, -8.61 41.15)",2024-01-01',
+             'Porto,,PT,Vigo,,ES,120.0,"LINESTRING (-8.61 41.15, -8.72 42.24)",2024-01-01',
+             'Nowhere,,XX,Elsewhere,,XX,0.0,,2024-01-01'])
+
+
+def test_geometry_blobs(tmp_path):
+    write_standard_paths(tmp_path / 'processed')
+    db_creator = create_db(tmp_path, incremental=False)
+    db_creator.add_geometry_blobs(['standard_paths'])
+    result = rows(db_creator.db_file, "SELECT path_wkt, path_wkb FROM standard_paths ORDER BY rowid")
+    for wkt, wkb in result[:2]:
+        assert shapely.from_wkb(wkb).equals_exact(shapely.from_wkt(wkt), 0)
+    # a row without a path gets no blob
+    assert result[2][1] is None
+
+    # the paths are read back from the blobs
+    paths = Common.get_all_paths(str(db_creator.db_file), 'standard_paths')
+    assert [p[7].wkt for p in paths[:2]] == [shapely.from_wkt(wkt).wkt for wkt, _ in result[:2]]
+    assert paths[0][6] == 274.5
+
+
+def write_asn_locs(processed, sources=('PDB', 'PCH', 'RIPEAtlas'), num_rows=25):
+    for s in sources:
+        write_csv(processed / 'asn_loc' / f'{s}_asn_loc.csv', ['asn,latitude,longitude,source'] +
+                [f'{64500 + i},{i}.5,{-i}.25,{s}' for i in range(num_rows)])
+
+
+def test_parallel_load(tmp_path, monkeypatch):
+    # small batches, so that each file is handed over in several of them
+    monkeypatch.setattr(Creating_Database, 'BATCH_SIZE', 4)
+    write_asn_locs(tmp_path / 'processed')
+    query = "SELECT rowid, asn, latitude, longitude, source FROM asn_loc"
+    loaded = []
+    for jobs in [1, 3]:
+        db_creator = Creating_Database.CreatingDatabase(tmp_path / 'processed', tmp_path / f'database{jobs}',
+                'test.db', jobs=jobs)
+        loaded.append(rows(db_creator.db_file, query))
+    # the rows are written in file order whatever the number of parsers
+    assert len(loaded[0]) == 75
+    assert loaded[0] == loaded[1]
+
+
+def kill_parser(f_name, table_columns):
+    if 'PCH' in f_name.name:
+        os.kill(os.getpid(), 9)
+    return Creating_Database.read_csv_batches(f_name, table_columns)
+
+
+def test_killed_parser(tmp_path, monkeypatch):
+    write_asn_locs(tmp_path / 'processed')
+    monkeypatch.setattr(Creating_Database, 'read_batches', kill_parser)
+    # the writer reports the files of the broken pool instead of waiting for them
+    db_creator = create_db(tmp_path, incremental=False, jobs=2)
+    manifest = dict(rows(db_creator.db_file, "SELECT file_name, sha256 FROM load_manifest"))
+    assert manifest['asn_loc/PCH_asn_loc.csv'] is None
+
+
+def count_hashes(monkeypatch):
+    hashed = []
+    hash_file = Creating_Database.CreatingDatabase.hash_file
+
+    def counting_hash_file(self, f_name):
+        hashed.append(f_name.name)
+        return hash_file(self, f_name)
+    monkeypatch.setattr(Creating_Database.CreatingDatabase, 'hash_file', counting_hash_file)
+    return hashed
+
+
+def test_incremental_load(tmp_path, monkeypatch):
+    processed = tmp_path / 'processed'
+    header = 'asn,latitude,longitude,source'
+    write_csv(processed / 'asn_loc' / 'PDB_asn_loc.csv', [header, '64500,1.0,2.0,PDB'])
+    write_csv(processed / 'asn_loc' / 'PCH_asn_loc.csv', [header, '64501,3.0,4.0,PCH'])
+    db_creator = create_db(tmp_path, incremental=False)
+    query = "SELECT asn, source FROM asn_loc ORDER BY asn"
+    assert rows(db_creator.db_file, query) == [(64500, 'PDB'), (64501, 'PCH')]
+
+    # unchanged files are neither hashed nor loaded again
+    hashed = count_hashes(monkeypatch)
+    db_creator = create_db(tmp_path)
+    assert hashed == []
+    assert db_creator.changed_tables == set()
+
+    # a touched file is hashed, and kept when its hash is the same
+    os.utime(processed / 'asn_loc' / 'PDB_asn_loc.csv', ns=(0, 0))
+    db_creator = create_db(tmp_path)
+    assert hashed == ['PDB_asn_loc.csv']
+    assert db_creator.changed_tables == set()
+
+    # only the rows of the source of a changed file are replaced
+    write_csv(processed / 'asn_loc' / 'PDB_asn_loc.csv', [header, '64502,5.0,6.0,PDB'])
+    db_creator = create_db(tmp_path)
+    assert db_creator.changed_tables == {'asn_loc'}
+    assert db_creator.reloaded_tables == set()
+    assert rows(db_creator.db_file, query) == [(64501, 'PCH'), (64502, 'PDB')]
+
+    # the rows of a removed file are removed
+    os.remove(processed / 'asn_loc' / 'PCH_asn_loc.csv')
+    db_creator = create_db(tmp_path)
+    assert rows(db_creator.db_file, query) == [(64502, 'PDB')]
+
+
+def test_reload_once(tmp_path):
+    processed = tmp_path / 'processed'
+    write_csv(processed / 'city_points' / 'city_points.csv',
+            ['city_name,state_province,country_code,city_latitude,city_longitude', 'Porto,,PT,41.15,-8.61'])
+    create_db(tmp_path, incremental=False)
+    write_csv(processed / 'city_points' / 'city_points.csv',
+            ['city_name,state_province,country_code,city_latitude,city_longitude', 'Vigo,,ES,42.24,-8.72'])
+    db_creator = create_db(tmp_path)
+    assert db_creator.reloaded_tables == {'city_points'}
+
+    # rows added after the load, e.g. by the cloud_regions stage, are kept
+    # by a reload of a table that this run already reloaded
+    conn = sqlite3.connect(db_creator.db_file)
+    conn.execute("INSERT INTO city_points (city_name) VALUES('aws:eu-south-2')")
+    conn.commit()
+    conn.close()
+    db_creator.reload_tables(['city_points'])
+    query = "SELECT city_name FROM city_points ORDER BY rowid"
+    assert rows(db_creator.db_file, query) == [('Vigo',), ('aws:eu-south-2',)]
+
+    # and dropped by the next run, which did not load the table
+    db_creator = create_db(tmp_path)
+    db_creator.reload_tables(['city_points'])
+    assert rows(db_creator.db_file, query) == [('Vigo',)]
+
+
+def test_typed_load(tmp_path):
+    processed = tmp_path / 'processed'
+    write_csv(processed / 'asn_loc' / 'PDB_asn_loc.csv',
+            ['asn,latitude,longitude,source', '64500,38.72,-9.14,PDB', '64501,,NULL,PDB'])
+    write_csv(processed / 'asn_org' / 'PDB_asn_org.csv',
+            ['asn,organization,source,asof_date', "64500,O'Brien Networks,PDB,2024-01-01",
+             "64501,O''Hara,PDB,2024-01-01", '64502,,PDB,2024-01-01', '64503,NULL,PDB,2024-01-01'])
+    db_creator = create_db(tmp_path, incremental=False)
+    query = "SELECT typeof(asn), latitude, typeof(latitude), longitude FROM asn_loc ORDER BY asn"
+    assert rows(db_creator.db_file, query) == [('integer', 38.72, 'real', -9.14),
+            ('integer', None, 'null', None)]
+    # text is stored as it was written, quotes included
+    query = "SELECT organization FROM asn_org ORDER BY asn"
+    assert rows(db_creator.db_file, query) == [("O'Brien Networks",), ("O''Hara",), ('',), (None,)]
+
+
+def test_city_ids(tmp_path):
+    processed = tmp_path / 'processed'
+    write_standard_paths(processed)
+    write_csv(processed / 'city_points' / 'city_points.csv',
+            ['city_name,state_province,country_code,city_latitude,city_longitude',
+             'Porto,,PT,41.15,-8.61', 'Vigo,,ES,42.24,-8.72', 'Portland,Oregon,US,45.52,-122.68'])
+    db_creator = create_db(tmp_path, incremental=False)
+    db_creator.resolve_city_ids(['city_points', 'standard_paths'])
+    city_ids = dict(rows(db_creator.db_file, "SELECT city_name, city_id FROM city_points"))
+    assert len(set(city_ids.values())) == 3
+    paths = rows(db_creator.db_file, "SELECT from_city, from_city_id, to_city, to_city_id FROM standard_paths")
+    assert paths[1] == ('Porto', city_ids['Porto'], 'Vigo', city_ids['Vigo'])
+    # cities that are only in the paths are added to the cities table
+    lisbon = rows(db_creator.db_file, "SELECT city_id FROM cities WHERE city_name = 'Lisbon'")
+    assert paths[0][1] == lisbon[0][0]
+
+    # new rows are resolved, and the ids given before are kept
+    conn = sqlite3.connect(db_creator.db_file)
+    conn.execute("""INSERT INTO city_points (city_name, state_province, country_code)
+            VALUES('Porto', '', 'PT'), ('Braga', '', 'PT')""")
+    conn.commit()
+    conn.close()
+    db_creator.resolve_city_ids(['city_points'])
+    resolved = rows(db_creator.db_file, "SELECT city_name, city_id FROM city_points ORDER BY rowid")
+    assert resolved[:4] == list(city_ids.items()) + [('Porto', city_ids['Porto'])]
+    assert resolved[4][1] not in city_ids.values()
+    assert rows(db_creator.db_file, "SELECT COUNT(*) FROM cities") == [(7,)]
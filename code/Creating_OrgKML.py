@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+import shapely
 import Querying_Database as qdb
 
 class CreatingOrgKML:
@@ -28,49 +29,33 @@ class CreatingOrgKML:
 
     def execute_queries(self):
         # first find all the nodes belonging to the organization
-        n_query = f"""SELECT DISTINCT n.node_name, n.latitude, n.longitude
-        FROM phys_nodes n
-        WHERE n.organization LIKE "%{self.org}%"
-        ORDER BY n.node_name
-        ;"""
-
-        self.nodes_list = self.querier.execute_query(n_query)
+        n_condition, n_params = self.querier.text_search_condition('phys_nodes', self.org, alias='n')
+        self.nodes_list = self.querier.execute_named('organization_nodes', n_params,
+                n_condition=n_condition)
 
         # next find all the edges between the nodes
-        e_query = f"""SELECT DISTINCT c.from_node, c.to_node, p.path_wkt
-        FROM phys_nodes fn, phys_nodes tn, phys_nodes_conn c, standard_paths p
-        WHERE fn.organization LIKE "%{self.org}%"
-        AND tn.organization LIKE "%{self.org}%"
-        AND c.from_node == fn.node_name
-        AND c.to_node == tn.node_name
-
-        AND ((p.from_city == fn.city
-            AND p.from_country == fn.country
-            AND p.to_city == tn.city
-            AND p.to_country == tn.country) OR
-
-            (p.to_city == fn.city
-                AND p.to_country == fn.country
-                AND p.from_city == tn.city
-                AND p.from_country == tn.country)
-
-            )
-
-        ORDER BY fn.city
-        ;"""
-
-        edges = self.querier.execute_query(e_query)
+        path_column = 'path_wkb' if self.querier.has_column('standard_paths', 'path_wkb') else 'path_wkt'
+        fn_condition, fn_params = self.querier.text_search_condition('phys_nodes', self.org, alias='fn')
+        tn_condition, tn_params = self.querier.text_search_condition('phys_nodes', self.org, alias='tn')
+        edges = self.querier.execute_named('organization_edges', fn_params + tn_params,
+                path_column=path_column, fn_condition=fn_condition, tn_condition=tn_condition)
         # sometimes there are duplicate edges, so we remove them
         for e in edges:
             fn = e[0]
             tn = e[1]
-            wkt = e[2]
-            wkt = wkt.replace("LINESTRING(", "")
-            wkt = wkt.replace(")", "")
-            unf = wkt.split(', ')
-            coords = []
-            for c in unf:
-                coords.append(c.replace(' ', ','))
+            if isinstance(e[2], bytes):
+                path = shapely.from_wkb(e[2], on_invalid='ignore')
+                if path is None:
+                    continue
+                coords = [f"{x},{y}" for x, y in path.coords]
+            else:
+                wkt = e[2]
+                wkt = wkt.replace("LINESTRING(", "")
+                wkt = wkt.replace(")", "")
+                unf = wkt.split(', ')
+                coords = []
+                for c in unf:
+                    coords.append(c.replace(' ', ','))
             if not (fn, tn, coords) in self.edges_list and not (tn, fn, coords) in self.edges_list:
                 self.edges_list.append([fn, tn, coords])
 
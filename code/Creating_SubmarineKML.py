@@ -1,6 +1,7 @@
 from xml.dom.minidom import Document
-import sqlite3
+from Querying_Database import read_connection
 import argparse
+import shapely
 
 
 def convert_multilinestring_to_list(multilinestring):
@@ -104,29 +105,53 @@ def create_file(whole_data):
     return doc
 
 
+def convert_wkb_to_list(wkb):
+    # The same list of lists of (x, y) tuples, decoded from a wkb (multi)linestring
+    geometry = shapely.from_wkb(wkb, on_invalid='ignore')
+    if geometry is None:
+        return []
+    lines = geometry.geoms if hasattr(geometry, 'geoms') else [geometry]
+    return [list(line.coords) for line in lines]
+
+
+def has_wkb_column(cursor, table, column):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return column in [row[1] for row in cursor.fetchall()]
+
+
 def get_data_from_database(db_file, whole_data, cable_id):
-    conn = sqlite3.connect(db_file)
+    conn = read_connection(db_file)
     cursor = conn.cursor()
-    cursor.execute(
-        'SELECT sc.cable_wkt FROM submarine_cables sc WHERE sc.cable_id = ?;', (cable_id,))
+    if has_wkb_column(cursor, 'submarine_cables', 'cable_wkb'):
+        cursor.execute(
+            'SELECT sc.cable_wkb FROM submarine_cables sc WHERE sc.cable_id = ?;', (cable_id,))
+        convert = convert_wkb_to_list
+    else:
+        cursor.execute(
+            'SELECT sc.cable_wkt FROM submarine_cables sc WHERE sc.cable_id = ?;', (cable_id,))
+        convert = convert_multilinestring_to_list
     datas = cursor.fetchall()
     for data in datas:
-        whole_data = whole_data + convert_multilinestring_to_list(data[0])
+        whole_data = whole_data + convert(data[0])
 
-    conn.close()
     return whole_data
 
 
 def get_land_data_from_database(db_file, whole_data, country_id):
-    conn = sqlite3.connect(db_file)
+    conn = read_connection(db_file)
     cursor = conn.cursor()
-    cursor.execute(
-        'SELECT sp.path_wkt FROM standard_paths sp where to_country = ? AND from_country = ?;', (country_id, country_id,))
+    if has_wkb_column(cursor, 'standard_paths', 'path_wkb'):
+        cursor.execute(
+            'SELECT sp.path_wkb FROM standard_paths sp where to_country = ? AND from_country = ?;', (country_id, country_id,))
+        convert = convert_wkb_to_list
+    else:
+        cursor.execute(
+            'SELECT sp.path_wkt FROM standard_paths sp where to_country = ? AND from_country = ?;', (country_id, country_id,))
+        convert = convert_land_multilinestring_to_list
     datas = cursor.fetchall()
     for data in datas:
-        whole_data = whole_data + convert_land_multilinestring_to_list(data[0])
+        whole_data = whole_data + convert(data[0])
 
-    conn.close()
     return whole_data
 
 
@@ -0,0 +1,143 @@
+import json
+import os
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import shapely
+import dbStructure as db
+from Querying_Database import read_connection
+
+# rows read from SQLite and written to each parquet row group at a time
+BATCH_ROWS = 100000
+
+# the derived tables are created by the ConvertToStandardPath scripts and
+# the city id resolution, after the tables of dbStructure have been loaded
+derived_tables = ['submarine_standard_paths', 'submarine_to_standard_paths', 'cities']
+
+# table: (wkt column, wkb column)
+export_geometry_columns = dict(db.geometry_columns,
+        submarine_standard_paths=('path_wkt', 'path_wkb'),
+        submarine_to_standard_paths=('path_wkt', 'path_wkb'))
+
+arrow_types = {
+        'integer': pa.int64(),
+        'real': pa.float64(),
+        'blob': pa.binary()
+}
+
+class ExportingParquet:
+    """Writes the iGDB tables to one parquet file per table.
+    Columns keep the types declared in the database, and
+    geometries are written as wkb in place of their wkt text."""
+    def __init__(self, db_file, out_path):
+        self.db_file = db_file
+        self.out_path = Path(out_path)
+        if not os.path.isdir(self.out_path):
+            os.makedirs(self.out_path)
+
+    def run_steps(self):
+        print(f"Exporting {self.db_file} to parquet files in {self.out_path}")
+        conn = read_connection(self.db_file)
+        for t in list(db.tables.keys()) + derived_tables:
+            if not self.table_exists(conn, t):
+                print(f"{t} is not in the database, skipping it.")
+                continue
+            self.export_table(conn, t)
+
+    def table_exists(self, conn, table):
+        cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+        return cur.fetchone() is not None
+
+    def column_types(self, conn, table):
+        """Returns (column, arrow type) pairs for the columns of "table".
+        A column that holds values of another storage class than
+        its declared type (e.g. text in an integer column) is exported
+        as a string, so that no value is lost."""
+        columns = []
+        for r in conn.execute(f"PRAGMA table_info({table})").fetchall():
+            name, declared = r[1], r[2].lower()
+            arrow_type = arrow_types.get(declared, pa.string())
+            if arrow_type != pa.string() and declared != 'blob':
+                allowed = "('integer', 'null')" if declared == 'integer' else "('integer', 'real', 'null')"
+                other = conn.execute(f"SELECT 1 FROM {table} WHERE typeof({name}) NOT IN {allowed} LIMIT 1")
+                if other.fetchone():
+                    arrow_type = pa.string()
+            columns.append((name, arrow_type))
+        return columns
+
+    def export_table(self, conn, table):
+        f_name = self.out_path / f"{table}.parquet"
+        print(f"Exporting {table} to {f_name}")
+        columns = self.column_types(conn, table)
+        names = [c for c, _ in columns]
+        wkt_column, wkb_column = export_geometry_columns.get(table, (None, None))
+        selected = []
+        for c, arrow_type in columns:
+            if c == wkt_column:
+                continue
+            if arrow_type == pa.string():
+                selected.append((f"CAST({c} AS TEXT)", c, arrow_type))
+            else:
+                selected.append((c, c, arrow_type))
+        # databases built before the wkb columns existed only have the wkt text
+        encode_wkt = wkt_column is not None and wkb_column not in names
+        if encode_wkt:
+            selected.append((wkt_column, wkb_column, pa.binary()))
+
+        schema = pa.schema([(name, arrow_type) for _, name, arrow_type in selected])
+        if wkb_column:
+            # GeoParquet metadata, so that geopandas.read_parquet finds the geometry
+            geo = {'version': '1.0.0', 'primary_column': wkb_column,
+                   'columns': {wkb_column: {'encoding': 'WKB', 'geometry_types': []}}}
+            schema = schema.with_metadata({'geo': json.dumps(geo)})
+
+        query = f"SELECT {', '.join(e for e, _, _ in selected)} FROM {table}"
+        cur = conn.execute(query)
+        num_rows = 0
+        with pq.ParquetWriter(f_name, schema) as writer:
+            while True:
+                rows = cur.fetchmany(BATCH_ROWS)
+                if not rows:
+                    break
+                values = [list(col) for col in zip(*rows)]
+                if encode_wkt:
+                    values[-1] = list(shapely.to_wkb(shapely.from_wkt(values[-1], on_invalid='ignore')))
+                arrays = [pa.array(v, type=f.type) for v, f in zip(values, schema)]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                num_rows += len(rows)
+        print(f"\tWrote {num_rows} rows.")
+        return num_rows
+
+class parquetTables:
+    """Reads the tables written by ExportingParquet.
+    Tables are opened lazily as pyarrow datasets, so only the
+    requested columns, and the row groups that can match the
+    filter, are read from disk."""
+    def __init__(self, parquet_path):
+        self.parquet_path = Path(parquet_path)
+
+    def table_names(self):
+        return sorted(f.stem for f in self.parquet_path.glob("*.parquet"))
+
+    def dataset(self, table):
+        f_name = self.parquet_path / f"{table}.parquet"
+        if not os.path.isfile(f_name):
+            raise FileNotFoundError(f"{table} has not been exported to {self.parquet_path}")
+        return ds.dataset(f_name, format="parquet")
+
+    def to_arrow(self, table, columns=None, filter=None):
+        """Returns "table" as an Arrow table.
+        "columns" is a list of column names to read and "filter" is either
+        a pyarrow.compute expression, e.g. pc.field('asn') == 3356, or a
+        list of (column, op, value) tuples, e.g. [('asn', '=', 3356)]."""
+        if isinstance(filter, list):
+            filter = pq.filters_to_expression(filter)
+        return self.dataset(table).to_table(columns=columns, filter=filter)
+
+    def to_pandas(self, table, columns=None, filter=None):
+        """Returns "table" as a pandas DataFrame, see to_arrow."""
+        return self.to_arrow(table, columns, filter).to_pandas()
+
+if __name__ == "__main__":
+    print("You should not run this script by itself. It should be called from iGDB.py")
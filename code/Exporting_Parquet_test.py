@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import shapely
+
+import Creating_Database
+import Exporting_Parquet
+
+
+def write_csv(f_name, lines):
+    os.makedirs(f_name.parent, exist_ok=True)
+    with open(f_name, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def test_export_and_read(tmp_path):
+    processed = tmp_path / 'processed'
+    write_csv(processed / 'asn_loc' / 'PDB_asn_loc.csv',
+            ['asn,latitude,longitude,source', '64500,38.72,-9.14,PDB', '64501,,,PDB'])
+    # a value that is not a number turns its column into text
+    write_csv(processed / 'asn_loc' / 'PCH_asn_loc.csv',
+            ['asn,latitude,longitude,source', 'AS64502,41.15,-8.61,PCH'])
+    write_csv(processed / 'standard_paths' / 'standard_paths.csv',
+            ['from_city,from_state,from_country,to_city,to_state,to_country,distance_km,path_wkt,asof_date',
+             'Lisbon,,PT,Porto,,PT,274.5,"LINESTRING (-9.14 38.72, -8.61 41.15)",2024-01-01'])
+    db_creator = Creating_Database.CreatingDatabase(processed, tmp_path / 'database', 'test.db',
+            jobs=1, incremental=False)
+    db_creator.add_geometry_blobs(['standard_paths'])
+    Exporting_Parquet.ExportingParquet(db_creator.db_file, tmp_path / 'parquet').run_steps()
+
+    tables = Exporting_Parquet.parquetTables(tmp_path / 'parquet')
+    assert 'asn_loc' in tables.table_names()
+    asn_loc = tables.to_arrow('asn_loc')
+    assert asn_loc.schema.field('latitude').type == pa.float64()
+    assert asn_loc.schema.field('asn').type == pa.string()
+    assert sorted(asn_loc.column('asn').to_pylist()) == ['64500', '64501', 'AS64502']
+    no_location = asn_loc.filter(pc.equal(asn_loc.column('asn'), '64501'))
+    assert no_location.column('latitude').to_pylist() == [None]
+
+    # only the requested columns and the matching rows are read back
+    df = tables.to_pandas('asn_loc', columns=['asn', 'source'], filter=[('source', '=', 'PCH')])
+    assert list(df.columns) == ['asn', 'source']
+    assert df.asn.tolist() == ['AS64502']
+
+    # geometries are exported as wkb in place of their wkt
+    paths = tables.to_arrow('standard_paths')
+    assert 'path_wkt' not in paths.column_names
+    path = shapely.from_wkb(paths.column('path_wkb')[0].as_py())
+    assert path.equals_exact(shapely.from_wkt("LINESTRING (-9.14 38.72, -8.61 41.15)"), 0)
+    assert paths.schema.field('distance_km').type == pa.float64()
@@ -1,5 +1,4 @@
 from shortest_physical_path import parse_arguments
-import sqlite3
 import networkx as nx
 from networkx.exception import NetworkXNoPath
 from collections import defaultdict
@@ -36,18 +35,17 @@ def get_distance_between_two_router(from_place, to_place):
 
 def is_city_valid(city):
     # Check the input structure and build the query
-    parts = city.split(',')
-    query = ""
+    parts = [p.strip() for p in city.split(',')]
     if len(parts) == 3:
-        query = f"SELECT * FROM city_points WHERE city_name='{parts[0].strip()}' AND state_province='{parts[1].strip()}' AND country_code='{parts[2].strip()}';"
+        query = 'city_by_name_state_country'
     elif len(parts) == 2:
-        query = f"SELECT * FROM city_points WHERE city_name='{parts[0].strip()}' AND country_code='{parts[1].strip()}';"
+        query = 'city_by_name_country'
     else:
         print("Please specify a city/country or city/state/country", file=sys.stderr)
         return False
 
     # Verify the city is in the DB
-    results = global_querier.execute_query(query)
+    results = global_querier.execute_named(query, tuple(parts))
     if len(results) == 0:
         print(f"{city} not found in the database.", file=sys.stderr)
         return False
@@ -81,8 +79,8 @@ def query_db_for_nodes():
         city = row[0]
         state = row[1]
         country = row[2]
-        lat = float(row[3])
-        lon = float(row[4])
+        lat = row[3]
+        lon = row[4]
         global_nodes_dict[(city, state, country)] = {}
         global_nodes_dict[(city, state, country)]['x'] = lon
         global_nodes_dict[(city, state, country)]['y'] = lat
@@ -99,7 +97,7 @@ def query_db_for_edges():
         tc = row[3]
         ts = row[4]
         tcc = row[5]
-        dist_km = float(row[6])
+        dist_km = row[6]
         path_wkt = row[7]
         edge = ((fc, fs, fcc), (tc, ts, tcc))
         global_edges_dict[edge] = {}
@@ -123,7 +121,7 @@ def create_graph():
 
 def initialize_the_global_graph(db_file):
     global global_querier
-    global_querier = qdb.queryDatabase(db_file)
+    global_querier = qdb.queryDatabase(db_file, cache=True)
     query_db_for_nodes()
     query_db_for_edges()
     create_graph()
@@ -174,9 +172,8 @@ def transform_location_format(location):
 
 
 def update_database(db_file):
-    conn = sqlite3.connect(db_file)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE phys_nodes AS pnc \
+    # a write, which queryDatabase runs on its own read-write connection
+    qdb.queryDatabase(db_file).execute_query('UPDATE phys_nodes AS pnc \
     SET state = cp.state_province \
     FROM city_points AS cp \
     WHERE ABS(pnc.latitude - cp.city_latitude) < 0.001\
@@ -184,9 +181,6 @@ def update_database(db_file):
     AND pnc.city = cp.city_name \
     AND pnc.country = cp.country_code;')
 
-    conn.commit()
-    conn.close()
-
 
 def create_graph_from_phys_nodes(nodes, connections, start_city, start_state, start_country, end_city, end_state, end_country):
     G = nx.DiGraph()
@@ -275,8 +269,8 @@ def print_shortest_paths_and_distances(path_distribution):
 
 
 def find_shortest_path(db_file, start_city, start_state, start_country, end_city, end_state, end_country):
-    # Connect to the SQLite database
-    conn = sqlite3.connect(db_file)
+    # the pooled read-only connection to the SQLite database
+    conn = qdb.read_connection(db_file)
     cursor = conn.cursor()
 
     # Query the nodes and connections from the database
@@ -296,7 +290,6 @@ def find_shortest_path(db_file, start_city, start_state, start_country, end_city
 
     print_shortest_paths_and_distances(path_distribution)
 
-    conn.close()
 
 
 if __name__ == "__main__":
@@ -12,7 +12,7 @@ import sys
 
 class PlottingShortestPath:
     def __init__(self, db_file, from_place, to_place, out_dir):
-        self.querier = qdb.queryDatabase(db_file)
+        self.querier = qdb.queryDatabase(db_file, cache=True)
         self.src = from_place
         self.dst = to_place
         self.out_dir = out_dir
@@ -42,42 +42,15 @@ class PlottingShortestPath:
             self.make_plot()
 
     def are_cities_valid(self):
-        if len(self.src.split(',')) == 3:
-            fc = self.src.split(',')[0].strip()
-            fs = self.src.split(',')[1].strip()
-            fcc = self.src.split(',')[2].strip()
-            f_query = f"""SELECT * 
-                FROM city_points
-                WHERE city_name='{fc}' AND state_province='{fs}' AND country_code='{fcc}';"""
-        elif len(self.src.split(',')) == 2:
-            fc = self.src.split(',')[0].strip()
-            fcc = self.src.split(',')[1].strip()
-            f_query = f"""SELECT * 
-                FROM city_points
-                WHERE city_name='{fc}' AND country_code='{fcc}';"""
-        else:
-            print("Please specify a city/country or city/state/country")
-            return False
-
-        if len(self.dst.split(',')) == 3:
-            tc = self.dst.split(',')[0].strip()
-            ts = self.dst.split(',')[1].strip()
-            tcc = self.dst.split(',')[2].strip()
-            t_query = f"""SELECT * 
-                FROM city_points
-                WHERE city_name='{tc}' AND state_province='{ts}' AND country_code='{tcc}';"""
-        elif len(self.dst.split(',')) == 2:
-            tc = self.dst.split(',')[0].strip()
-            tcc = self.dst.split(',')[1].strip()
-            t_query = f"""SELECT * 
-                FROM city_points
-                WHERE city_name='{tc}' AND country_code='{tcc}';"""
-        else:
+        f_parts = [p.strip() for p in self.src.split(',')]
+        t_parts = [p.strip() for p in self.dst.split(',')]
+        city_queries = {3: 'city_by_name_state_country', 2: 'city_by_name_country'}
+        if len(f_parts) not in city_queries or len(t_parts) not in city_queries:
             print("Please specify a city/country or city/state/country")
             return False
 
         # verify the source node is in the DB
-        results = self.querier.execute_query(f_query)
+        results = self.querier.execute_named(city_queries[len(f_parts)], tuple(f_parts))
         if len(results) == 0:
             print(f"{self.src} not found in the database.")
             return False
@@ -93,7 +66,7 @@ class PlottingShortestPath:
             fcc = results[0][2]
 
         # verify the destination node is in the DB
-        results = self.querier.execute_query(t_query)
+        results = self.querier.execute_named(city_queries[len(t_parts)], tuple(t_parts))
         if len(results) == 0:
             print(f"{self.dst} not found in the database.")
             return False
@@ -123,8 +96,8 @@ class PlottingShortestPath:
             city = row[0]
             state = row[1]
             country = row[2]
-            lat = float(row[3])
-            lon = float(row[4])
+            lat = row[3]
+            lon = row[4]
             self.nodes_dict[(city, state, country)] = {}
             self.nodes_dict[(city, state, country)]['x'] = lon
             self.nodes_dict[(city, state, country)]['y'] = lat
@@ -142,7 +115,7 @@ class PlottingShortestPath:
             tc = row[3]
             ts = row[4]
             tcc = row[5]
-            dist_km = float(row[6])
+            dist_km = row[6]
             path_wkt = row[7]
             edge = ((fc, fs, fcc), (tc, ts, tcc))
             self.edges_dict[edge] = {}
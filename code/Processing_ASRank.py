@@ -1,10 +1,11 @@
 from pathlib import Path
 import os
-import json
-import csv
+import Streaming_JSON
 from datetime import date
 from datetime import timedelta
 import dbStructure
+import Saving_Tables
+import Tracking_Snapshots
 
 class ProcessingASRank:
     def __init__(self, in_dir, out_dir):
@@ -68,31 +69,43 @@ class ProcessingASRank:
             print("\tThere is no data to process. Update the CAIDA ASRank data before continuing.")
             return
 
-        for folder in os.listdir(self.in_dir):
-            self.asof_date = folder.replace("_", "-")
-            self.read_links_file(self.in_dir / folder / self.links_file)
-            self.read_orgs_file(self.in_dir / folder / self.orgs_file)
-            self.read_asns_file(self.in_dir / folder / self.asn_asname_file)
-
+        snapshots = {folder: folder.replace("_", "-") for folder in sorted(os.listdir(self.in_dir))}
         t_file = f"{self.data_source}_{self.asn_conn_table}.csv" 
         asn_conn_file = self.out_dir / self.asn_conn_table / t_file
-        self.save_csv(self.asn_conn_list, self.asn_conn_header, asn_conn_file)
-
         t_file = f"{self.data_source}_{self.asn_asname_table}.csv"
         asn_asname_file = self.out_dir / self.asn_asname_table / t_file
-        self.save_csv(self.asn_asname_list, self.asn_asname_header, asn_asname_file)
-
         t_file = f"{self.data_source}_{self.asn_org_table}.csv"
         asn_org_file = self.out_dir / self.asn_org_table / t_file
-        self.save_csv(self.asn_org_list, self.asn_org_header, asn_org_file)
+        outputs = {asn_conn_file: self.asn_conn_header,
+                asn_asname_file: self.asn_asname_header,
+                asn_org_file: self.asn_org_header}
+        manifest = Tracking_Snapshots.SnapshotManifest(self.out_dir, "ASRank")
+        plan = manifest.plan(self.in_dir, snapshots, outputs)
+        if plan.up_to_date():
+            print("\tAll of the snapshots are already processed.")
+            return
+
+        # the organizations of a snapshot are looked up in the orgs files of
+        # it and every earlier snapshot, so those are read even when skipped
+        for folder in snapshots:
+            self.read_orgs_file(self.in_dir / folder / self.orgs_file)
+            if folder not in plan.process:
+                continue
+            self.asof_date = snapshots[folder]
+            self.read_links_file(self.in_dir / folder / self.links_file)
+            self.read_asns_file(self.in_dir / folder / self.asn_asname_file)
+
+        Saving_Tables.save_table(self.asn_conn_list, self.asn_conn_header, asn_conn_file,
+                replaced_dates=plan.replaced_dates)
+        Saving_Tables.save_table(self.asn_asname_list, self.asn_asname_header, asn_asname_file,
+                replaced_dates=plan.replaced_dates)
+        Saving_Tables.save_table(self.asn_org_list, self.asn_org_header, asn_org_file,
+                replaced_dates=plan.replaced_dates)
+        manifest.save(outputs)
 
     def read_links_file(self, f_name):
         print(f"\tReading {f_name}")
-        link_list = []
-        with open(f_name, 'r') as f:
-            link_list = json.load(f)
-
-        for row in link_list:
+        for row in Streaming_JSON.iter_items(f_name):
             node = row['node']
             rel = node['relationship']
             asn1 = int(node['asn0']['asn'])
@@ -102,12 +115,9 @@ class ProcessingASRank:
 
     def read_orgs_file(self, f_name):
         print(f"\tReading {f_name}")
-        orgs_list = []
-        with open(f_name, 'r') as f:
-            orgs_list = json.load(f)
-        for o in orgs_list:
+        for o in Streaming_JSON.iter_items(f_name):
             org_id = o["node"]["orgId"]
-            org_name = o["node"]["orgName"].replace("'", "''")
+            org_name = o["node"]["orgName"]
             self.org_map[org_id] = org_name
 
     def read_asns_file(self, f_name):
@@ -117,12 +127,9 @@ class ProcessingASRank:
         read in the organization names from another source (ORGS file).
         """
         print(f"\tReading {f_name}")
-        asn_list = []
-        with open(f_name, 'r') as f:
-            asn_list = json.load(f)
-        for a in asn_list:
+        for a in Streaming_JSON.iter_items(f_name):
             asn = a["node"]["asn"]
-            asn_name = a["node"]["asnName"].replace("'", "''")
+            asn_name = a["node"]["asnName"]
             if a["node"]["organization"]:
                 org_id = a["node"]["organization"]["orgId"]
             else:
@@ -135,14 +142,6 @@ class ProcessingASRank:
                 new_row = [asn, org_name, self.data_source, self.asof_date]
                 self.asn_org_list.append(new_row)
 
-    def save_csv(self, data, header, f_name):
-        print(f"\tSaving to {f_name}.")
-        with open(f_name, 'w') as f:
-            csv_writer = csv.writer(f, delimiter=',')
-            csv_writer.writerow(header)
-            for d in data:
-                csv_writer.writerow(d)
-
 if __name__ == "__main__":
     print("This script should not be run by itself. Run it through iGDB.py")
     input_dir = Path("../unprocessed/ASRank")
@@ -8,18 +8,28 @@ import pandas as pd
 
 from geopy.distance import geodesic
 from math import isclose, isnan, nan
-from shapely import wkt, LineString, Point
+from shapely import wkb, wkt, LineString, Point
 from sqlite3 import Row as sqlite_Row
 
-from Common import init_logging
+from Common import has_column, init_logging
 
 def find_closest_paths(lat: float, lon: float, db_path: str, max_distance: float) -> gpd.GeoDataFrame:
     querier = qdb.queryDatabase(db_path)
-    query = f"""SELECT * FROM standard_paths;"""
-    results = querier.execute_query(query, row_factory=sqlite_Row)
-    
+    if querier.has_spatial_index('standard_paths'):
+        # only the paths whose bounding box comes close enough can match
+        results = querier.find_within_radius('standard_paths', lat, lon, max_distance,
+                                             row_factory=sqlite_Row)
+    else:
+        query = f"""SELECT * FROM standard_paths;"""
+        results = querier.execute_query(query, row_factory=sqlite_Row)
+    if not results:
+        return gpd.GeoDataFrame()
+
     df = pd.DataFrame(results, columns=results[0].keys())
-    gs = gpd.GeoSeries.from_wkt(df['path_wkt'])
+    if 'path_wkb' in df and df['path_wkb'].notna().all():
+        gs = gpd.GeoSeries.from_wkb(df['path_wkb'])
+    else:
+        gs = gpd.GeoSeries.from_wkt(df['path_wkt'])
     # The GeoDataFrame takes a coordinate system that it applies to the
     # 'geometry' column. The EPSG:4326 coordinate system is latitude,
     # longitude.
@@ -81,10 +91,19 @@ def distance_of_linestring(ls: LineString) -> float:
 
 def add_cloud_regions_to_db(db_path: str, standard_paths: list, city_points: list) -> None:
     querier = qdb.queryDatabase(db_path)
-    query_insert_standard_path = f"""INSERT INTO standard_paths VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?);"""
-    querier.execute_many(query_insert_standard_path, standard_paths)
-    query_insert_city_points = "INSERT INTO city_points VALUES(?, ?, ?, ?, ?);"
-    querier.execute_many(query_insert_city_points, city_points)
+    columns = "from_city, from_state, from_country, to_city, to_state, to_country, distance_km, path_wkt, asof_date"
+    conn = querier.create_connection()
+    if has_column(conn.cursor(), 'standard_paths', 'path_wkb'):
+        columns += ", path_wkb"
+        standard_paths = [row + (wkb.dumps(wkt.loads(row[7])),) for row in standard_paths]
+    conn.close()
+    placeholders = ", ".join("?" * len(columns.split(", ")))
+    query_insert_standard_path = f"""INSERT INTO standard_paths ({columns}) VALUES({placeholders});"""
+    querier.execute_many(query_insert_standard_path, standard_paths, raise_errors=True)
+    # the columns are named, since resolve_city_ids adds city_id to city_points
+    query_insert_city_points = """INSERT INTO city_points (city_name, state_province, country_code,
+            city_latitude, city_longitude) VALUES(?, ?, ?, ?, ?);"""
+    querier.execute_many(query_insert_city_points, city_points, raise_errors=True)
 
 def parse_cloud_region_coordinates(cloud_region_coordinates_csv: str) -> dict[str, tuple[float, float]]:
     """Read the csv file containing cloud region coordinates and return a mapping from 'cloud:region' to (lat, lon) tuples."""
@@ -114,7 +133,7 @@ def add_cloud_regions_to_standard_paths(db_path: str,
         print(f"Found {len(rows)} rows")
 
         for row in rows.itertuples(index=False):
-            linestring: LineString = wkt.loads(row[7])
+            linestring: LineString = row.geometry
             splitted, _ = cut_linestring(linestring, to_add=Point(lon, lat))
             if len(splitted) < 2:
                 continue
@@ -1,10 +1,11 @@
 from pathlib import Path
 import os
 import json
-import csv
 from datetime import date
 from datetime import timedelta
 import dbStructure
+import Saving_Tables
+from Accumulating_Rows import RowAccumulator
 
 class ProcessingEuroIX:
     def __init__(self, in_dir, out_dir):
@@ -21,7 +22,7 @@ class ProcessingEuroIX:
         self.ixp_map = {}
 
         # setup for asn_asname table
-        self.asn_asname_list = []
+        self.asn_asname_list = RowAccumulator()
         name, fields = self.read_fields(dbStructure.sql_create_asn_asname_table)
         self.asn_asname_header = fields
         self.asn_asname_table = name 
@@ -56,7 +57,7 @@ class ProcessingEuroIX:
 
         t_file = f"{self.data_source}_{self.asn_asname_table}.csv"
         asn_asname_file = self.out_dir / self.asn_asname_table / t_file
-        self.save_csv(self.asn_asname_list, self.asn_asname_header, asn_asname_file)
+        Saving_Tables.save_table(self.asn_asname_list, self.asn_asname_header, asn_asname_file)
 
     def read_ixps_file(self, f_name):
         print(f"\tReading {f_name}")
@@ -68,7 +69,7 @@ class ProcessingEuroIX:
             fac_id = row['fields']['ixp_number_ix_f_id']
             name = row['fields']['name']
             if 'metro' in row['fields'].keys():
-                loc = row['fields']['metro'].replace("'", "''")
+                loc = row['fields']['metro']
             else:
                 loc = ''
             if 'ipv4' in row['fields'].keys():
@@ -101,12 +102,11 @@ class ProcessingEuroIX:
             if not fac_id in self.ixp_map.keys():
                 self.ixp_map[fac_id] = {}
                 self.ixp_map[fac_id]["name"] = name
-                self.ixp_map[fac_id]["location"] = []
+                self.ixp_map[fac_id]["location"] = RowAccumulator()
                 self.ixp_map[fac_id]["IPv4"] = ipv4_sub
                 self.ixp_map[fac_id]["IPv6"] = ipv6_sub
             loc_row = (sw_name, sw_model, ixp_sw, loc, lat, lon)
-            if not loc_row in self.ixp_map[fac_id]["location"]:
-                self.ixp_map[fac_id]["location"].append(loc_row)
+            self.ixp_map[fac_id]["location"].add(loc_row)
 
     def read_asns_file(self, f_name):
         print(f"\tReading {f_name}")
@@ -115,7 +115,7 @@ class ProcessingEuroIX:
             asn_list = json.load(f)
         for row in asn_list:
             asn = row['fields']['asn']
-            asn_name = row['fields']['name'].replace("'", "''")
+            asn_name = row['fields']['name']
             fac_id = row['fields']['ixp_number_ix_f_id']
             if 'ipv4_address' in row['fields'].keys():
                 ipv4_addr = row['fields']['ipv4_address']
@@ -138,16 +138,7 @@ class ProcessingEuroIX:
             else:
                 ixp_sw = ''
             new_row = [asn, asn_name, self.data_source, self.asof_date]
-            if not new_row in self.asn_asname_list:
-                self.asn_asname_list.append(new_row)
-
-    def save_csv(self, data, header, f_name):
-        print(f"\tSaving to {f_name}.")
-        with open(f_name, 'w') as f:
-            csv_writer = csv.writer(f, delimiter=',')
-            csv_writer.writerow(header)
-            for d in data:
-                csv_writer.writerow(d)
+            self.asn_asname_list.add(new_row)
 
 
 if __name__ == "__main__":
@@ -1,18 +1,19 @@
 import os
 from pathlib import Path
 import json
-import csv
 from datetime import date
 from datetime import timedelta
 import Standardize_Locations
 import dbStructure
+import Saving_Tables
+from Accumulating_Rows import RowAccumulator, SPILL_ROWS
 
 class ProcessingPCH:
     """
         This class processes the IXPs and ASes at each IXP from PCH
         to identify the ASes at each location.
     """
-    def __init__(self, in_dir, out_dir):
+    def __init__(self, in_dir, out_dir, voronoi_dir):
         self.in_dir = ''
         self.asof_date = ''
         if not os.path.isdir(in_dir):
@@ -22,7 +23,7 @@ class ProcessingPCH:
         self.out_dir = out_dir
         self.ixp_loc_dict = {}
         self.asn_loc_dict = {}
-        self.asn_loc_list = []
+        self.asn_loc_list = RowAccumulator()
         self.physical_presence = False
         name, fields = self.read_fields(dbStructure.sql_create_asn_loc_table)
         self.asn_loc_header = fields
@@ -33,17 +34,17 @@ class ProcessingPCH:
         self.asn_org_header = fields
         self.asn_org_table = name
 
-        self.ip_asn_list = []
+        # one row per subnet, which is the largest table of PCH
+        self.ip_asn_list = RowAccumulator(spill_rows=SPILL_ROWS)
         name, fields = self.read_fields(dbStructure.sql_create_ip_asn_dns_table)
         self.ip_asn_header = fields
         self.ip_asn_table = name
 
         self.data_source = "PCH"
-        voronoi_dir = Path("../helper_data/cities_Voronoi")
         if not os.path.isdir(voronoi_dir):
             print("The Voronoi map helper file does not exist. Cannot standardize city names.")
             return
-        self.loc_standardizer = Standardize_Locations.LocationStandardizer(voronoi_dir)
+        self.voronoi_dir = voronoi_dir
 
         if not os.path.isdir(self.out_dir / self.asn_loc_table):
             os.makedirs(self.out_dir / self.asn_loc_table)
@@ -54,6 +55,11 @@ class ProcessingPCH:
         if not os.path.isdir(self.out_dir / self.ip_asn_table):
             os.makedirs(self.out_dir / self.ip_asn_table)
 
+    @property
+    def loc_standardizer(self):
+        """The shared standardizer, loaded on first use."""
+        return Standardize_Locations.shared_standardizer(self.voronoi_dir)
+
     def read_fields(self, sql_str):
         """Reads in the table name and field names from the dbStructure file.
         The dbStructure file should be the standard for the DB,
@@ -73,17 +79,17 @@ class ProcessingPCH:
         if not os.path.isdir(self.in_dir):
             print("\n\tThere is no data to process. Update the PCH data before continuing.")
             return
-        print("This takes a while. Status reported every 100 IXPs.")
         self.read_ixp_file(self.in_dir / "pch_active_ixp.json")
         self.read_subnets_file(self.in_dir / "pch_subnets.json")
         asn_loc_file = self.out_dir / self.asn_loc_table / f"{self.data_source}_{self.asn_loc_table}.csv"
-        self.save_csv(self.asn_loc_list, self.asn_loc_header, asn_loc_file)
+        Saving_Tables.save_table(self.asn_loc_list, self.asn_loc_header, asn_loc_file)
 
         ip_asn_file = self.out_dir / self.ip_asn_table / f"{self.data_source}_{self.ip_asn_table}.csv"
-        self.save_csv(self.ip_asn_list, self.ip_asn_header, ip_asn_file)
+        Saving_Tables.save_table(self.ip_asn_list, self.ip_asn_header, ip_asn_file)
+        self.ip_asn_list.close()
 
         asn_org_file = self.out_dir / self.asn_org_table / f"{self.data_source}_{self.asn_org_table}.csv"
-        self.save_csv(self.asn_org_list, self.asn_org_header, asn_org_file)
+        Saving_Tables.save_table(self.asn_org_list, self.asn_org_header, asn_org_file)
 
     def find_nearest_input_folder(self, start_dir):
         today = date.today()
@@ -114,9 +120,7 @@ class ProcessingPCH:
 
     def read_ixp_file(self, ixp_file):
         ixp_list = self.read_json(ixp_file)
-        for i, ixp in enumerate(ixp_list):
-            if (i+1) % 100 == 0:
-                print(f"\tWorking on IXP {i+1} of {len(ixp_list)}.")
+        for ixp in ixp_list:
             ixp_id = ixp['id']
             city = ixp['cit']
             country = ixp['ctry']
@@ -124,11 +128,11 @@ class ProcessingPCH:
             if ixp['lat']:
                 lat = round(float(ixp['lat']), 4)
             else:
-                lat = ''
+                lat = None
             if ixp['lon']:
                 lon = round(float(ixp['lon']), 4)
             else:
-                lon = ''
+                lon = None
             self.ixp_loc_dict[ixp_id] = {}
             self.ixp_loc_dict[ixp_id]["CITY"] = city
             self.ixp_loc_dict[ixp_id]["COUNTRY"] = country
@@ -136,22 +140,33 @@ class ProcessingPCH:
             self.ixp_loc_dict[ixp_id]["LATITUDE"] = lat
             self.ixp_loc_dict[ixp_id]["LONGITUDE"] = lon
 
-            if lat and lon:
-                std_loc = self.loc_standardizer.standardize([lat, lon])
+        # the IXPs with coordinates are standardized in one batch
+        ixp_ids = [ixp['id'] for ixp in ixp_list]
+        located = [i for i in ixp_ids
+                if self.ixp_loc_dict[i]["LATITUDE"] and self.ixp_loc_dict[i]["LONGITUDE"]]
+        std_locs = self.loc_standardizer.standardize_many(
+                [[self.ixp_loc_dict[i]["LATITUDE"], self.ixp_loc_dict[i]["LONGITUDE"]] for i in located])
+        std_locs = dict(zip(located, std_locs))
+        print(f"\tStandardized the locations of {len(located)} of {len(ixp_list)} IXPs.")
+        for ixp_id in ixp_ids:
+            std_loc = std_locs.get(ixp_id)
+            if std_loc:
                 self.ixp_loc_dict[ixp_id]["STD_LATITUDE"] = std_loc["LATITUDE"]
                 self.ixp_loc_dict[ixp_id]["STD_LONGITUDE"] = std_loc["LONGITUDE"]
-                self.ixp_loc_dict[ixp_id]["STD_CITY"] = std_loc["CITY"].replace("'", "''")
+                self.ixp_loc_dict[ixp_id]["STD_CITY"] = std_loc["CITY"]
                 try:
-                    self.ixp_loc_dict[ixp_id]["STD_STATE"] = std_loc["STATE"].replace("'", "''")
+                    self.ixp_loc_dict[ixp_id]["STD_STATE"] = std_loc["STATE"]
                 except:
                     self.ixp_loc_dict[ixp_id]["STD_STATE"] = None
                 self.ixp_loc_dict[ixp_id]["STD_COUNTRY"] = std_loc["COUNTRY"]
+                self.ixp_loc_dict[ixp_id]["STD_APPROXIMATE"] = std_loc["APPROXIMATE"]
             else:
-                self.ixp_loc_dict[ixp_id]["STD_LATITUDE"] = 'NULL'
-                self.ixp_loc_dict[ixp_id]["STD_LONGITUDE"] = 'NULL'
-                self.ixp_loc_dict[ixp_id]["STD_CITY"] = 'NULL'
-                self.ixp_loc_dict[ixp_id]["STD_STATE"] = 'NULL'
-                self.ixp_loc_dict[ixp_id]["STD_COUNTRY"] = 'NULL'
+                self.ixp_loc_dict[ixp_id]["STD_LATITUDE"] = None
+                self.ixp_loc_dict[ixp_id]["STD_LONGITUDE"] = None
+                self.ixp_loc_dict[ixp_id]["STD_CITY"] = None
+                self.ixp_loc_dict[ixp_id]["STD_STATE"] = None
+                self.ixp_loc_dict[ixp_id]["STD_COUNTRY"] = None
+                self.ixp_loc_dict[ixp_id]["STD_APPROXIMATE"] = None
 
     def read_subnets_file(self, subnets_file):
         validated_status = ''
@@ -166,7 +181,7 @@ class ProcessingPCH:
                         for ip in subnets_dict[ixp_id][ip_ver][ip_range].keys():
                             ip_dict = subnets_dict[ixp_id][ip_ver][ip_range][ip]
                             asn = ip_dict['asn']
-                            org_name = ip_dict['org'].replace("'", "''")
+                            org_name = ip_dict['org']
                             ip_addr = ip_dict['ip']
                             rdns = ip_dict['fqdn']
                             if not asn:
@@ -188,19 +203,18 @@ class ProcessingPCH:
                             std_city = self.ixp_loc_dict[ixp_id]["STD_CITY"]
                             std_state = self.ixp_loc_dict[ixp_id]["STD_STATE"]
                             std_country = self.ixp_loc_dict[ixp_id]["STD_COUNTRY"]
+                            std_approximate = self.ixp_loc_dict[ixp_id]["STD_APPROXIMATE"]
 
                             loc_row = (asn, lat, lon, self.data_source,
                                     validated_status, std_lat, std_lon,
                                     std_city, std_state, std_country,
-                                    self.physical_presence, self.asof_date)
+                                    self.physical_presence, self.asof_date, std_approximate)
                             if lat and lon:
-                                if not loc_row in self.asn_loc_list:
-                                    self.asn_loc_list.append(loc_row)
+                                self.asn_loc_list.add(loc_row)
                             ip_row = (ip_addr, rdns, asn, std_city, std_state,
                                     std_country, self.data_source, self.asof_date)
                             if lat and lon:
-                                if not ip_row in self.ip_asn_list:
-                                    self.ip_asn_list.append(ip_row)
+                                self.ip_asn_list.add(ip_row)
 
         for asn in asn_org_dict.keys():
             row = [asn, asn_org_dict[asn], self.data_source, self.asof_date]
@@ -213,17 +227,10 @@ class ProcessingPCH:
         return data
 
 
-    def save_csv(self, data, header, f_name):
-        print(f"\tSaving to {f_name}.")
-        with open(f_name, 'w') as f:
-            csv_writer = csv.writer(f, delimiter=',')
-            csv_writer.writerow(header)
-            for d in data:
-                csv_writer.writerow(d)
-
 if __name__ == "__main__":
     print("This script should not be run by itself. Run it through iGDB.py")
     input_dir = Path("../unprocessed/PCH")
     output_dir = Path("../processed")
-    my_processor = ProcessingPCH(input_dir, output_dir)
+    voronoi_dir = Path("../helper_data/cities_Voronoi")
+    my_processor = ProcessingPCH(input_dir, output_dir, voronoi_dir)
     my_processor.run_steps()
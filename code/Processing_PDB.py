@@ -1,22 +1,37 @@
 import os
 from pathlib import Path
-import json
-import csv
 import Standardize_Locations
+import Streaming_JSON
 import dbStructure
+import Saving_Tables
+from Accumulating_Rows import RowAccumulator
+
+# the tables of the dump that are processed, and the fields kept from each
+# record (None keeps the whole record); the rest of the dump is never held
+pdb_fields = {"as_set": None,
+        "net": ["asn", "name", "aka"],
+        "fac": ["id", "latitude", "longitude", "org_name", "name"],
+        "netfac": ["local_asn", "fac_id"],
+        "ixfac": ["ix_id", "fac_id"],
+        "netixlan": ["asn", "ix_id"]}
+# the small tables, read into memory as the lookups of the other ones
+lookup_tables = ["as_set", "net", "fac", "ixfac"]
+# the largest tables, which are processed one record at a time, in a
+# second pass over the dump
+streamed_tables = ["netfac", "netixlan"]
 
 class ProcessingPDB:
     """
         This class processes the IXPs and ASes at each IXP from PDB
         to identify the ASes at each location.
     """
-    def __init__(self, in_dir, out_dir):
+    def __init__(self, in_dir, out_dir, voronoi_dir):
         self.in_dir = in_dir
         self.asof_date = ''
         self.out_dir = out_dir
         self.pdb_dict = {}
         self.fac_loc_dict = {}
-        self.asn_loc_list = []
+        self.asn_loc_list = RowAccumulator()
         name, fields = self.read_fields(dbStructure.sql_create_asn_loc_table)
         self.asn_loc_header = fields
         self.asn_loc_table = name 
@@ -37,11 +52,10 @@ class ProcessingPDB:
         self.phys_nodes_table = name
 
         self.data_source = "PeeringDB"
-        voronoi_dir = Path("../helper_data/cities_Voronoi")
         if not os.path.isdir(voronoi_dir):
             print("The Voronoi map helper file does not exist. Cannot standardize city names.")
             return
-        self.loc_standardizer = Standardize_Locations.LocationStandardizer(voronoi_dir)
+        self.voronoi_dir = voronoi_dir
 
         if not os.path.isdir(self.out_dir / self.asn_loc_table):
             os.makedirs(self.out_dir / self.asn_loc_table)
@@ -55,6 +69,11 @@ class ProcessingPDB:
         if not os.path.isdir(self.out_dir / self.phys_nodes_table):
             os.makedirs(self.out_dir / self.phys_nodes_table)
 
+    @property
+    def loc_standardizer(self):
+        """The shared standardizer, loaded on first use."""
+        return Standardize_Locations.shared_standardizer(self.voronoi_dir)
+
     def read_fields(self, sql_str):
         """Reads in the table name and field names from the dbStructure file.
         The dbStructure file should be the standard for the DB,
@@ -86,45 +105,45 @@ class ProcessingPDB:
             self.asof_date = f"{year}-{month}-{day}"
             self.pdb_dict = self.read_json(self.in_dir / d)
             self.process_asn_orgs()
-            self.process_asn_locs()
+            self.process_asn_locs(self.in_dir / d)
 
         asn_org_file = self.out_dir / self.asn_org_table / f"{self.data_source}_{self.asn_org_table}.csv"
-        self.save_csv(self.asn_org_list, self.asn_org_header, asn_org_file)
+        Saving_Tables.save_table(self.asn_org_list, self.asn_org_header, asn_org_file)
 
         asn_loc_file = self.out_dir / self.asn_loc_table / f"{self.data_source}_{self.asn_loc_table}.csv"
-        self.save_csv(self.asn_loc_list, self.asn_loc_header, asn_loc_file)
+        Saving_Tables.save_table(self.asn_loc_list, self.asn_loc_header, asn_loc_file)
 
         t_name = f"{self.data_source}_{self.asn_asname_table}.csv"
         asn_asname_file = self.out_dir / self.asn_asname_table / t_name
-        self.save_csv(self.asn_asname_list, self.asn_asname_header, asn_asname_file)
+        Saving_Tables.save_table(self.asn_asname_list, self.asn_asname_header, asn_asname_file)
 
         t_name = f"{self.data_source}_{self.phys_nodes_table}.csv"
         phys_nodes_file = self.out_dir / self.phys_nodes_table / t_name
-        self.save_csv(self.phys_nodes_list, self.phys_nodes_header, phys_nodes_file)
+        Saving_Tables.save_table(self.phys_nodes_list, self.phys_nodes_header, phys_nodes_file)
 
     def process_asn_orgs(self):
         print("\tWorking on the PeeringDB ASN to organization map.")
         asn_org_dict = {}
-        for i, asn in enumerate(self.pdb_dict['as_set']['data'][0]):
+        for i, asn in enumerate(self.pdb_dict['as_set'][0]):
             asn_i = int(asn)
             asn_org_dict[asn_i] = {}
-            asn_org_dict[asn_i]["ASN_NAME"] = self.pdb_dict['as_set']['data'][0][asn]
-            asn_org_dict[asn_i]["ORGANIZATION_NAME"] = 'NULL'
-            asn_org_dict[asn_i]["ORGANIZATION_AKA"] = 'NULL'
-        for i, net in enumerate(self.pdb_dict['net']['data']):
+            asn_org_dict[asn_i]["ASN_NAME"] = self.pdb_dict['as_set'][0][asn]
+            asn_org_dict[asn_i]["ORGANIZATION_NAME"] = ''
+            asn_org_dict[asn_i]["ORGANIZATION_AKA"] = ''
+        for i, net in enumerate(self.pdb_dict['net']):
             asn = int(net['asn'])
             org_name = net['name']
             org_aka = net['aka']
             if not asn in asn_org_dict.keys():
                 asn_org_dict[asn] = {}
-                asn_org_dict[asn]["ASN_NAME"] = 'NULL'
+                asn_org_dict[asn]["ASN_NAME"] = ''
             asn_org_dict[asn]["ORGANIZATION_NAME"] = org_name
             asn_org_dict[asn]["ORGANIZATION_AKA"] = org_aka
         for asn in asn_org_dict.keys():
-            asn_name = asn_org_dict[asn]["ASN_NAME"].replace("'", "''")
-            org_name = asn_org_dict[asn]["ORGANIZATION_NAME"].replace("'", "''")
-            org_aka_unf = asn_org_dict[asn]["ORGANIZATION_AKA"].replace("'", "''")
-            new_row = [asn, org_name, self.data_source, self.asof_date]
+            asn_name = asn_org_dict[asn]["ASN_NAME"]
+            org_name = asn_org_dict[asn]["ORGANIZATION_NAME"]
+            org_aka_unf = asn_org_dict[asn]["ORGANIZATION_AKA"]
+            new_row = [asn, org_name or None, self.data_source, self.asof_date]
             self.asn_org_list.append(new_row)
             org_aka_list = self.split_org_aka(org_aka_unf)
             for org_aka in org_aka_list:
@@ -158,46 +177,54 @@ class ProcessingPDB:
                 results.append(e)
         return results
 
-    def process_asn_locs(self):
+    def process_asn_locs(self, dump_file):
         validated = ''
-        print("\tWorking on the PeeringDB facilities. ", end='')
-        print("This takes a while. Status reported every 100 facilities.")
-        for i, fac in enumerate(self.pdb_dict['fac']['data']):
-            if (i+1) % 100 == 0:
-                print(f"\tWorking on facility {i+1} of {len(self.pdb_dict['fac']['data'])}.")
+        print("\tWorking on the PeeringDB facilities.")
+        # fac_loc_dict keeps the facilities of the earlier dumps for the
+        # lookups below, but only those of this dump are phys_nodes
+        fac_ids = []
+        for fac in self.pdb_dict['fac']:
             fac_id = fac['id']
+            fac_ids.append(fac_id)
             if fac['latitude']:
                 lat = round(float(fac['latitude']), 4)
             else:
-                lat = 'NULL'
+                lat = None
             if fac['longitude']:
                 lon = round(float(fac['longitude']), 4)
             else:
-                lon = 'NULL'
+                lon = None
             self.fac_loc_dict[fac_id] = {}
             self.fac_loc_dict[fac_id]["LATITUDE"] = lat
             self.fac_loc_dict[fac_id]["LONGITUDE"] = lon
-            self.fac_loc_dict[fac_id]["ORGANIZATION"] = fac['org_name'].replace("'", "''")
-            self.fac_loc_dict[fac_id]["NODE_NAME"] = fac['name'].replace("'", "''")
+            self.fac_loc_dict[fac_id]["ORGANIZATION"] = fac['org_name']
+            self.fac_loc_dict[fac_id]["NODE_NAME"] = fac['name']
 
-            std_loc = {}
-            if (not lat == 'NULL') and (not lon == 'NULL'):
-                std_loc = self.loc_standardizer.standardize([lat, lon])
+        # the facilities with coordinates are standardized in one batch
+        located = [f for f in fac_ids if self.fac_loc_dict[f]["LATITUDE"] is not None
+                and self.fac_loc_dict[f]["LONGITUDE"] is not None]
+        std_locs = self.loc_standardizer.standardize_many(
+                [[self.fac_loc_dict[f]["LATITUDE"], self.fac_loc_dict[f]["LONGITUDE"]] for f in located])
+        std_locs = dict(zip(located, std_locs))
+        for fac_id in fac_ids:
+            std_loc = std_locs.get(fac_id, {})
             if std_loc:
                 self.fac_loc_dict[fac_id]["STD_LATITUDE"] = std_loc["LATITUDE"]
                 self.fac_loc_dict[fac_id]["STD_LONGITUDE"] = std_loc["LONGITUDE"]
-                self.fac_loc_dict[fac_id]["STD_CITY"] = std_loc["CITY"].replace("'", "''")
+                self.fac_loc_dict[fac_id]["STD_CITY"] = std_loc["CITY"]
                 try:
-                    self.fac_loc_dict[fac_id]["STD_STATE"] = std_loc["STATE"].replace("'", "''")
+                    self.fac_loc_dict[fac_id]["STD_STATE"] = std_loc["STATE"]
                 except:
                     self.fac_loc_dict[fac_id]["STD_STATE"] = None
                 self.fac_loc_dict[fac_id]["STD_COUNTRY"] = std_loc["COUNTRY"]
+                self.fac_loc_dict[fac_id]["STD_APPROXIMATE"] = std_loc["APPROXIMATE"]
             else:
-                self.fac_loc_dict[fac_id]["STD_LATITUDE"] = 'NULL'
-                self.fac_loc_dict[fac_id]["STD_LONGITUDE"] = 'NULL'
-                self.fac_loc_dict[fac_id]["STD_CITY"] = 'NULL'
-                self.fac_loc_dict[fac_id]["STD_STATE"] = 'NULL'
-                self.fac_loc_dict[fac_id]["STD_COUNTRY"] = 'NULL'
+                self.fac_loc_dict[fac_id]["STD_LATITUDE"] = None
+                self.fac_loc_dict[fac_id]["STD_LONGITUDE"] = None
+                self.fac_loc_dict[fac_id]["STD_CITY"] = None
+                self.fac_loc_dict[fac_id]["STD_STATE"] = None
+                self.fac_loc_dict[fac_id]["STD_COUNTRY"] = None
+                self.fac_loc_dict[fac_id]["STD_APPROXIMATE"] = None
 
             phys_row = [self.fac_loc_dict[fac_id]["ORGANIZATION"],
                     self.fac_loc_dict[fac_id]["NODE_NAME"],
@@ -206,13 +233,26 @@ class ProcessingPDB:
                     self.fac_loc_dict[fac_id]["STD_CITY"],
                     self.fac_loc_dict[fac_id]["STD_STATE"],
                     self.fac_loc_dict[fac_id]["STD_COUNTRY"],
-                    self.data_source, self.asof_date]
+                    self.data_source, self.asof_date,
+                    self.fac_loc_dict[fac_id]["STD_APPROXIMATE"]]
             self.phys_nodes_list.append(phys_row)
 
-        print("\tWorking on the PeeringDB networks.")
-        for net in self.pdb_dict['netfac']['data']:
-            asn = net['local_asn']
-            fac_id = net['fac_id']
+        print("\tWorking on the PeeringDB networks and their virtual presence.")
+        mapping_ixp_pop = {}
+        for ixfac in self.pdb_dict['ixfac']:
+            mapping_ixp_pop[ixfac['ix_id']] = ixfac['fac_id']
+        for table, net in self.read_records(dump_file, streamed_tables):
+            if table == 'netfac':
+                asn = net['local_asn']
+                fac_id = net['fac_id']
+                ### adding a flag because this is a physical presence
+                physical_presence = True
+            elif net['ix_id'] in mapping_ixp_pop:
+                asn = net['asn']
+                fac_id = mapping_ixp_pop[net['ix_id']]
+                physical_presence = False
+            else:
+                continue
             lat = self.fac_loc_dict[fac_id]["LATITUDE"]
             lon = self.fac_loc_dict[fac_id]["LONGITUDE"]
             std_lat = self.fac_loc_dict[fac_id]["STD_LATITUDE"]
@@ -220,55 +260,33 @@ class ProcessingPDB:
             std_city = self.fac_loc_dict[fac_id]["STD_CITY"]
             std_state = self.fac_loc_dict[fac_id]["STD_STATE"]
             std_country = self.fac_loc_dict[fac_id]["STD_COUNTRY"]
-            ### adding a flag because this is a physical presence
-            physical_presence = True
+            std_approximate = self.fac_loc_dict[fac_id]["STD_APPROXIMATE"]
             new_row = [asn, lat, lon, self.data_source, validated,
                     std_lat, std_lon, std_city, std_state, std_country,
-                    physical_presence, self.asof_date]
+                    physical_presence, self.asof_date, std_approximate]
             if lat and lon:
-                if not new_row in self.asn_loc_list:
-                    self.asn_loc_list.append(new_row)
-        print('\tWorking on the PeeringDB virtual presence')
-        mapping_ixp_pop = {}
-        for ixfac in self.pdb_dict['ixfac']['data']:
-            mapping_ixp_pop[ixfac['ix_id']] = ixfac['fac_id']
-        for net in self.pdb_dict['netixlan']['data']:
-            asn = net['asn']
-            if net['ix_id'] in mapping_ixp_pop:
-                fac_id = mapping_ixp_pop[net['ix_id']]
-                lat = self.fac_loc_dict[fac_id]["LATITUDE"]
-                lon = self.fac_loc_dict[fac_id]["LONGITUDE"]
-                std_lat = self.fac_loc_dict[fac_id]["STD_LATITUDE"]
-                std_lon = self.fac_loc_dict[fac_id]["STD_LONGITUDE"]
-                std_city = self.fac_loc_dict[fac_id]["STD_CITY"]
-                std_state = self.fac_loc_dict[fac_id]["STD_STATE"]
-                std_country = self.fac_loc_dict[fac_id]["STD_COUNTRY"]
-                ### adding a flag because this is a physical presence
-                physical_presence = False
-                new_row = [asn, lat, lon, self.data_source, validated,
-                           std_lat, std_lon, std_city, std_state, std_country,
-                           physical_presence, self.asof_date]
-                if lat and lon:
-                    if not new_row in self.asn_loc_list:
-                        self.asn_loc_list.append(new_row)
+                self.asn_loc_list.add(new_row)
+
+    def read_records(self, f_name, tables):
+        """Yields (table, record) for the records of "tables" in the dump,
+        with the fields of pdb_fields, one record at a time, since the whole
+        dump takes several GB once decoded."""
+        for table, record in Streaming_JSON.iter_tables(f_name, tables=tables):
+            if pdb_fields[table] is not None:
+                record = {field: record[field] for field in pdb_fields[table]}
+            yield table, record
 
     def read_json(self, f_name):
-        data = {}
-        with open(f_name, 'r') as f:
-            data = json.load(f)
+        """Reads the lookup tables of the dump."""
+        data = {table: [] for table in lookup_tables}
+        for table, record in self.read_records(f_name, lookup_tables):
+            data[table].append(record)
         return data
 
-    def save_csv(self, data, header, f_name):
-        print(f"\tSaving to {f_name}.")
-        with open(f_name, 'w') as f:
-            csv_writer = csv.writer(f, delimiter=',')
-            csv_writer.writerow(header)
-            for d in data:
-                csv_writer.writerow(d)
-
 if __name__ == "__main__":
     print("This script should not be run by itself. Run it through iGDB.py")
     input_dir = Path("../unprocessed/PeeringDB")
     output_dir = Path("../processed")
-    my_processor = ProcessingPDB(input_dir, output_dir)
+    voronoi_dir = Path("../helper_data/cities_Voronoi")
+    my_processor = ProcessingPDB(input_dir, output_dir, voronoi_dir)
     my_processor.run_steps()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import csv
+import json
+
+import pyarrow as pa
+import pyarrow.feather as feather
+import shapely
+
+import Processing_PDB
+import Standardize_Locations
+
+
+def write_voronoi_artifact(voronoi_dir):
+    voronoi_dir.mkdir()
+    polygons = [shapely.box(0, 0, 1, 1), shapely.box(2, 0, 3, 1)]
+    table = pa.table({"geometry": pa.array(shapely.to_wkb(polygons), type=pa.binary()),
+            "LATITUDE": [0.5, 0.5], "LONGITUDE": [0.5, 2.5],
+            "NAME": ["West", "East"], "ADM1NAME": [None, None], "ISO_A2": ["AA", "BB"]})
+    table = table.replace_schema_metadata({"source_version": Standardize_Locations.source_version(voronoi_dir)})
+    feather.write_feather(table, voronoi_dir / Standardize_Locations.ARTIFACT_NAME)
+
+
+def read_rows(f_name):
+    with open(f_name, 'r') as f:
+        return list(csv.reader(f))[1:]
+
+
+def test_process_dump(tmp_path):
+    in_dir = tmp_path / 'PeeringDB'
+    in_dir.mkdir()
+    dump = {
+        "as_set": {"data": [{"64500": "AS-EXAMPLE", "64502": "AS-NOORG"}]},
+        "fac": {"data": [{"id": 1, "latitude": 0.5, "longitude": 0.25, "org_name": "Org", "name": "West DC"},
+                         {"id": 2, "latitude": 0.5, "longitude": 2.75, "org_name": "Org", "name": "East DC"},
+                         {"id": 3, "latitude": None, "longitude": None, "org_name": "Org", "name": "No DC"}]},
+        "ix": {"data": [{"id": 10, "name": "not processed"}]},
+        "ixfac": {"data": [{"ix_id": 10, "fac_id": 2}]},
+        "net": {"data": [{"asn": 64500, "name": "Example Networks", "aka": "Example, ExNet"},
+                         {"asn": 64501, "name": "O'Brien", "aka": ""}]},
+        "netfac": {"data": [{"local_asn": 64500, "fac_id": 1}, {"local_asn": 64501, "fac_id": 3},
+                            {"local_asn": 64500, "fac_id": 1}]},
+        "netixlan": {"data": [{"asn": 64501, "ix_id": 10}, {"asn": 64501, "ix_id": 11}]},
+    }
+    with open(in_dir / 'peeringdb_2_dump_2024_01_02.json', 'w') as f:
+        json.dump(dump, f)
+    voronoi_dir = tmp_path / 'cities_Voronoi'
+    write_voronoi_artifact(voronoi_dir)
+
+    processor = Processing_PDB.ProcessingPDB(in_dir, tmp_path, voronoi_dir)
+    processor.run_steps()
+    # only the lookup tables were held
+    assert sorted(processor.pdb_dict) == sorted(Processing_PDB.lookup_tables)
+
+    asn_locs = [(r[0], r[7], r[10]) for r in read_rows(tmp_path / 'asn_loc' / 'PeeringDB_asn_loc.csv')]
+    assert asn_locs == [('64500', 'West', 'True'), ('64501', 'East', 'False')]
+    asn_orgs = [(r[0], r[1]) for r in read_rows(tmp_path / 'asn_org' / 'PeeringDB_asn_org.csv')]
+    # quotes are written as they are, and an ASN without an organization keeps its row
+    assert asn_orgs == [('64500', 'Example Networks'), ('64500', 'Example'), ('64500', 'ExNet'),
+            ('64502', ''), ('64501', "O'Brien")]
+    phys_nodes = read_rows(tmp_path / 'phys_nodes' / 'PeeringDB_phys_nodes.csv')
+    assert [(r[1], r[4]) for r in phys_nodes] == [('West DC', 'West'), ('East DC', 'East'), ('No DC', '')]
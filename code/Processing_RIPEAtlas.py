@@ -1,36 +1,42 @@
 from pathlib import Path
 import os
 import json
-import csv
 from datetime import date
 from datetime import timedelta
 import Standardize_Locations
 import dbStructure
+import Saving_Tables
+import Tracking_Snapshots
+from Accumulating_Rows import RowAccumulator
 
 class ProcessingRIPEAtlas:
-    def __init__(self, in_dir, out_dir):
+    def __init__(self, in_dir, out_dir, voronoi_dir):
         self.in_dir = in_dir
         self.asof_date = ''
         if not os.path.isdir(in_dir):
             print(f"{in_dir} does not exist.")
             return
         self.out_dir =  out_dir
-        self.asn_loc_list = []
+        self.asn_loc_list = RowAccumulator()
         self.physical_presence = False
         name, fields = self.read_fields(dbStructure.sql_create_asn_loc_table)
         self.asn_loc_header = fields
         self.asn_loc_table = name 
 
         self.data_source = "RIPEAtlas"
-        voronoi_dir = Path("../helper_data/cities_Voronoi")
         if not os.path.isdir(voronoi_dir):
             print("The Voronoi map helper file does not exist. Cannot standardize city names.")
             return
-        self.loc_standardizer = Standardize_Locations.LocationStandardizer(voronoi_dir)
+        self.voronoi_dir = voronoi_dir
 
         if not os.path.isdir(self.out_dir / self.asn_loc_table):
             os.makedirs(self.out_dir / self.asn_loc_table)
 
+    @property
+    def loc_standardizer(self):
+        """The shared standardizer, loaded on first use."""
+        return Standardize_Locations.shared_standardizer(self.voronoi_dir)
+
     def read_fields(self, sql_str):
         """Reads in the table name and field names from the dbStructure file.
         The dbStructure file should be the standard for the DB,
@@ -51,12 +57,23 @@ class ProcessingRIPEAtlas:
             print("\n\tThere is no data to process. Update the RIPE Atlas data before continuing.")
             return
         print("\tThis takes a while. Status reported every 10 files.")
-        for d in os.listdir(self.in_dir):
+        snapshots = {}
+        for d in sorted(os.listdir(self.in_dir)):
             year = d.split('_')[0]
             month = d.split('_')[1]
             day = d.split('_')[2]
-            self.asof_date = f"{year}-{month}-{day}"
+            snapshots[d] = f"{year}-{month}-{day}"
+
+        asn_loc_file = self.out_dir / self.asn_loc_table / f"{self.data_source}_{self.asn_loc_table}.csv"
+        outputs = {asn_loc_file: self.asn_loc_header}
+        manifest = Tracking_Snapshots.SnapshotManifest(self.out_dir, "RIPEAtlas")
+        plan = manifest.plan(self.in_dir, snapshots, outputs)
+        if plan.up_to_date():
+            print("\tAll of the snapshots are already processed.")
+            return
 
+        for d in plan.process:
+            self.asof_date = snapshots[d]
             for i, f in enumerate(os.listdir(self.in_dir / d)):
                 if (i+1) % 10 == 0:
                     print(f"\tWorking on file {i+1} of {len(os.listdir(self.in_dir / d))}.")
@@ -65,13 +82,14 @@ class ProcessingRIPEAtlas:
                 elif 'probes' in f:
                     self.read_probe_file(self.in_dir / d / f)
 
-        asn_loc_file = self.out_dir / self.asn_loc_table / f"{self.data_source}_{self.asn_loc_table}.csv"
-        self.save_csv(self.asn_loc_list, self.asn_loc_header, asn_loc_file)
+        Saving_Tables.save_table(self.asn_loc_list, self.asn_loc_header, asn_loc_file,
+                replaced_dates=plan.replaced_dates)
+        manifest.save(outputs)
 
     def read_anchor_file(self, f_name):
-        validated = ''
         with open(f_name, 'r') as f:
             raw_data = json.load(f)
+        located = []
         if 'results' in raw_data.keys():
             for r in raw_data['results']:
                 try:
@@ -84,35 +102,14 @@ class ProcessingRIPEAtlas:
                     continue
                 if not as_v4:
                     continue
-                std_loc = {}
-                std_loc = self.loc_standardizer.standardize([lat, lon])
-                if std_loc:
-                    std_lat = std_loc["LATITUDE"]
-                    std_lon = std_loc["LONGITUDE"]
-                    std_city = std_loc["CITY"].replace("'", "''")
-                    try:
-                        std_state = std_loc["STATE"].replace("'", "''")
-                    except:
-                        std_state = None
-                    std_country = std_loc["COUNTRY"]
-                else:
-                    std_lat = 'NULL'
-                    std_lon = 'NULL'
-                    std_city = 'NULL'
-                    std_state = 'NULL'
-                    std_country = 'NULL'
-
-                new_row = [as_v4, lat, lon, self.data_source, validated,
-                        std_lat, std_lon, std_city, std_state, std_country,
-                        self.physical_presence, self.asof_date]
-                #if not new_row in self.city_asn_list:
-                if not new_row in self.asn_loc_list:
-                    self.asn_loc_list.append(new_row)
+                located.append((as_v4, lat, lon))
+        std_locs = self.loc_standardizer.standardize_many([[lat, lon] for _, lat, lon in located])
+        self.add_asn_locs(located, std_locs)
 
     def read_probe_file(self, f_name):
-        validated = ''
         with open(f_name, 'r') as f:
             raw_data = json.load(f)
+        located = []
         if 'results' in raw_data.keys():
             for r in raw_data['results']:
                 try:
@@ -126,42 +123,46 @@ class ProcessingRIPEAtlas:
                 if not as_v4:
                     continue
                 if status == 'Connected':
-                    std_loc = {}
-                    if lat and lon:
-                        std_loc = self.loc_standardizer.standardize([lat, lon])
-                    if std_loc:
-                        std_lat = std_loc["LATITUDE"]
-                        std_lon = std_loc["LONGITUDE"]
-                        std_city = std_loc["CITY"].replace("'", "''")
-                        try:
-                            std_state = std_loc["STATE"].replace("'", "''")
-                        except:
-                            std_state = None
-                        std_country = std_loc["COUNTRY"]
-                    else:
-                        std_lat = 'NULL'
-                        std_lon = 'NULL'
-                        std_city = 'NULL'
-                        std_state = 'NULL'
-                        std_country = 'NULL'
-                    new_row = [as_v4, lat, lon, self.data_source, validated,
-                            std_lat, std_lon, std_city, std_state, std_country,
-                            self.physical_presence, self.asof_date]
-                    if not new_row in self.asn_loc_list:
-                        self.asn_loc_list.append(new_row)
-
-    def save_csv(self, data, header, f_name):
-        print(f"\tSaving to {f_name}.")
-        with open(f_name, 'w') as f:
-            csv_writer = csv.writer(f, delimiter=',')
-            csv_writer.writerow(header)
-            for d in data:
-                csv_writer.writerow(d)
+                    located.append((as_v4, lat, lon))
+        # probes at 0 latitude or longitude are not standardized
+        std_locs = iter(self.loc_standardizer.standardize_many(
+                [[lat, lon] for _, lat, lon in located if lat and lon]))
+        self.add_asn_locs(located, [next(std_locs) if lat and lon else {} for _, lat, lon in located])
+
+    def add_asn_locs(self, located, std_locs):
+        """Adds the (asn, lat, lon) of "located" to asn_loc_list,
+        with the standardized location of each in "std_locs"."""
+        validated = ''
+        for (as_v4, lat, lon), std_loc in zip(located, std_locs):
+            if std_loc:
+                std_lat = std_loc["LATITUDE"]
+                std_lon = std_loc["LONGITUDE"]
+                std_city = std_loc["CITY"]
+                try:
+                    std_state = std_loc["STATE"]
+                except:
+                    std_state = None
+                std_country = std_loc["COUNTRY"]
+                std_approximate = std_loc["APPROXIMATE"]
+            else:
+                std_lat = None
+                std_lon = None
+                std_city = None
+                std_state = None
+                std_country = None
+                std_approximate = None
+
+            new_row = [as_v4, lat, lon, self.data_source, validated,
+                    std_lat, std_lon, std_city, std_state, std_country,
+                    self.physical_presence, self.asof_date, std_approximate]
+            self.asn_loc_list.add(new_row)
+
 
 if __name__ == "__main__":
     print("This script should not be run by itself. Run it through iGDB.py")
     input_dir = Path("../unprocessed/RIPEAtlas")
     output_dir = Path("../processed")
-    my_processor = ProcessingRIPEAtlas(input_dir, output_dir)
+    voronoi_dir = Path("../helper_data/cities_Voronoi")
+    my_processor = ProcessingRIPEAtlas(input_dir, output_dir, voronoi_dir)
     my_processor.run_steps()
 
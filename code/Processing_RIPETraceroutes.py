@@ -1,20 +1,68 @@
 from pathlib import Path
 import os
-import json
-import csv
+import collections
+import concurrent.futures
+import itertools
+import time
+import Streaming_JSON
 from datetime import date
 from datetime import timedelta
 import dbStructure
+import Saving_Tables
+import Tracking_Snapshots
+
+# the progress is printed after this many files
+REPORT_FILES = 25
+# files parsed ahead of the one being written, per process
+PENDING_PER_JOB = 4
+
+def read_traceroute_file(f_name, asof_date, data_source):
+    """Returns the rows of the traceroutes table in one results file.
+    It runs in the worker processes of ProcessingRIPETraceroutes."""
+    rows = []
+    for m in Streaming_JSON.iter_items(f_name):
+        try:
+            src_ip = m['src_addr']
+            dst_ip = m['dst_addr']
+            timestamp = m['timestamp']
+        except:
+            continue
+        for h in m['result']:
+            try:
+                hop = h['hop']
+            except:
+                continue
+            for r in h['result']:
+                try:
+                    hop_ip = r['from']
+                    ttl = r['ttl']
+                    rtt = r['rtt']
+                except:
+                    continue
+                new_row = [src_ip, dst_ip, hop_ip, ttl, rtt,
+                        data_source, timestamp, asof_date]
+                rows.append(new_row)
+    return rows
+
+def format_traceroute_file(f_name, asof_date, data_source, table_format):
+    """Returns the rows of one results file formatted by "table_format"
+    (csv text or a record batch), and their number, so that the worker
+    processes also do the formatting."""
+    rows = read_traceroute_file(f_name, asof_date, data_source)
+    return table_format.format_rows(rows), len(rows)
 
 class ProcessingRIPETraceroutes:
-    def __init__(self, in_dir, out_dir):
+    """Writes the hops of the RIPE Atlas traceroutes to the traceroutes table.
+    The results files are parsed by "jobs" processes (one per CPU by
+    default), and their rows written to the csv file as they are parsed.
+    With "jobs" set to 1 they are parsed in this process."""
+    def __init__(self, in_dir, out_dir, jobs=None):
         self.in_dir = in_dir
-        self.asof_date = ''
+        self.jobs = jobs or os.cpu_count() or 1
         if not os.path.isdir(in_dir):
             print(f"{in_dir} does not exist.")
             return
         self.out_dir =  out_dir
-        self.traceroutes_list = []
         name, fields = self.read_fields(dbStructure.sql_create_traceroutes_table)
         self.traceroutes_header = fields
         self.traceroutes_table = name 
@@ -43,58 +91,68 @@ class ProcessingRIPETraceroutes:
         if not os.path.isdir(self.in_dir):
             print("\n\tThere is no data to process. Update the RIPE Atlas traceroute data.")
             return
-        print("This takes a while. Status reported every 25 files.")
-        for d in os.listdir(self.in_dir):
+        print(f"This takes a while. Status reported every {REPORT_FILES} files.")
+        snapshots = {}
+        for d in sorted(os.listdir(self.in_dir)):
             year = d.split('_')[0]
             month = d.split('_')[1]
             day = d.split('_')[2]
-            self.asof_date = f"{year}-{month}-{day}"
+            snapshots[d] = f"{year}-{month}-{day}"
+
+        trace_file = self.out_dir / self.traceroutes_table / f"{self.data_source}_{self.traceroutes_table}.csv"
+        outputs = {trace_file: self.traceroutes_header}
+        manifest = Tracking_Snapshots.SnapshotManifest(self.out_dir, "RIPETraceroutes")
+        plan = manifest.plan(self.in_dir, snapshots, outputs)
+        if plan.up_to_date():
+            print("\tAll of the snapshots are already processed.")
+            return
 
-            for i, f in enumerate(os.listdir(self.in_dir / d)):
-                if (i+1) % 25 == 0:
-                    print(f"\tWorking on file {i+1} of {len(os.listdir(self.in_dir / d))}.")
+        trace_files = []
+        for d in plan.process:
+            for f in sorted(os.listdir(self.in_dir / d)):
                 if 'measurement_id' in f:
                     continue
                 elif 'traceroute_results' in f:
-                    self.read_traceroute_file(self.in_dir / d / f)
+                    trace_files.append((self.in_dir / d / f, snapshots[d]))
 
-        trace_file = self.out_dir / self.traceroutes_table / f"{self.data_source}_{self.traceroutes_table}.csv"
-        self.save_csv(self.traceroutes_list, self.traceroutes_header, trace_file)
+        with Saving_Tables.TableWriter(trace_file, self.traceroutes_header,
+                replaced_dates=plan.replaced_dates) as writer:
+            self.write_rows(trace_files, writer)
+        manifest.save(outputs)
 
-    def read_traceroute_file(self, f_name):
-        #print(f"Reading: {f_name}")
-        with open(f_name, 'r') as f:
-            tr_dict = json.load(f)
-        for m in tr_dict:
-            try:
-                src_ip = m['src_addr']
-                dst_ip = m['dst_addr']
-                timestamp = m['timestamp']
-            except:
-                continue
-            for h in m['result']:
-                try:
-                    hop = h['hop']
-                except:
-                    continue
-                for r in h['result']:
-                    try:
-                        hop_ip = r['from']
-                        ttl = r['ttl']
-                        rtt = r['rtt']
-                    except:
-                        continue
-                    new_row = [src_ip, dst_ip, hop_ip, ttl, rtt,
-                            self.data_source, timestamp, self.asof_date]
-                    self.traceroutes_list.append(new_row)
+    def format_files(self, trace_files, table_format):
+        """Yields the formatted rows of each traceroute file, in the order of
+        trace_files. With more than one job, the files are parsed in a pool
+        of processes, at most PENDING_PER_JOB per process ahead of the
+        file being yielded, so that only their rows are held in memory."""
+        if self.jobs == 1:
+            for trace in trace_files:
+                yield format_traceroute_file(*trace, self.data_source, table_format)
+            return
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            pending = collections.deque()
+            files = iter(trace_files)
+            for trace in itertools.islice(files, self.jobs * PENDING_PER_JOB):
+                pending.append(executor.submit(format_traceroute_file, *trace, self.data_source, table_format))
+            while pending:
+                result = pending.popleft().result()
+                trace = next(files, None)
+                if trace:
+                    pending.append(executor.submit(format_traceroute_file, *trace, self.data_source, table_format))
+                yield result
 
-    def save_csv(self, data, header, f_name):
-        print(f"\tSaving to {f_name}.")
-        with open(f_name, 'w') as f:
-            csv_writer = csv.writer(f, delimiter=',')
-            csv_writer.writerow(header)
-            for d in data:
-                csv_writer.writerow(d)
+    def write_rows(self, trace_files, writer):
+        """Writes the rows of the traceroute files as they are parsed."""
+        start = time.time()
+        num_rows = 0
+        for i, (formatted, file_rows) in enumerate(self.format_files(trace_files, writer.format), 1):
+            writer.write_formatted(formatted)
+            num_rows += file_rows
+            if i % REPORT_FILES == 0 or i == len(trace_files):
+                elapsed = max(time.time() - start, 1e-6)
+                print(f"\tWorking on file {i} of {len(trace_files)} ", end='')
+                print(f"({i / elapsed:.1f} files/s, {num_rows / elapsed:.0f} rows/s).")
+        return num_rows
 
 if __name__ == "__main__":
     print("This script should not be run by itself. Run it through iGDB.py")
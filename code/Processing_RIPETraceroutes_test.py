@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import json
+import os
+
+import Processing_RIPETraceroutes
+
+
+def write_results(in_dir, snapshot, num_files):
+    os.makedirs(in_dir / snapshot)
+    with open(in_dir / snapshot / 'measurement_ids.json', 'w') as f:
+        json.dump([1, 2], f)
+    for i in range(num_files):
+        measurements = [{"src_addr": f"192.0.2.{i}", "dst_addr": f"198.51.100.{m}", "timestamp": 1700000000 + m,
+                "result": [{"hop": h, "result": [{"from": f"203.0.113.{h}", "ttl": 64 - h, "rtt": h + m / 10},
+                                                  {"x": "*"}]} for h in range(1, 4)]}
+                for m in range(3)]
+        # a measurement without a source is skipped
+        measurements.append({"dst_addr": "198.51.100.9", "result": []})
+        with open(in_dir / snapshot / f'traceroute_results_{i}.json', 'w') as f:
+            json.dump(measurements, f)
+
+
+def test_jobs_parity(tmp_path, monkeypatch):
+    # several batches of pending files in the pool
+    monkeypatch.setattr(Processing_RIPETraceroutes, 'PENDING_PER_JOB', 1)
+    in_dir = tmp_path / 'unprocessed'
+    write_results(in_dir, '2024_01_01', 5)
+    write_results(in_dir, '2024_02_01', 2)
+    saved = []
+    for jobs in [1, 2]:
+        out_dir = tmp_path / f'processed{jobs}'
+        Processing_RIPETraceroutes.ProcessingRIPETraceroutes(in_dir, out_dir, jobs=jobs).run_steps()
+        with open(out_dir / 'traceroutes' / 'RIPEAtlas_traceroutes.csv', 'r') as f:
+            saved.append(f.read().splitlines())
+    # the rows are written in file order whatever the number of processes
+    assert len(saved[0]) == 1 + 7 * 3 * 3
+    assert saved[0] == saved[1]
+    assert saved[0][1] == '192.0.2.0,198.51.100.0,203.0.113.1,63,1.0,RIPEAtlas,1700000000,2024-01-01'
+    assert saved[0][-1].endswith(',2024-02-01')
@@ -2,9 +2,10 @@ import os
 from pathlib import Path
 import geopandas as gpd
 import pandas as pd
-import csv
 import json
 import dbStructure
+import Saving_Tables
+import Standardize_Locations
 
 class ProcessingSubmarine:
     """
@@ -36,6 +37,7 @@ class ProcessingSubmarine:
         if not os.path.isdir(self.out_dir / self.landing_table):
             os.makedirs(self.out_dir / self.landing_table)
 
+        self.help_dir = help_dir
         self.shapefile = help_dir / 'cities_Voronoi.shp'
 
         # this table has the landing points for each cable
@@ -83,7 +85,7 @@ class ProcessingSubmarine:
             self.asof_date = f"{year}-{month}-{day}"
             self.process_cables(self.in_dir / c)
         cables_save_file = self.out_dir / self.cables_table / f"{self.data_source}_{self.cables_table}.csv"
-        self.save_csv(self.cables_list, self.cables_header, cables_save_file)
+        Saving_Tables.save_table(self.cables_list, self.cables_header, cables_save_file)
 
 
         # process the landing points data
@@ -92,14 +94,17 @@ class ProcessingSubmarine:
             month = ld.split('_')[2]
             day = ld.split('_')[3].replace('.json', '')
             self.asof_date = f"{year}-{month}-{day}"
-            self.process_landing(self.in_dir / ld, self.shapefile)
+            self.process_landing(self.in_dir / ld)
         save_file = self.out_dir / self.landing_table / f"{self.data_source}_{self.landing_table}.csv"
-        self.landing_df.to_csv(save_file, index=False)
+        # the missing values of the frame are saved as empty, like to_csv did
+        landing_rows = self.landing_df.astype(object).where(self.landing_df.notna(), None)
+        Saving_Tables.save_table(landing_rows.itertuples(index=False, name=None),
+                list(self.landing_df.columns), save_file)
 
         # process the landing points for each cable
         self.process_cable_landing()
         save_file = self.out_dir / self.cable_landing_table / f"{self.data_source}_{self.cable_landing_table}.csv"
-        self.save_csv(self.cable_landing_list, self.cable_landing_header, save_file)
+        Saving_Tables.save_table(self.cable_landing_list, self.cable_landing_header, save_file)
 
     def process_cables(self, f_name):
         cables_df = gpd.read_file(f_name)
@@ -111,7 +116,7 @@ class ProcessingSubmarine:
             self.cables_list.append([cable_id, cable_name, feat_id, geom.wkt,
                 self.data_source, self.asof_date])
 
-    def process_landing(self, f_name, vor_fname):
+    def process_landing(self, f_name):
         tele_df = gpd.read_file(f_name)
         landing_dict = {}
         landing_dict['city_name'] = []
@@ -150,29 +155,20 @@ class ProcessingSubmarine:
             landing_dict['source'].append(self.data_source)
             landing_dict['asof_date'].append(self.asof_date)
 
-        # add the standard city names
-        l_df = gpd.GeoDataFrame(landing_dict,
-                geometry=gpd.points_from_xy(landing_dict['longitude'], landing_dict['latitude'],
-                    crs="EPSG:4326"))
-        all_df = gpd.read_file(vor_fname)
-        loc_df = all_df[["NAME", "ADM1NAME", "ISO_A2", "geometry"]]
-        join_df = gpd.sjoin(l_df, loc_df, how="inner", predicate='within')
-        landing_df = join_df[["city_name", "state_province", "country", "latitude", "longitude",
-            "source", "asof_date", "NAME", "ADM1NAME", "ISO_A2"]]
-        # format the columns and data for entry to the DB
+        # add the standard city names, the landing points outside
+        # of every Voronoi polygon, even with a nearby city, are left out
+        loc_standardizer = Standardize_Locations.shared_standardizer(self.help_dir)
+        std_locs = loc_standardizer.standardize_many(
+                list(zip(landing_dict['latitude'], landing_dict['longitude'])))
+        landing_df = pd.DataFrame(landing_dict)
+        landing_df['standard_city'] = [l.get("CITY") for l in std_locs]
+        landing_df['standard_state'] = [l.get("STATE") for l in std_locs]
+        landing_df['standard_country'] = [l.get("COUNTRY") for l in std_locs]
+        landing_df = landing_df.loc[[bool(l) and not l["APPROXIMATE"] for l in std_locs]]
         if self.landing_df.empty:
-            self.landing_df = landing_df.rename(columns={"NAME":"standard_city",
-                "ADM1NAME":"standard_state", "ISO_A2":"standard_country"})
+            self.landing_df = landing_df
         else:
-            landing_df = landing_df.rename(columns={"NAME":"standard_city",
-                "ADM1NAME":"standard_state", "ISO_A2":"standard_country"})
             self.landing_df = pd.concat([self.landing_df, landing_df])
-        self.landing_df['city_name'] = self.landing_df.city_name.str.replace("'", "''")
-        self.landing_df['state_province'] = self.landing_df.state_province.str.replace("'", "''")
-        self.landing_df['country'] = self.landing_df.country.str.replace("'", "''")
-        self.landing_df['standard_city'] = self.landing_df.standard_city.str.replace("'", "''")
-        self.landing_df['standard_state'] = self.landing_df.standard_state.str.replace("'", "''")
-        self.landing_df['standard_country'] = self.landing_df.standard_country.str.replace("'", "''")
 
     def process_cable_landing(self):
         for f_name in os.listdir(self.cable_data_dir):
@@ -186,17 +182,17 @@ class ProcessingSubmarine:
             for lp in d['landing_points']:
                 csc = lp['name'].split(',')
                 if len(csc) == 2:
-                    city = csc[0].replace("'", "''")
+                    city = csc[0]
                     state = ''
-                    country= csc[1].strip().replace("'", "''")
+                    country= csc[1].strip()
                 elif len(csc) == 3:
-                    city = csc[0].replace("'", "''")
-                    state = csc[1].replace("'", "''")
-                    country= csc[2].strip().replace("'", "''")
+                    city = csc[0]
+                    state = csc[1]
+                    country= csc[2].strip()
                 elif len(csc) == 4:
-                    city = csc[0].replace("'", "''")
-                    state = csc[1].replace("'", "''")
-                    country= csc[3].strip().replace("'", "''")
+                    city = csc[0]
+                    state = csc[1]
+                    country= csc[3].strip()
                 else:
                     print(f"Error: {csc}")
                     input()
@@ -211,14 +207,6 @@ class ProcessingSubmarine:
                 #input()
                 self.cable_landing_list.append(r)
 
-    def save_csv(self, data, header, f_name):
-        print(f"\tSaving to {f_name}.")
-        with open(f_name, 'w') as f:
-            csv_writer = csv.writer(f, delimiter=',')
-            csv_writer.writerow(header)
-            for d in data:
-                csv_writer.writerow(d)
-
 if __name__ == "__main__":
     print("This script should not be run by itself. Run it through iGDB.py")
     input_dir = Path("../unprocessed/Telegeography")
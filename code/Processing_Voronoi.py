@@ -1,7 +1,7 @@
 from pathlib import Path
 import os
-import csv
 import dbStructure
+import Saving_Tables
 import geopandas as gpd
 
 class ProcessingVoronoi:
@@ -51,11 +51,11 @@ class ProcessingVoronoi:
 
         t_file = f"{self.polygons_table}.csv" 
         polygons_file = self.out_dir / self.polygons_table / t_file
-        self.save_csv(self.polygons_list, self.polygons_header, polygons_file)
+        Saving_Tables.save_table(self.polygons_list, self.polygons_header, polygons_file)
 
         t_file = f"{self.points_table}.csv" 
         points_file = self.out_dir / self.points_table / t_file
-        self.save_csv(self.points_list, self.points_header, points_file)
+        Saving_Tables.save_table(self.points_list, self.points_header, points_file)
 
     def read_shapefile(self, f_name):
         print(f"\tReading {f_name}")
@@ -63,9 +63,9 @@ class ProcessingVoronoi:
         for i,row in loc_df.iterrows():
             lat = row["LATITUDE"]
             lon = row["LONGITUDE"]
-            city_name = row["NAME"].replace("'", "''")
+            city_name = row["NAME"]
             try:
-                province_name = row["ADM1NAME"].replace("'", "''")
+                province_name = row["ADM1NAME"]
             except:
                 province_name = None
             cc = row["ISO_A2"]
@@ -76,14 +76,6 @@ class ProcessingVoronoi:
             points_row = [city_name, province_name, cc, lat, lon]
             self.points_list.append(points_row)
 
-    def save_csv(self, data, header, f_name):
-        print(f"\tSaving to {f_name}.")
-        with open(f_name, 'w') as f:
-            csv_writer = csv.writer(f, delimiter=',')
-            csv_writer.writerow(header)
-            for d in data:
-                csv_writer.writerow(d)
-
 if __name__ == "__main__":
     print("This script should not be run by itself. Run it through iGDB.py")
     input_dir = Path("../helper_data/cities_Voronoi")
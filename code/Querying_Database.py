@@ -1,18 +1,268 @@
 import sqlite3
 from sqlite3 import Error
+import math
 import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+from haversine import haversine
+import dbStructure
+
+# kilometers per degree of latitude, slightly under the 111.2 km of the
+# sphere used by haversine so that radius boxes err on the large side
+KM_PER_DEGREE = 111.0
+
+# settings of the pooled read-only connections
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+
+# rows fetched from the cursor at a time by iter_query
+CHUNK_ROWS = 1000
+
+# virtual machine instructions between two calls of the progress
+# handler that counts the work done by a profiled query
+PROFILE_STEP_OPS = 1000
+
+# statements that only read, and can run on a pooled read-only connection,
+# with the exceptions checked by is_read_statement
+READ_STATEMENTS = ("SELECT", "WITH", "EXPLAIN", "PRAGMA", "VALUES")
+# a WITH statement that ends in one of these writes
+WRITE_KEYWORDS = re.compile(r'\b(INSERT|UPDATE|DELETE|REPLACE)\b')
+
+# memory bound of the shared query result cache
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+# prepared statements kept by each pooled connection, keyed on the SQL text
+CACHED_STATEMENTS = 256
+
+# Named queries, with ? bindings for every value, so that their text is the
+# same on each call and the pooled connections reuse the prepared statement.
+# Parts of a query that depend on the database rather than on the values,
+# such as a text search condition, are {fields} filled in by execute_named.
+named_queries = {
+        'city_by_name_state_country': """SELECT * FROM city_points
+                WHERE city_name = ? AND state_province = ? AND country_code = ?;""",
+        'city_by_name_country': """SELECT * FROM city_points
+                WHERE city_name = ? AND country_code = ?;""",
+        'asn_locations': """SELECT latitude, longitude FROM asn_loc
+                WHERE asn = ? AND latitude IS NOT NULL AND longitude IS NOT NULL;""",
+        # pages of the Serving_API endpoints, continuing after the rowid "after"
+        'asn_locations_page': """SELECT rowid, * FROM asn_loc
+                WHERE asn = ? AND rowid > ?
+                ORDER BY rowid LIMIT ?;""",
+        'ip_asn_dns_by_ip': """SELECT * FROM ip_asn_dns WHERE ip_addr = ?;""",
+        'ip_inference_by_ip': """SELECT * FROM ip_inference WHERE ip_addr = ?;""",
+        'cable_landing_points_page': """SELECT clp.rowid, clp.cable_id, clp.city_name, clp.state_province,
+                    clp.country, clp.active, lp.latitude, lp.longitude,
+                    lp.standard_city, lp.standard_state, lp.standard_country
+                FROM cable_landing_points clp
+                LEFT JOIN landing_points lp ON lp.rowid = (SELECT rowid FROM landing_points
+                    WHERE city_name = clp.city_name AND country = (' ' || clp.country) LIMIT 1)
+                WHERE clp.cable_id = ? AND clp.rowid > ?
+                ORDER BY clp.rowid LIMIT ?;""",
+        'cities_in_bbox_page': """SELECT c.rowid, c.* FROM city_points c
+                JOIN city_points_rtree r ON c.rowid = r.id
+                WHERE r.max_lon >= ? AND r.min_lon <= ?
+                AND r.max_lat >= ? AND r.min_lat <= ?
+                AND c.city_latitude BETWEEN ? AND ? AND c.city_longitude BETWEEN ? AND ?
+                AND r.id > ?
+                ORDER BY r.id LIMIT ?;""",
+        'organization_nodes': """SELECT DISTINCT n.node_name, n.latitude, n.longitude
+                FROM phys_nodes n
+                WHERE {n_condition}
+                ORDER BY n.node_name;""",
+        'organization_edges': """SELECT DISTINCT c.from_node, c.to_node, p.{path_column}
+                FROM phys_nodes fn, phys_nodes tn, phys_nodes_conn c, standard_paths p
+                WHERE {fn_condition}
+                AND {tn_condition}
+                AND c.from_node == fn.node_name
+                AND c.to_node == tn.node_name
+                AND ((p.from_city == fn.city
+                    AND p.from_country == fn.country
+                    AND p.to_city == tn.city
+                    AND p.to_country == tn.country) OR
+                    (p.to_city == fn.city
+                    AND p.to_country == fn.country
+                    AND p.from_city == tn.city
+                    AND p.from_country == tn.country))
+                ORDER BY fn.city;"""
+}
+
+# Each thread keeps one read-only connection per database file, shared by
+# every queryDatabase of that file in the thread.
+_thread_connections = threading.local()
+
+def _forget_read_connections():
+    # a forked child must not use the connections of its parent
+    global _thread_connections
+    _thread_connections = threading.local()
+
+os.register_at_fork(after_in_child=_forget_read_connections)
+
+def file_key(db_file):
+    """Identifies the database file itself, so that a database that was
+    recreated at the same path does not get the old file's connections."""
+    st = os.stat(db_file)
+    return (os.path.abspath(db_file), st.st_dev, st.st_ino)
+
+def is_read_statement(query_str):
+    """Tells whether a statement can run on a read-only connection. A PRAGMA
+    that sets a value, with "=" or an argument, would change the pooled
+    connection, and a WITH may end in a write, so those go to the writer."""
+    query_str = query_str.lstrip().upper()
+    if not query_str.startswith(READ_STATEMENTS):
+        return False
+    if query_str.startswith("PRAGMA"):
+        return '=' not in query_str and '(' not in query_str
+    if query_str.startswith("WITH"):
+        return WRITE_KEYWORDS.search(query_str) is None
+    return True
+
+def open_read_connection(db_file):
+    uri = f"file:{quote(os.path.abspath(db_file))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS)
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+def read_connection(db_file):
+    """Returns the read-only connection of this thread to db_file,
+    opening it on first use. Callers must not close it."""
+    key = file_key(db_file)
+    connections = getattr(_thread_connections, 'connections', None)
+    if connections is None:
+        connections = _thread_connections.connections = {}
+    conn = connections.get(key)
+    if conn is None:
+        conn = open_read_connection(db_file)
+        connections[key] = conn
+    return conn
+
+def close_read_connections(db_file):
+    """Closes the pooled connections of this thread to db_file. Those of
+    other threads are left open, since they may be running a query."""
+    path = os.path.abspath(db_file)
+    own = getattr(_thread_connections, 'connections', {})
+    for key in [k for k in own if k[0] == path]:
+        own.pop(key).close()
+
+def db_version(db_file):
+    """Changes whenever the database file is written or replaced.
+    The modification time is not enough on its own, since it is not
+    always updated, so the change counter that SQLite keeps in the file
+    header, and the state of a write-ahead log, are part of it too."""
+    st = os.stat(db_file)
+    with open(db_file, 'rb') as f:
+        header = f.read(28)
+    change_counter = header[24:28]
+    try:
+        wal = os.stat(f"{db_file}-wal")
+        wal = (wal.st_mtime_ns, wal.st_size)
+    except FileNotFoundError:
+        wal = None
+    return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size, change_counter, wal)
+
+def result_size(rows):
+    """Estimates the memory held by a list of result rows."""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+    return size
+
+class QueryCache:
+    """Keeps the results of read queries, keyed on the normalized SQL,
+    the parameters and the version of the database file, and evicts
+    the least recently used results beyond "max_bytes".
+    Results of a database version that is no longer current are
+    dropped on the next lookup of that database."""
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def key(self, db_file, query_str, params, row_factory):
+        path = os.path.abspath(db_file)
+        version = db_version(db_file)
+        with self.lock:
+            if self.versions.get(path, version) != version:
+                for k in [k for k in self.entries if k[0] == path]:
+                    self.size -= self.entries.pop(k)[1]
+            self.versions[path] = version
+        sql = re.sub(r"\s+", " ", query_str).strip()
+        return (path, version, sql, tuple(params), row_factory)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, rows):
+        size = result_size(rows)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (rows, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self.entries), 'bytes': self.size}
+
+# the cache shared by the queryDatabase objects created with cache=True
+shared_cache = QueryCache()
 
 class queryDatabase:
-    def __init__(self, db_file):
+    """Runs queries against an iGDB database.
+    Reads go through a thread-local pool of read-only connections,
+    which stays open until close() is called, or the end of a with block,
+    in the same thread.
+    With "cache" set to True, or to a QueryCache, the results of read
+    queries are kept and returned again while the database is unchanged."""
+    def __init__(self, db_file, cache=None):
         if not os.path.isfile(db_file):
             print(f"{db_file} is not a file.")
             self.db_file = ""
         else:
             self.db_file = db_file
+        self.cache = shared_cache if cache is True else cache
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.db_file:
+            close_read_connections(self.db_file)
 
     # create database connection
     def create_connection(self):
-        """ create a database connection to a SQLite database """
+        """ create a read-write database connection to a SQLite database """
         conn = None
         try:
             conn = sqlite3.connect(self.db_file)
@@ -21,19 +271,265 @@ class queryDatabase:
             print(e)
         return conn
 
-    def execute_query(self, query_str, row_factory=None):
+    def read_connection(self):
+        """ the pooled read-only connection of this thread """
+        conn = None
+        try:
+            conn = read_connection(self.db_file)
+        except (Error, OSError) as e:
+            print(e)
+        return conn
+
+    def execute_query(self, query_str, row_factory=None, params=()):
+        if is_read_statement(query_str):
+            if self.cache is None:
+                return self.read_query(query_str, row_factory, params) or []
+            try:
+                key = self.cache.key(self.db_file, query_str, params, row_factory)
+            except (OSError, TypeError):
+                # a missing database, or parameters that cannot be a key
+                return self.read_query(query_str, row_factory, params) or []
+            results = self.cache.get(key)
+            if results is None:
+                results = self.read_query(query_str, row_factory, params)
+                if results is not None:
+                    self.cache.put(key, results)
+            # a copy, so that callers changing their list do not change the cache
+            return list(results) if results is not None else []
+
+        # anything else, e.g. an UPDATE given to iGDB.py -q, gets its own connection
         conn = self.create_connection()
         if row_factory:
             conn.row_factory = row_factory
         try:
             c = conn.cursor()
-            c.execute(query_str)
+            c.execute(query_str, params)
+            results = c.fetchall()
+            conn.commit()
         except Error as e:
             print(e)
-        results = c.fetchall()
+            results = []
+        conn.close()
         return results
 
-    def execute_many(self, query_str: str, data):
+    def read_query(self, query_str, row_factory=None, params=()):
+        """Runs a read query on the pooled connection.
+        Returns None, rather than the empty list, when it fails."""
+        conn = self.read_connection()
+        if conn is None:
+            return None
+        c = conn.cursor()
+        if row_factory:
+            c.row_factory = row_factory
+        try:
+            c.execute(query_str, params)
+        except Error as e:
+            print(e)
+            return None
+        return c.fetchall()
+
+    def execute_named(self, name, params=(), row_factory=None, **parts):
+        """Runs the query "name" of named_queries with "params" bound to its
+        ? placeholders. "parts" fill in the {fields} of the query, and must
+        not hold values given by the user."""
+        query_str = named_queries[name]
+        if parts:
+            query_str = query_str.format(**parts)
+        return self.execute_query(query_str, row_factory, params)
+
+    def query_plan(self, query_str, params=()):
+        """Returns the steps of EXPLAIN QUERY PLAN for a query, as dicts with
+        their "detail" text, and whether they are a full table scan
+        ("full_scan") or build a temporary B-tree ("temp_btree")."""
+        results = self.read_query(f"EXPLAIN QUERY PLAN {query_str}", params=params) or []
+        plan = []
+        for r in results:
+            detail = r[3]
+            plan.append({'id': r[0], 'parent': r[1], 'detail': detail,
+                         'full_scan': bool(re.match(r"SCAN \w+$", detail)),
+                         'temp_btree': 'TEMP B-TREE' in detail})
+        return plan
+
+    def profile_query(self, query_str, params=(), header=False, limit=None):
+        """Runs a query like iter_query, and returns (rows, profile).
+        "rows" is the generator of the result, and "profile" is a dict with
+        the query plan, that gets the wall time ("seconds"), the number of
+        rows returned, the rows of the fully scanned tables ("rows_scanned")
+        and the virtual machine instructions run ("vm_steps") once all the
+        rows have been read."""
+        profile = {'plan': self.query_plan(query_str, params)}
+
+        def rows():
+            read_only = is_read_statement(query_str)
+            conn = self.read_connection() if read_only else None
+            steps = [0]
+
+            def count_steps():
+                steps[0] += 1
+                return 0
+
+            if conn is not None:
+                conn.set_progress_handler(count_steps, PROFILE_STEP_OPS)
+            start = time.perf_counter()
+            returned = 0
+            try:
+                for i, row in enumerate(self.iter_query(query_str, params, header=header, limit=limit)):
+                    if not (header and i == 0):
+                        returned += 1
+                    yield row
+            finally:
+                profile['seconds'] = time.perf_counter() - start
+                if conn is not None:
+                    conn.set_progress_handler(None, 0)
+                profile['rows_returned'] = returned
+                profile['vm_steps'] = steps[0] * PROFILE_STEP_OPS if conn is not None else None
+                profile['rows_scanned'] = self.scanned_rows(query_str, profile['plan'])
+
+        return rows(), profile
+
+    def scanned_rows(self, query_str, plan):
+        """The number of rows of the tables that a plan scans in full,
+        which bounds the rows the query reads from them."""
+        aliases = self.table_aliases(query_str)
+        total = 0
+        for step in plan:
+            if step['full_scan']:
+                table = aliases.get(step['detail'].split()[1])
+                if table:
+                    total += self.read_query(f"SELECT count(*) FROM {table}")[0][0]
+        return total
+
+    def table_aliases(self, query_str):
+        """Maps the names and aliases used in a query to the tables of the database."""
+        tables = {r[0].lower(): r[0] for r in self.read_query(
+                "SELECT name FROM sqlite_master WHERE type IN ('table', 'view')") or []}
+        aliases = {}
+        clause = r"\b(?:FROM|JOIN)\s+(.*?)(?=\bWHERE\b|\bJOIN\b|\bON\b|\bGROUP\b|\bORDER\b|\bLIMIT\b|\bUNION\b|\)|;|$)"
+        for match in re.finditer(clause, query_str, re.IGNORECASE | re.DOTALL):
+            for part in match.group(1).split(','):
+                words = [w for w in part.split() if w.upper() not in ('AS', 'INNER', 'LEFT', 'CROSS', 'OUTER', 'NATURAL')]
+                if words and words[0].lower() in tables:
+                    table = tables[words[0].lower()]
+                    aliases[words[0]] = table
+                    if len(words) > 1:
+                        aliases[words[1]] = table
+        return aliases
+
+    def suggest_indexes(self, query_str, params=()):
+        """Proposes CREATE INDEX statements for the tables that the plan of
+        a query scans in full, or for which SQLite builds an automatic index.
+        The candidate columns are the ones the query compares, and a
+        candidate is only proposed if the plan of the query uses it once
+        it is added to an empty copy of the schema."""
+        plan = self.query_plan(query_str, params)
+        aliases = self.table_aliases(query_str)
+        single_table = len(set(aliases.values())) == 1
+        candidates = []
+        for step in plan:
+            detail = step['detail']
+            automatic = re.match(r"SEARCH (\w+) USING AUTOMATIC (?:COVERING |PARTIAL )*INDEX \((.*)\)", detail)
+            if automatic:
+                table = aliases.get(automatic.group(1))
+                columns = re.findall(r"(\w+)[=<>]", automatic.group(2))
+            elif step['full_scan']:
+                alias = detail.split()[1]
+                table = aliases.get(alias)
+                columns = self.compared_columns(query_str, alias, table, single_table)
+            else:
+                continue
+            if table and columns and (table, columns) not in candidates:
+                candidates.append((table, columns))
+
+        suggestions = []
+        schema = self.schema_copy()
+        for table, columns in candidates:
+            name = f"{table}_{'_'.join(columns)}"
+            create = f"CREATE INDEX {name} ON {table}({', '.join(columns)});"
+            try:
+                schema.execute(create)
+                new_plan = schema.execute(f"EXPLAIN QUERY PLAN {query_str}", params).fetchall()
+                schema.execute(f"DROP INDEX {name}")
+            except Error:
+                continue
+            if any(f"INDEX {name} " in r[3] + " " for r in new_plan):
+                suggestions.append(create)
+        schema.close()
+        return suggestions
+
+    def compared_columns(self, query_str, alias, table, single_table):
+        """The columns of "table" that a query compares to a value,
+        the ones compared for equality first."""
+        if not table:
+            return []
+        columns = {r[1].lower(): r[1] for r in self.read_query(f"PRAGMA table_info({table})") or []}
+        prefix = rf"\b{re.escape(alias)}\." if not single_table else rf"(?:\b{re.escape(alias)}\.)?"
+        equal, ranged, joined = [], [], []
+        for column, op, other in re.findall(
+                rf"{prefix}(\w+)\s*(==|=|\bIN\b|\bIS\b|<=|>=|<|>|\bBETWEEN\b)\s*(\w+\.\w+)?",
+                query_str, re.IGNORECASE):
+            column = columns.get(column.lower())
+            if not column or column in equal + ranged + joined:
+                continue
+            if other:
+                # compared to a column of another table
+                joined.append(column)
+            elif op.upper() in ('=', '==', 'IN', 'IS'):
+                equal.append(column)
+            else:
+                ranged.append(column)
+        # an index can serve the equality columns and one range after them,
+        # and the join columns are only worth it when nothing else filters
+        return equal + ranged[:1] if equal or ranged else joined
+
+    def schema_copy(self):
+        """An in-memory database with the tables and indexes of this one, but no rows."""
+        schema = sqlite3.connect(":memory:")
+        for (sql,) in self.read_query("SELECT sql FROM sqlite_master WHERE sql IS NOT NULL") or []:
+            try:
+                schema.execute(sql)
+            except Error:
+                # the shadow tables of virtual tables exist once those are created
+                pass
+        return schema
+
+    def iter_query(self, query_str, params=(), chunk_size=CHUNK_ROWS, header=False, limit=None):
+        """Yields the rows of a query as they are fetched from the cursor,
+        "chunk_size" rows at a time, so that memory use does not grow with
+        the size of the result. With "header", the tuple of column names is
+        yielded first. At most "limit" rows are yielded."""
+        read_only = is_read_statement(query_str)
+        conn = self.read_connection() if read_only else self.create_connection()
+        if conn is None:
+            return
+        c = conn.cursor()
+        try:
+            c.execute(query_str, params)
+        except Error as e:
+            print(e)
+            if not read_only:
+                conn.close()
+            return
+        try:
+            if header:
+                yield tuple(d[0] for d in c.description) if c.description else ()
+            remaining = limit
+            while remaining is None or remaining > 0:
+                rows = c.fetchmany(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not rows:
+                    break
+                yield from rows
+                if remaining is not None:
+                    remaining -= len(rows)
+        finally:
+            c.close()
+            if not read_only:
+                conn.commit()
+                conn.close()
+
+    def execute_many(self, query_str: str, data, raise_errors=False):
+        """Runs a write for each row of "data" in one transaction. An error
+        rolls all of them back and is printed, or raised with "raise_errors",
+        e.g. for a build stage that must not be recorded as done."""
         conn = self.create_connection()
         try:
             c = conn.cursor()
@@ -41,6 +537,103 @@ class queryDatabase:
             conn.commit()
         except Error as e:
             print(e)
+            if raise_errors:
+                raise
+        finally:
+            conn.close()
+
+    def has_spatial_index(self, table):
+        results = self.execute_query("SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                params=(f"{table}_rtree",))
+        return len(results) > 0
+
+    def has_column(self, table, column):
+        results = self.execute_query(f"PRAGMA table_info({table})")
+        return column in [r[1] for r in results]
+
+    def find_in_bbox(self, table, min_lat, min_lon, max_lat, max_lon, row_factory=None):
+        """Returns the rows of a spatial table (see dbStructure.spatial_indexes)
+        whose point, or path bounding box, intersects the given box.
+        The lookup goes through the table's R*Tree index. Its boxes are
+        stored as 32 bit floats, rounded outwards, so points are checked
+        again against their own coordinates."""
+        query = f"""SELECT t.* FROM {table} t JOIN {table}_rtree r ON t.rowid = r.id
+                WHERE r.max_lon >= ? AND r.min_lon <= ?
+                AND r.max_lat >= ? AND r.min_lat <= ?"""
+        params = (min_lon, max_lon, min_lat, max_lat)
+        columns = dbStructure.spatial_indexes[table]
+        if len(columns) == 2:
+            lon_column, lat_column = columns
+            query += f"""
+                AND t.{lat_column} BETWEEN ? AND ? AND t.{lon_column} BETWEEN ? AND ?"""
+            params += (min_lat, max_lat, min_lon, max_lon)
+        return self.execute_query(query + ";", row_factory, params)
+
+    def find_within_radius(self, table, lat, lon, radius_km, row_factory=None):
+        """Returns the rows of a spatial table within radius_km of (lat, lon).
+        Point tables are filtered by their exact great circle distance.
+        For path tables, the rows whose bounding box comes within the radius
+        are returned, so the caller still needs to measure the geometry."""
+        min_lat, min_lon, max_lat, max_lon = radius_to_bbox(lat, lon, radius_km)
+        results = self.find_in_bbox(table, min_lat, min_lon, max_lat, max_lon, row_factory)
+        columns = dbStructure.spatial_indexes[table]
+        if len(columns) == 1:
+            return results
+        lon_column, lat_column = columns
+        if row_factory != sqlite3.Row:
+            lon_column = self.column_index(table, lon_column)
+            lat_column = self.column_index(table, lat_column)
+        nearby = []
+        for r in results:
+            if haversine((lat, lon), (r[lat_column], r[lon_column])) <= radius_km:
+                nearby.append(r)
+        return nearby
+
+    def has_text_index(self, table):
+        results = self.execute_query("SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                params=(f"{table}_fts",))
+        return len(results) > 0
+
+    def text_search_condition(self, table, text, alias=None):
+        """Returns (condition, params) selecting the rows of a table of
+        dbStructure.text_indexes whose text column contains "text",
+        ignoring case. The condition goes through the table's FTS5 index,
+        or falls back to LIKE when there is no index or "text" is shorter
+        than the three characters of a trigram."""
+        column = dbStructure.text_indexes[table]
+        prefix = f"{alias}." if alias else ""
+        if len(text) >= 3 and self.has_text_index(table):
+            # a quoted FTS5 string matches the text as is
+            match = '"' + text.replace('"', '""') + '"'
+            return (f"{prefix}rowid IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?)",
+                    (match,))
+        return f"{prefix}{column} LIKE ?", (f"%{text}%",)
+
+    def search_text(self, table, text, row_factory=None):
+        """Returns the rows of a table of dbStructure.text_indexes
+        whose text column contains "text"."""
+        condition, params = self.text_search_condition(table, text)
+        return self.execute_query(f"SELECT * FROM {table} WHERE {condition};", row_factory, params)
+
+    def column_index(self, table, column):
+        results = self.execute_query(f"PRAGMA table_info({table})")
+        return [r[1] for r in results].index(column)
+
+def radius_to_bbox(lat, lon, radius_km):
+    """Returns (min_lat, min_lon, max_lat, max_lon) of a box that contains
+    every point within radius_km of (lat, lon)."""
+    lat_delta = radius_km / KM_PER_DEGREE
+    min_lat = max(lat - lat_delta, -90.0)
+    max_lat = min(lat + lat_delta, 90.0)
+    # the box is widest at the latitude closest to a pole
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat <= 0 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180:
+        return min_lat, -180.0, max_lat, 180.0
+    lon_delta = radius_km / (KM_PER_DEGREE * cos_lat)
+    if lon - lon_delta < -180 or lon + lon_delta > 180:
+        # the box crosses the antimeridian
+        return min_lat, -180.0, max_lat, 180.0
+    return min_lat, lon - lon_delta, max_lat, lon + lon_delta
 
 if __name__ == "__main__":
     print("You should not run this script by itself. It should be called from iGDB.py")
@@ -55,4 +648,3 @@ if __name__ == "__main__":
         my_querier = queryDatabase(f_name)
         my_results = my_querier.execute_query(query)
         print(my_results)
-
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import Creating_Database
+import Querying_Database
+
+
+def write_csv(f_name, lines):
+    os.makedirs(f_name.parent, exist_ok=True)
+    with open(f_name, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def setup_database(tmp_path):
+    processed = tmp_path / 'processed'
+    write_csv(processed / 'city_points' / 'city_points.csv',
+            ['city_name,state_province,country_code,city_latitude,city_longitude',
+             'Chicago,Illinois,US,41.85,-87.65', 'Milwaukee,Wisconsin,US,43.04,-87.91',
+             'Madison,Wisconsin,US,43.07,-89.40', 'Madrid,,ES,40.42,-3.70',
+             # just outside of the boxes below, but inside of their 32 bit R*Tree entry
+             'Edge,,US,44.0000001,-88.0'])
+    db_creator = Creating_Database.CreatingDatabase(processed, tmp_path / 'database', 'test.db',
+            jobs=1, incremental=False)
+    db_creator.build_spatial_indexes(['city_points'])
+    return db_creator.db_file
+
+
+def city_names(results):
+    return sorted(r['city_name'] for r in results)
+
+
+def test_find_in_bbox(tmp_path):
+    db_file = setup_database(tmp_path)
+    with Querying_Database.queryDatabase(db_file) as querier:
+        results = querier.find_in_bbox('city_points', 40, -90, 44, -87, sqlite3.Row)
+        assert city_names(results) == ['Chicago', 'Madison', 'Milwaukee']
+        assert querier.find_in_bbox('city_points', 0, 0, 1, 1) == []
+
+        # the named page query is rechecked the same way
+        rows = querier.execute_named('cities_in_bbox_page',
+                (-90, -87, 40, 44, 40, 44, -90, -87, 0, 10), sqlite3.Row)
+        assert city_names(rows) == ['Chicago', 'Madison', 'Milwaukee']
+
+
+def test_find_within_radius(tmp_path):
+    db_file = setup_database(tmp_path)
+    with Querying_Database.queryDatabase(db_file) as querier:
+        # Milwaukee is about 134 km from Chicago, Madison about 200 km
+        results = querier.find_within_radius('city_points', 41.85, -87.65, 150, sqlite3.Row)
+        assert city_names(results) == ['Chicago', 'Milwaukee']
+        results = querier.find_within_radius('city_points', 41.85, -87.65, 10)
+        assert [r[0] for r in results] == ['Chicago']
+
+
+def test_search_text(tmp_path):
+    processed = tmp_path / 'processed'
+    write_csv(processed / 'asn_org' / 'PDB_asn_org.csv',
+            ['asn,organization,source,asof_date', '64500,Example Networks,PDB,2024-01-01',
+             '64501,"Big ""Quoted"" Co",PDB,2024-01-01', '64502,ExampleCo,PDB,2024-01-01', '64503,IX,PDB,2024-01-01'])
+    db_creator = Creating_Database.CreatingDatabase(processed, tmp_path / 'database', 'test.db',
+            jobs=1, incremental=False)
+    db_creator.build_text_indexes(['asn_org'])
+    with Querying_Database.queryDatabase(db_creator.db_file) as querier:
+        assert querier.has_text_index('asn_org')
+        # the trigram index matches substrings, ignoring case
+        results = querier.search_text('asn_org', 'xample', sqlite3.Row)
+        assert sorted(r['asn'] for r in results) == [64500, 64502]
+        assert [r['asn'] for r in querier.search_text('asn_org', 'NETWORKS', sqlite3.Row)] == [64500]
+        # the text is matched as is, not as an FTS5 query
+        assert [r[0] for r in querier.search_text('asn_org', '"Quoted" Co')] == [64501]
+        assert querier.search_text('asn_org', 'Networks OR IX') == []
+        # shorter than a trigram, it falls back to LIKE
+        assert [r[0] for r in querier.search_text('asn_org', 'ix')] == [64503]
+
+
+def test_read_only_pool(tmp_path):
+    db_file = setup_database(tmp_path)
+    querier = Querying_Database.queryDatabase(db_file)
+    conn = querier.read_connection()
+    # the pooled connection is read only, and shared by the queriers of a thread
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM city_points")
+    assert Querying_Database.queryDatabase(db_file).read_connection() is conn
+    # writes go to a connection of their own
+    querier.execute_query("DELETE FROM city_points WHERE city_name = 'Edge'")
+    assert len(querier.execute_query("SELECT * FROM city_points")) == 4
+
+    # close() only closes the connection of its own thread
+    other = []
+    thread = threading.Thread(target=lambda: other.append(Querying_Database.queryDatabase(db_file).read_connection()))
+    thread.start()
+    thread.join()
+    querier.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    assert other[0].execute("SELECT count(*) FROM city_points").fetchall() == [(4,)]
+    assert querier.read_connection() is not conn
+
+
+def test_named_queries(tmp_path):
+    processed = tmp_path / 'processed'
+    write_csv(processed / 'city_points' / 'city_points.csv',
+            ['city_name,state_province,country_code,city_latitude,city_longitude',
+             "Coeur d'Alene,Idaho,US,47.68,-116.78", 'Portland,Oregon,US,45.52,-122.68',
+             'Portland,Maine,US,43.66,-70.26'])
+    write_csv(processed / 'asn_loc' / 'PDB_asn_loc.csv',
+            ['asn,latitude,longitude,source', '64500,38.72,-9.14,PDB', '64500,,,PDB'])
+    db_creator = Creating_Database.CreatingDatabase(processed, tmp_path / 'database', 'test.db',
+            jobs=1, incremental=False)
+    with Querying_Database.queryDatabase(db_creator.db_file) as querier:
+        # values with quotes are bound, not pasted into the SQL
+        results = querier.execute_named('city_by_name_country', ("Coeur d'Alene", 'US'))
+        assert [r[1] for r in results] == ['Idaho']
+        assert len(querier.execute_named('city_by_name_country', ('Portland', 'US'))) == 2
+        results = querier.execute_named('city_by_name_state_country', ('Portland', 'Maine', 'US'))
+        assert [r[3] for r in results] == [43.66]
+        assert querier.execute_named('city_by_name_country', ("' OR 1=1 --", 'US')) == []
+
+        # the locations without coordinates are left out
+        assert querier.execute_named('asn_locations', (64500,)) == [(38.72, -9.14)]
+
+
+def test_query_cache(tmp_path):
+    db_file = setup_database(tmp_path)
+    cache = Querying_Database.QueryCache()
+    querier = Querying_Database.queryDatabase(db_file, cache=cache)
+    query = "SELECT city_name FROM city_points WHERE country_code = ? ORDER BY rowid"
+    first = querier.execute_query(query, params=('US',))
+    # the same query, in other whitespace, is a hit
+    assert querier.execute_query(query.replace(' ', '  '), params=('US',)) == first
+    assert cache.stats()['hits'] == 1
+    querier.execute_query(query, params=('ES',))
+    assert cache.stats()['misses'] == 2
+
+    # a write changes db_version, which drops the cached results of the file
+    version = Querying_Database.db_version(db_file)
+    querier.execute_query("DELETE FROM city_points WHERE city_name = 'Edge'")
+    assert Querying_Database.db_version(db_file) != version
+    assert querier.execute_query(query, params=('US',)) == first[:-1]
+    assert cache.stats()['entries'] == 1
+
+    # least recently used results are evicted beyond max_bytes
+    sizes = {c: Querying_Database.result_size(querier.execute_query(query, params=(c,))) for c in ['US', 'ES']}
+    cache = Querying_Database.QueryCache(max_bytes=sizes['US'] + sizes['ES'])
+    querier = Querying_Database.queryDatabase(db_file, cache=cache)
+    for country in ['US', 'ES', 'US', 'PT']:
+        querier.execute_query(query, params=(country,))
+    assert [k[3] for k in cache.entries] == [('US',), ('PT',)]
+
+
+def test_profile_query(tmp_path, monkeypatch):
+    # a count of the steps of a query this small needs a finer handler
+    monkeypatch.setattr(Querying_Database, 'PROFILE_STEP_OPS', 10)
+    db_file = setup_database(tmp_path)
+    querier = Querying_Database.queryDatabase(db_file)
+    query = "SELECT city_name FROM city_points WHERE country_code = ?"
+    rows, profile = querier.profile_query(query, params=('US',), header=True)
+    assert list(rows) == [('city_name',), ('Chicago',), ('Milwaukee',), ('Madison',), ('Edge',)]
+    # the numbers are filled in once the rows have been read
+    assert profile['rows_returned'] == 4
+    assert profile['rows_scanned'] == 5
+    assert profile['vm_steps'] > 0
+    assert [step['full_scan'] for step in profile['plan']] == [True]
+
+    assert querier.suggest_indexes(query, ('US',)) == \
+            ["CREATE INDEX city_points_country_code ON city_points(country_code);"]
+    # the rowid lookup needs no index
+    assert querier.suggest_indexes("SELECT * FROM city_points WHERE rowid = 1") == []
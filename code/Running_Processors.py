@@ -0,0 +1,146 @@
+import concurrent.futures
+import contextlib
+import os
+import sys
+import time
+import traceback
+from pathlib import Path
+import Saving_Tables
+import Standardize_Locations
+
+class Processor:
+    """A source processor, run as processor_class(*args).run_steps()."""
+    def __init__(self, name, processor_class, args=()):
+        self.name = name
+        self.processor_class = processor_class
+        self.args = args
+
+def init_worker(output_format, voronoi_dir=None):
+    """Sets up a process that runs processors, whichever way it was
+    started: the format that they save their tables in and, with a
+    "voronoi_dir", the standardizer that they share. Returns the
+    standardizer, or None. If it cannot be loaded here, each processor
+    that needs it tries again when it starts, so only those fail."""
+    Saving_Tables.set_output_format(output_format)
+    if voronoi_dir is None or not os.path.isfile(Path(voronoi_dir) / 'cities_Voronoi.shp'):
+        return None
+    try:
+        return Standardize_Locations.shared_standardizer(voronoi_dir)
+    except Exception as e:
+        print(f"Could not load the Voronoi map from {voronoi_dir}: {e!r}")
+        return None
+
+def run_processor(processor, log_file=None):
+    """Runs "processor" and returns its run time in seconds. With a
+    "log_file", everything it prints goes there instead of the console,
+    and it cannot wait for input."""
+    start = time.time()
+    if log_file is None:
+        processor.processor_class(*processor.args).run_steps()
+        return time.time() - start
+    with open(log_file, 'w') as log, open(os.devnull) as devnull, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        stdin = sys.stdin
+        sys.stdin = devnull
+        try:
+            processor.processor_class(*processor.args).run_steps()
+        except SystemExit as e:
+            # would otherwise end iGDB.py when it reaches the pool's caller
+            raise RuntimeError(f"exited with status {e.code}")
+        except BaseException:
+            traceback.print_exc()
+            raise
+        finally:
+            sys.stdin = stdin
+    return time.time() - start
+
+class RunningProcessors:
+    """Runs the source processors of iGDB.py -p. They read separate input
+    directories and write separate csv files, so with "jobs" above one
+    they run in a pool of processes, each printing to its own log file in
+    "log_path". A processor that fails does not stop the others.
+
+    "output_format" and "voronoi_dir" are handed to init_worker, in this
+    process and in each process of the pool, so that the processors do
+    not depend on the state of a forked parent."""
+    def __init__(self, processors, jobs=1, log_path=None, output_format='csv', voronoi_dir=None):
+        self.processors = processors
+        self.jobs = jobs
+        self.log_path = log_path
+        self.output_format = output_format
+        self.voronoi_dir = voronoi_dir
+        self.timings = {}
+        self.log_files = {}
+        self.loc_standardizer = None
+
+    def run_steps(self):
+        """Runs the processors and returns the names of those that failed."""
+        start = time.time()
+        # loaded before the pool, so that forked processes inherit it
+        self.loc_standardizer = init_worker(self.output_format, self.voronoi_dir)
+        if self.jobs > 1:
+            failed = self.run_parallel()
+        else:
+            failed = self.run_sequential()
+        self.print_summary(time.time() - start, failed)
+        return failed
+
+    def run_sequential(self):
+        failed = []
+        for i, p in enumerate(self.processors):
+            if i:
+                print()
+            try:
+                self.timings[p.name] = run_processor(p)
+            except Exception as e:
+                traceback.print_exc()
+                print(f"Processor {p.name} failed: {e}")
+                failed.append(p.name)
+        return failed
+
+    def run_parallel(self):
+        if not os.path.isdir(self.log_path):
+            os.makedirs(self.log_path)
+        failed = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs, initializer=init_worker,
+                initargs=(self.output_format, self.voronoi_dir)) as executor:
+            running = {}
+            for p in self.processors:
+                self.log_files[p.name] = self.log_path / f"{p.name}.log"
+                print(f"Running processor {p.name}, logging to {self.log_files[p.name]}.")
+                running[executor.submit(run_processor, p, self.log_files[p.name])] = p.name
+            for future in concurrent.futures.as_completed(running):
+                name = running[future]
+                try:
+                    self.timings[name] = future.result()
+                except Exception as e:
+                    print(f"Processor {name} failed: {e!r}. The end of its log:")
+                    self.print_log_tail(name)
+                    failed.append(name)
+                    continue
+                print(f"Processor {name} finished in {self.timings[name]:.1f} seconds.")
+        return failed
+
+    def print_log_tail(self, name, num_lines=10):
+        try:
+            with open(self.log_files[name], 'r') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines[-num_lines:]:
+            print(f"\t{line.rstrip()}")
+
+    def print_summary(self, elapsed, failed):
+        print("\nProcessor timings:")
+        for p in self.processors:
+            if p.name in failed:
+                status = "failed"
+            else:
+                status = f"{self.timings[p.name]:.1f} s"
+            if p.name in self.log_files:
+                status += f" (log: {self.log_files[p.name]})"
+            print(f"\t{p.name}: {status}")
+        print(f"Finished processing in {elapsed:.1f} seconds.")
+
+if __name__ == "__main__":
+    print("This script should not be run by itself. It should be called from iGDB.py")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import os
+
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+import shapely
+
+import Running_Processors
+import Saving_Tables
+import Standardize_Locations
+
+
+class ProcessingTest:
+    # saves the city of its point, in the output format of its process
+    def __init__(self, out_dir, voronoi_dir, lat, lon):
+        self.out_dir = out_dir
+        self.voronoi_dir = voronoi_dir
+        self.point = [lat, lon]
+
+    def run_steps(self):
+        preloaded = os.path.realpath(self.voronoi_dir) in Standardize_Locations._shared_standardizers
+        city = Standardize_Locations.shared_standardizer(self.voronoi_dir).standardize(self.point)["CITY"]
+        f_name = self.out_dir / 'asn_org' / f"{city}_asn_org.csv"
+        os.makedirs(f_name.parent, exist_ok=True)
+        Saving_Tables.save_table([[os.getpid(), city, str(preloaded), None]],
+                ['asn', 'organization', 'source', 'asof_date'], f_name)
+
+
+class ProcessingFailure:
+    def __init__(self, out_dir):
+        pass
+
+    def run_steps(self):
+        raise ValueError("no input")
+
+
+def write_voronoi(voronoi_dir):
+    os.makedirs(voronoi_dir)
+    polygons = [shapely.box(0, 0, 1, 1), shapely.box(2, 0, 3, 1)]
+    table = pa.table({"geometry": pa.array(shapely.to_wkb(polygons), type=pa.binary()),
+            "LATITUDE": [0.5, 0.5], "LONGITUDE": [0.5, 2.5],
+            "NAME": ["West", "East"], "ADM1NAME": [None, None], "ISO_A2": ["AA", "BB"]})
+    # an empty shapefile, so that the runner loads the standardizer,
+    # and the artifact of its source version
+    (voronoi_dir / 'cities_Voronoi.shp').write_bytes(b'')
+    table = table.replace_schema_metadata({"source_version": Standardize_Locations.source_version(voronoi_dir)})
+    feather.write_feather(table, voronoi_dir / Standardize_Locations.ARTIFACT_NAME)
+
+
+def test_spawned_processors(tmp_path, monkeypatch):
+    voronoi_dir = tmp_path / 'cities_Voronoi'
+    write_voronoi(voronoi_dir)
+    processors = [Running_Processors.Processor(name, ProcessingTest, (tmp_path, voronoi_dir, 0.5, lon))
+            for name, lon in [('West', 0.5), ('East', 2.5)]]
+    processors.append(Running_Processors.Processor('Failure', ProcessingFailure, (tmp_path,)))
+    # workers that do not inherit the state of this process
+    monkeypatch.setattr(multiprocessing, 'get_context',
+            lambda method=None, get_context=multiprocessing.get_context: get_context('spawn'))
+    monkeypatch.setattr(Saving_Tables, 'output_format', 'csv')
+    runner = Running_Processors.RunningProcessors(processors, 2, tmp_path / 'logs', 'parquet', voronoi_dir)
+    assert runner.run_steps() == ['Failure']
+    assert runner.loc_standardizer is not None
+    assert 'no input' in (tmp_path / 'logs' / 'Failure.log').read_text()
+
+    for city in ['West', 'East']:
+        table = pq.read_table(tmp_path / 'asn_org' / f"{city}_asn_org.parquet").to_pylist()
+        # each worker was set up by the initializer
+        assert table[0]['asn'] != os.getpid()
+        assert table[0]['organization'] == city
+        assert table[0]['source'] == 'True'
@@ -0,0 +1,226 @@
+import csv
+import io
+import os
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import dbStructure as db
+from Exporting_Parquet import arrow_types
+
+OUTPUT_FORMATS = ['csv', 'parquet']
+# rows formatted, and written as one parquet row group, at a time
+BATCH_ROWS = 100000
+# the format that the processors write their tables in, set by iGDB.py -p
+output_format = 'csv'
+
+def set_output_format(new_format):
+    global output_format
+    if new_format not in OUTPUT_FORMATS:
+        raise ValueError(f"{new_format} is not one of {OUTPUT_FORMATS}.")
+    output_format = new_format
+
+def saved_file(f_name):
+    """Returns the file that the table of csv file name "f_name" was last
+    saved to, in any of the output formats, or None."""
+    for file_format in OUTPUT_FORMATS:
+        other_file = Path(f_name).with_suffix(f".{file_format}")
+        if os.path.isfile(other_file):
+            return other_file
+    return None
+
+def declared_types(table_name):
+    """Returns {column name: declared type} of a dbStructure table, in lower case."""
+    types = {}
+    for row in db.tables[table_name].split('\n')[1:-1]:
+        name, column_type = row.split()[:2]
+        types[name.lower()] = column_type.rstrip(',').lower()
+    return types
+
+class TableFormat:
+    """Turns the rows of a processed table into csv text, or into an Arrow
+    record batch with the column types of dbStructure. It is small enough
+    to be sent to the processes that format rows in parallel.
+
+    For parquet, typed_value does the same as the load of a csv file:
+    text is kept as it is, and 'NULL', or '' in a numeric column, becomes
+    a null. Unlike that load, which keeps such values as text, a value of
+    a numeric column that is not a number is also saved as a null, and
+    counted in "dropped"."""
+    def __init__(self, header, table_name, file_format=None):
+        self.header = header
+        self.file_format = file_format or output_format
+        types = declared_types(table_name)
+        self.schema = pa.schema([(h, arrow_types.get(types.get(h.lower()), pa.string()))
+                for h in header])
+        # values that did not fit the type of their column, by column,
+        # as counted in the process that formatted them
+        self.dropped = {}
+
+    def suffix(self):
+        return f".{self.file_format}"
+
+    def typed_value(self, value, arrow_type, column):
+        if value is None or value == 'NULL':
+            return None
+        if arrow_type == pa.string():
+            return value if isinstance(value, str) else str(value)
+        if value == '':
+            return None
+        try:
+            if arrow_type != pa.int64():
+                return float(value)
+            try:
+                return int(value)
+            except ValueError:
+                # e.g. '3.0'
+                number = float(value)
+                if number.is_integer():
+                    return int(number)
+        except (TypeError, ValueError):
+            pass
+        self.dropped[column] = self.dropped.get(column, 0) + 1
+        return None
+
+    def format_rows(self, rows):
+        """Returns "rows" as csv text, or as a record batch."""
+        if self.file_format == 'csv':
+            text = io.StringIO()
+            csv.writer(text, delimiter=',').writerows(rows)
+            return text.getvalue()
+        columns = [[] for _ in self.header]
+        for row in rows:
+            for values, value in zip(columns, row):
+                values.append(value)
+        arrays = [pa.array([self.typed_value(v, f.type, f.name) for v in values], type=f.type)
+                for values, f in zip(columns, self.schema)]
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+class TableWriter:
+    """Writes a processed table, as csv or as parquet (see TableFormat),
+    a batch of rows at a time. "f_name" is the name of the csv file, and
+    its suffix is replaced for the other formats. A file of the same
+    table and source in the other format is removed, so that
+    Creating_Database does not load the rows twice.
+
+    With "replaced_dates", a set of asof dates, the rows saved to the
+    table before are kept, except those of the replaced dates, and the new
+    rows are written after them. The table is then written to a hidden
+    file, which replaces the old one when it is closed."""
+    def __init__(self, f_name, header, table_name=None, replaced_dates=None):
+        f_name = Path(f_name)
+        self.format = TableFormat(header, table_name or f_name.parent.name)
+        self.f_name = f_name.with_suffix(self.format.suffix())
+        self.old_file = saved_file(f_name) if replaced_dates is not None else None
+        if self.old_file:
+            print(f"\tMerging into {self.f_name}.")
+            self.out_file = self.f_name.with_name(f".{self.f_name.name}.{os.getpid()}")
+        else:
+            print(f"\tSaving to {self.f_name}.")
+            self.out_file = self.f_name
+            self.remove_other_formats()
+        if self.format.file_format == 'csv':
+            self.f = open(self.out_file, 'w')
+            csv.writer(self.f, delimiter=',').writerow(header)
+        else:
+            self.f = pq.ParquetWriter(self.out_file, self.format.schema)
+        # small batches are joined into row groups of about BATCH_ROWS rows
+        self.pending = []
+        self.pending_rows = 0
+        if self.old_file:
+            self.copy_old_rows(replaced_dates)
+
+    def remove_other_formats(self):
+        for other in OUTPUT_FORMATS:
+            other_file = self.f_name.with_suffix(f".{other}")
+            if other_file != self.f_name and os.path.isfile(other_file):
+                print(f"\tRemoving {other_file}, replaced by {self.f_name.name}.")
+                os.remove(other_file)
+
+    def copy_old_rows(self, replaced_dates):
+        """Writes the rows of old_file whose asof date is not replaced."""
+        kept = 0
+        if self.old_file.suffix == '.parquet':
+            parquet_file = pq.ParquetFile(self.old_file)
+            names = [n.lower() for n in parquet_file.schema_arrow.names]
+            replaced = pa.array(sorted(replaced_dates), type=pa.string())
+            for batch in parquet_file.iter_batches(batch_size=BATCH_ROWS):
+                batch = batch.filter(pc.invert(pc.is_in(batch.column(names.index('asof_date')), replaced)))
+                if self.format.file_format == 'parquet':
+                    self.write_formatted(batch)
+                else:
+                    self.write_rows(list(zip(*(column.to_pylist() for column in batch.columns))))
+                kept += batch.num_rows
+        else:
+            with open(self.old_file, 'r') as f:
+                csv_reader = csv.reader(f, delimiter=',')
+                date_index = [n.lower() for n in next(csv_reader)].index('asof_date')
+                batch = []
+                for row in csv_reader:
+                    if row[date_index] not in replaced_dates:
+                        batch.append(row)
+                    if len(batch) >= BATCH_ROWS:
+                        self.write_rows(batch)
+                        kept += len(batch)
+                        batch = []
+                self.write_rows(batch)
+                kept += len(batch)
+        print(f"\tKept {kept} rows of the earlier snapshots.")
+
+    def write_rows(self, rows):
+        self.write_formatted(self.format.format_rows(rows))
+
+    def write_formatted(self, data):
+        """Writes rows that were formatted with self.format.format_rows,
+        possibly in another process."""
+        if isinstance(data, str):
+            self.f.write(data)
+        elif data.num_rows:
+            self.pending.append(data)
+            self.pending_rows += data.num_rows
+            if self.pending_rows >= BATCH_ROWS:
+                self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.f.write_table(pa.Table.from_batches(self.pending, schema=self.format.schema))
+            self.pending = []
+            self.pending_rows = 0
+
+    def close(self):
+        if self.format.file_format != 'csv':
+            self.flush()
+        self.f.close()
+        if self.out_file != self.f_name:
+            os.replace(self.out_file, self.f_name)
+            self.remove_other_formats()
+        for column, count in self.format.dropped.items():
+            print(f"\t{count} values of {column} were not numbers and were saved as NULL.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # the table as it was saved before is left in place
+            self.f.close()
+            if self.out_file != self.f_name:
+                os.remove(self.out_file)
+
+def save_table(rows, header, f_name, table_name=None, replaced_dates=None):
+    """Saves all of "rows" at once, in batches of the output format.
+    See TableWriter for "replaced_dates"."""
+    with TableWriter(f_name, header, table_name, replaced_dates) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= BATCH_ROWS:
+                writer.write_rows(batch)
+                batch = []
+        if batch:
+            writer.write_rows(batch)
+
+if __name__ == "__main__":
+    print("This script should not be run by itself. It is used by the Processing_ scripts.")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import os
+
+import pyarrow.parquet as pq
+
+import Saving_Tables
+
+
+def read_rows(f_name):
+    table = pq.read_table(f_name)
+    return list(zip(*(column.to_pylist() for column in table.columns)))
+
+
+def test_parquet_values(tmp_path, monkeypatch):
+    monkeypatch.setattr(Saving_Tables, 'output_format', 'parquet')
+    f_name = tmp_path / 'asn_org' / 'PDB_asn_org.csv'
+    os.makedirs(f_name.parent)
+    header = ['asn', 'organization', 'source', 'asof_date']
+    Saving_Tables.save_table([[64500, "O'Brien Networks", 'PDB', '2024-01-01'],
+                              ['64501', "O''Hara", 'PDB', '2024-01-01'],
+                              ['', 'NULL', 'PDB', '2024-01-01'],
+                              ['AS64503', None, 'PDB', '2024-01-01'],
+                              ['64504.0', '', 'PDB', '2024-01-01']], header, f_name)
+    saved = f_name.with_suffix('.parquet')
+    assert not os.path.isfile(f_name)
+    # text is saved as it is, quotes included
+    assert read_rows(saved) == [(64500, "O'Brien Networks", 'PDB', '2024-01-01'),
+                                (64501, "O''Hara", 'PDB', '2024-01-01'),
+                                (None, None, 'PDB', '2024-01-01'),
+                                (None, None, 'PDB', '2024-01-01'),
+                                (64504, '', 'PDB', '2024-01-01')]
+    table_format = Saving_Tables.TableFormat(header, 'asn_org')
+    table_format.format_rows([['AS64503', 'x', 'PDB', '2024-01-01'], ['', 'y', 'PDB', '2024-01-01']])
+    assert table_format.dropped == {'asn': 1}
+
+    # the rows of the replaced dates are dropped, and the new rows written after the others
+    Saving_Tables.save_table([[64505, 'New', 'PDB', '2024-02-01']], header, f_name,
+            replaced_dates={'2024-02-01'})
+    Saving_Tables.save_table([[64501, 'Replaced', 'PDB', '2024-01-01']], header, f_name,
+            replaced_dates={'2024-01-01'})
+    assert read_rows(saved) == [(64505, 'New', 'PDB', '2024-02-01'), (64501, 'Replaced', 'PDB', '2024-01-01')]
+    assert sorted(os.listdir(f_name.parent)) == ['PDB_asn_org.parquet']
+
+    # a csv file of the table replaces the parquet file
+    monkeypatch.setattr(Saving_Tables, 'output_format', 'csv')
+    Saving_Tables.save_table([[64506, "O'Neil", 'PDB', '2024-03-01']], header, f_name,
+            replaced_dates={'2024-03-01'})
+    with open(f_name, 'r') as f:
+        assert f.read().splitlines()[1:] == ['64505,New,PDB,2024-02-01', '64501,Replaced,PDB,2024-01-01',
+                                             "64506,O'Neil,PDB,2024-03-01"]
+    assert not os.path.isfile(saved)
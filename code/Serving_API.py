@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 
+import hashlib
 import logging
+import sqlite3
 import time
 from typing import Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from ConvertToStandardPath_MergeSubmarineWithLandCable import get_all_submarine_to_standard_paths_pairs
 from ConvertToStandardPath_SubmarineCable import get_all_submarine_standard_paths
-import sqlite3
 import networkx as nx
 from haversine import haversine
 import geopandas as gpd
@@ -14,7 +15,8 @@ import geopandas as gpd
 from shapely import Point
 from shapely.geometry import LineString, MultiLineString
 from Processing_CloudRegions import cut_linestring
-from Common import are_coordinates_close, flip_coordinate, init_logging, parse_wkt_linestring, Coordinate, Location
+from Querying_Database import db_version, queryDatabase
+from Common import are_coordinates_close, flip_coordinate, get_all_paths, init_logging, Coordinate, Location
 
 
 # Minimum distance between two cities to be considered as different cities
@@ -25,6 +27,9 @@ THRESHOLD_ENDPOINT_TO_CITY_MAX_DISTANCE_KM = 50
 THRESHOLD_AS_LOCATION_TO_CITY_MIN_DISTANCE_KM = 100
 # Maximum distance between new AS location to insert and existing paths
 THRESHOLD_AS_LOCATION_TO_PATH_MAX_DISTANCE_KM = 50
+# Rows returned by a page of the lookup endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
 
 def city_formatter(city_info: Location) -> Location:
     city, state, country = city_info
@@ -68,15 +73,7 @@ def add_edge(G, city1: Location, city2: Location, distance: float, path_wkt: str
 def get_all_standard_paths(db_file: str):
     """read standard paths from database"""
     logging.info('Loading standard paths from database ...')
-    with sqlite3.connect(db_file) as conn:
-        cursor = conn.cursor()
-        sql_query = """
-        SELECT sp.from_city, sp.from_state, sp.from_country, sp.to_city, sp.to_state, sp.to_country, sp.distance_km, sp.path_wkt
-        FROM standard_paths sp
-        """
-        cursor.execute(sql_query)
-        data = cursor.fetchall()
-    return data
+    return get_all_paths(db_file, 'standard_paths')
 
 
 # fetch all asn locations related to amazon from database
@@ -84,29 +81,17 @@ def get_as_locations(db_file, cloud_region_scope) -> list[Coordinate]:
     """read asn locations from database"""
     logging.info(f'Loading AS locations of "{cloud_region_scope}" from database ...')
     coordinates: list[Coordinate] = []
-    with sqlite3.connect(db_file) as conn:
-        cursor = conn.cursor()
-        if cloud_region_scope == 'amazon':
-            sql_query = """
-            SELECT DISTINCT al.latitude, al.longitude
-            FROM asn_asname aa
-            JOIN asn_loc al ON aa.asn = al.asn
-            WHERE aa.asn_name LIKE '%amazon%' and al.physical_presence = 'True'
-                and latitude != 'NULL' and longitude != 'NULL';
-            """
-        elif cloud_region_scope == 'google':
-            sql_query = """
-            SELECT DISTINCT al.latitude, al.longitude
-            FROM asn_asname aa
-            JOIN asn_loc al ON aa.asn = al.asn
-            WHERE aa.asn_name LIKE '%google%' and al.physical_presence = 'True'
-                and latitude != 'NULL' and longitude != 'NULL';
-            """
-        cursor.execute(sql_query)
-        data = cursor.fetchall()
-    for row in data:
-        latitude = float(row[0])
-        longitude = float(row[1])
+    querier = queryDatabase(db_file)
+    condition, params = querier.text_search_condition('asn_asname', cloud_region_scope, alias='aa')
+    sql_query = f"""
+    SELECT DISTINCT al.latitude, al.longitude
+    FROM asn_asname aa
+    JOIN asn_loc al ON aa.asn = al.asn
+    WHERE {condition} and al.physical_presence = 'True'
+        and al.latitude IS NOT NULL and al.longitude IS NOT NULL;
+    """
+    data = querier.execute_query(sql_query, params=params)
+    for latitude, longitude in data:
         coordinates.append((latitude, longitude))
     return coordinates
 
@@ -126,15 +111,14 @@ def graph_build_helper(G: nx.Graph, coord_city_map: dict[Coordinate, Location],
                        paths: list[tuple], submarine_option=False) -> \
         tuple[nx.Graph, dict[Coordinate, Location], set[Coordinate]]:
     logging.info(f'Adding {len(paths)} paths to graph ...')
-    for from_city, from_state, from_country, to_city, to_state, to_country, distance_km, path_wkt in paths:
+    for from_city, from_state, from_country, to_city, to_state, to_country, distance_km, linestring in paths:
 
         from_city_info = city_formatter((from_city, from_state, from_country))
         to_city_info = city_formatter((to_city, to_state, to_country))
         if from_city_info == to_city_info:
             continue
-        linestring = parse_wkt_linestring(path_wkt)
         if linestring is None:
-            logging.warning(f"invalid wkt string {path_wkt}")
+            logging.warning(f"invalid path from {from_city_info} to {to_city_info}")
             continue
         start_city_coord = linestring.coords[0]
         end_city_coord = linestring.coords[-1]
@@ -388,6 +372,132 @@ def physical_route(src_latitude: float, src_longitude: float,
         'fiber_types': cable_type_list,
     }
 
+def lookup_querier() -> queryDatabase:
+    """Reads go through the pooled read-only connection of the worker
+    thread, and the results are cached until the database changes."""
+    return queryDatabase(app.db_file, cache=True)
+
+
+def db_tag() -> str:
+    """A short name of the current version of the database file."""
+    return hashlib.sha1(repr(db_version(app.db_file)).encode()).hexdigest()[:16]
+
+
+def not_modified(request: Request, response: Response) -> Optional[Response]:
+    """Sets the caching headers of a lookup response. The database can be
+    rebuilt at any time, so clients revalidate each response with the ETag,
+    which changes with the database file, in If-None-Match.
+    Returns an empty 304 response when the client's copy is still current."""
+    etag = '"' + hashlib.sha1(f"{db_tag()} {request.url}".encode()).hexdigest() + '"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    response.headers.update(headers)
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+def cursor_rowid(after: Optional[str], tag: str) -> int:
+    """Returns the rowid of a next_after cursor of page(). Rowids change
+    when the tables are reloaded, so a cursor of another version of the
+    database is rejected, and the client starts again from the first page."""
+    if after is None:
+        return 0
+    cursor_tag, _, rowid = after.partition(':')
+    if not rowid.isdigit():
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    if cursor_tag != tag:
+        raise HTTPException(status_code=409, detail="the database changed since the cursor was made")
+    return int(rowid)
+
+
+def page(rows: list[sqlite3.Row], limit: int, tag: str) -> dict:
+    """Pages are continued by keyset, i.e. after the rowid of the last row
+    of the previous page, which stays fast deep into a large result. The
+    cursor is tagged with the version of the database, see cursor_rowid.
+    One row more than "limit" is read to tell whether there is a next page."""
+    items = [dict(r) for r in rows[:limit]]
+    next_after = f"{tag}:{items[-1]['rowid']}" if len(rows) > limit else None
+    for item in items:
+        item.pop('rowid', None)
+    return {'items': items, 'next_after': next_after}
+
+
+@app.get("/asn/{asn}/locations")
+def asn_locations(asn: int, request: Request, response: Response,
+                  limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                  after: Optional[str] = None):
+    """
+    Get the locations of an AS from asn_loc.
+    """
+    cached = not_modified(request, response)
+    if cached:
+        return cached
+    tag = db_tag()
+    rows = lookup_querier().execute_named('asn_locations_page',
+            (asn, cursor_rowid(after, tag), limit + 1), sqlite3.Row)
+    return page(rows, limit, tag)
+
+
+@app.get("/ip/{ip_addr}")
+def ip_lookup(ip_addr: str, request: Request, response: Response):
+    """
+    Get the AS, reverse DNS name and location of an IP address, and the
+    geographic inference of it, if there is one.
+    """
+    cached = not_modified(request, response)
+    if cached:
+        return cached
+    querier = lookup_querier()
+    asn_locations = querier.execute_named('ip_asn_dns_by_ip', (ip_addr,), sqlite3.Row)
+    inferences = querier.execute_named('ip_inference_by_ip', (ip_addr,), sqlite3.Row)
+    if not asn_locations and not inferences:
+        raise HTTPException(status_code=404, detail="IP address not found")
+    return {
+        'ip_addr': ip_addr,
+        'asn_locations': [dict(r) for r in asn_locations],
+        'inferences': [dict(r) for r in inferences],
+    }
+
+
+@app.get("/cables/{cable_id}/landing-points")
+def cable_landing_points(cable_id: str, request: Request, response: Response,
+                         limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                         after: Optional[str] = None):
+    """
+    Get the landing points of a submarine cable, with the coordinates and
+    standard city of each landing point.
+    """
+    cached = not_modified(request, response)
+    if cached:
+        return cached
+    tag = db_tag()
+    rows = lookup_querier().execute_named('cable_landing_points_page',
+            (cable_id, cursor_rowid(after, tag), limit + 1), sqlite3.Row)
+    return page(rows, limit, tag)
+
+
+@app.get("/cities/")
+def cities_in_bbox(min_latitude: float, min_longitude: float,
+                   max_latitude: float, max_longitude: float,
+                   request: Request, response: Response,
+                   limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                   after: Optional[str] = None):
+    """
+    Get the cities of city_points within a bounding box.
+    """
+    if min_latitude > max_latitude or min_longitude > max_longitude:
+        raise HTTPException(status_code=400, detail="min coordinates must not exceed the max coordinates")
+    cached = not_modified(request, response)
+    if cached:
+        return cached
+    tag = db_tag()
+    rows = lookup_querier().execute_named('cities_in_bbox_page',
+            (min_longitude, max_longitude, min_latitude, max_latitude,
+             min_latitude, max_latitude, min_longitude, max_longitude, cursor_rowid(after, tag), limit + 1),
+            sqlite3.Row)
+    return page(rows, limit, tag)
+
+
 def run():
     init_logging(level=logging.INFO)
     app.db_file = '../database/igdb.db'
@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 
 import csv
+import sqlite3
 import sys
 
 from fastapi.testclient import TestClient
 # Assuming initialize_graph is a function that sets up your graph
 from Serving_API import app, build_up_global_graph
+import Creating_Database
+import dbStructure as db
 
 client = TestClient(app)
 
@@ -62,5 +65,127 @@ def test_physical_route():
     # You can add more assertions to validate the response content
 
 
+def setup_lookup_database(tmp_path):
+    # a small database with the tables of the lookup endpoints
+    db_file = tmp_path / 'lookup.db'
+    conn = sqlite3.connect(db_file)
+    for t in ['asn_loc', 'ip_asn_dns', 'ip_inference', 'cable_landing_points', 'landing_points', 'city_points']:
+        conn.execute(db.tables[t])
+    conn.executemany("INSERT INTO asn_loc (asn, latitude, longitude, source) VALUES(?, ?, ?, ?)",
+            [(64500, 10.0 + i, 20.0, 'PDB') for i in range(3)] + [(64501, 1.0, 2.0, 'PDB')])
+    conn.execute("INSERT INTO ip_asn_dns (ip_addr, rdns, asn, standard_city) VALUES(?, ?, ?, ?)",
+            ('192.0.2.1', 'router.example.net', 64500, 'Chicago'))
+    conn.executemany("INSERT INTO cable_landing_points (cable_id, city_name, country) VALUES(?, ?, ?)",
+            [('cable-1', 'Lisbon', 'PT'), ('cable-1', 'Sines', 'PT'), ('cable-1', 'Bude', 'GB')])
+    conn.execute("""INSERT INTO landing_points (city_name, country, latitude, longitude, standard_city)
+            VALUES(?, ?, ?, ?, ?)""", ('Lisbon', ' PT', 38.72, -9.14, 'Lisbon'))
+    conn.executemany("INSERT INTO city_points VALUES(?, ?, ?, ?, ?)",
+            [('Chicago', 'Illinois', 'US', 41.85, -87.65), ('Milwaukee', 'Wisconsin', 'US', 43.04, -87.91),
+             ('Madison', 'Wisconsin', 'US', 43.07, -89.40), ('Madrid', '', 'ES', 40.42, -3.70)])
+    conn.commit()
+    conn.close()
+    db_creator = Creating_Database.CreatingDatabase.__new__(Creating_Database.CreatingDatabase)
+    db_creator.db_file = db_file
+    db_creator.build_spatial_indexes(['city_points'])
+    app.db_file = str(db_file)
+
+
+def test_asn_locations_pages(tmp_path):
+    setup_lookup_database(tmp_path)
+    response = client.get("/asn/64500/locations?limit=2")
+    assert response.status_code == 200
+    first = response.json()
+    assert [item['latitude'] for item in first['items']] == [10.0, 11.0]
+    assert first['next_after'] is not None
+    assert 'rowid' not in first['items'][0]
+
+    second = client.get(f"/asn/64500/locations?limit=2&after={first['next_after']}").json()
+    assert [item['latitude'] for item in second['items']] == [12.0]
+    assert second['next_after'] is None
+
+    assert client.get("/asn/64500/locations?limit=0").status_code == 422
+    assert client.get("/asn/64500/locations?after=-1").status_code == 400
+    assert client.get("/asn/64999/locations").json() == {'items': [], 'next_after': None}
+
+
+def test_ip_lookup(tmp_path):
+    setup_lookup_database(tmp_path)
+    response = client.get("/ip/192.0.2.1")
+    assert response.status_code == 200
+    data = response.json()
+    assert data['asn_locations'][0]['asn'] == 64500
+    assert data['inferences'] == []
+    assert client.get("/ip/198.51.100.1").status_code == 404
+
+
+def test_cable_landing_points_pages(tmp_path):
+    setup_lookup_database(tmp_path)
+    first = client.get("/cables/cable-1/landing-points?limit=2").json()
+    assert [item['city_name'] for item in first['items']] == ['Lisbon', 'Sines']
+    # the coordinates come from the matching landing point, if there is one
+    assert first['items'][0]['latitude'] == 38.72
+    assert first['items'][1]['latitude'] is None
+
+    second = client.get(f"/cables/cable-1/landing-points?limit=2&after={first['next_after']}").json()
+    assert [item['city_name'] for item in second['items']] == ['Bude']
+    assert second['next_after'] is None
+
+
+def test_cities_in_bbox(tmp_path):
+    setup_lookup_database(tmp_path)
+    bbox = "min_latitude=40&min_longitude=-90&max_latitude=44&max_longitude=-87"
+    first = client.get(f"/cities/?{bbox}&limit=2").json()
+    second = client.get(f"/cities/?{bbox}&limit=2&after={first['next_after']}").json()
+    assert second['next_after'] is None
+    names = [item['city_name'] for item in first['items'] + second['items']]
+    assert sorted(names) == ['Chicago', 'Madison', 'Milwaukee']
+
+    response = client.get("/cities/?min_latitude=44&min_longitude=-90&max_latitude=40&max_longitude=-87")
+    assert response.status_code == 400
+    assert client.get("/cities/?min_latitude=40").status_code == 422
+
+
+def test_lookup_revalidation(tmp_path):
+    setup_lookup_database(tmp_path)
+    response = client.get("/asn/64500/locations")
+    etag = response.headers['etag']
+    # the database can be replaced at any time, so each use is revalidated
+    assert response.headers['cache-control'] == 'no-cache'
+
+    cached = client.get("/asn/64500/locations", headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.content == b''
+    assert cached.headers['etag'] == etag
+
+    # another resource, or a changed database, does not match the old ETag
+    assert client.get("/asn/64501/locations", headers={'If-None-Match': etag}).status_code == 200
+    conn = sqlite3.connect(app.db_file)
+    conn.execute("INSERT INTO asn_loc (asn, latitude, longitude) VALUES(64500, 13.0, 20.0)")
+    conn.commit()
+    conn.close()
+    response = client.get("/asn/64500/locations", headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.json()['items']) == 4
+
+
+def test_stale_cursor(tmp_path):
+    setup_lookup_database(tmp_path)
+    first = client.get("/asn/64500/locations?limit=2").json()
+    # a reload of the table gives its rows other rowids
+    conn = sqlite3.connect(app.db_file)
+    conn.execute("DELETE FROM asn_loc WHERE asn = 64500 AND latitude = 10.0")
+    conn.execute("INSERT INTO asn_loc (asn, latitude, longitude) VALUES(64500, 10.0, 20.0)")
+    conn.commit()
+    conn.close()
+    response = client.get(f"/asn/64500/locations?limit=2&after={first['next_after']}")
+    assert response.status_code == 409
+
+    # a page of the new version continues as before
+    first = client.get("/asn/64500/locations?limit=2").json()
+    second = client.get(f"/asn/64500/locations?limit=2&after={first['next_after']}").json()
+    latitudes = [item['latitude'] for item in first['items'] + second['items']]
+    assert sorted(latitudes) == [10.0, 11.0, 12.0]
+
+
 if __name__ == "__main__":
     test_physical_route()
@@ -1,36 +1,260 @@
+import math
+import os
+from collections import OrderedDict
 from pathlib import Path
 import geopandas as gpd
 import numpy as np
-from shapely.geometry import Point
+import pyarrow as pa
+import pyarrow.feather as feather
+import shapely
+from scipy.spatial import KDTree
+
+# the attributes of a Voronoi polygon returned for the points inside it
+location_fields = {"LATITUDE": "LATITUDE", "LONGITUDE": "LONGITUDE",
+        "CITY": "NAME", "STATE": "ADM1NAME", "COUNTRY": "ISO_A2"}
+
+# coordinates are remembered at this many decimals, about 11 m, so that
+# the points within one key share its result; the polygon of a key is
+# found at the exact coordinates of the first point that had it
+KEY_DIGITS = 4
+# standardized coordinates kept by the memo cache
+DEFAULT_CACHE_SIZE = 100000
+# side in degrees of the grid cells checked for lying inside one polygon
+DEFAULT_CELL_SIZE = 0.1
+# a point outside of every Voronoi polygon gets the nearest city within
+# this many kilometers, and is flagged as approximate
+DEFAULT_MAX_NEAREST_KM = 50
+EARTH_RADIUS_KM = 6371.0088
+# the Voronoi polygons (as wkb) and their location fields, written next to
+# the shapefile, which takes several times longer to parse
+ARTIFACT_NAME = "cities_Voronoi.feather"
+# the shapefile parts that the artifact is built from
+SOURCE_SUFFIXES = [".shp", ".dbf", ".shx"]
+
+def source_version(voronoi_dir):
+    """The size and modification time of the shapefile parts."""
+    version = []
+    for suffix in SOURCE_SUFFIXES:
+        f_name = voronoi_dir / f"cities_Voronoi{suffix}"
+        if os.path.isfile(f_name):
+            st = os.stat(f_name)
+            version.append(f"{suffix}:{st.st_size}:{st.st_mtime_ns}")
+    return ";".join(version)
+
+def build_artifact(voronoi_dir):
+    """Converts the Voronoi shapefile in "voronoi_dir" to the feather
+    artifact that LocationStandardizer loads, unless it is up to date."""
+    voronoi_dir = Path(voronoi_dir)
+    artifact = voronoi_dir / ARTIFACT_NAME
+    version = source_version(voronoi_dir)
+    if os.path.isfile(artifact):
+        metadata = feather.read_table(artifact, columns=[]).schema.metadata or {}
+        if metadata.get(b"source_version", b"").decode() == version:
+            return artifact
+    print(f"\tConverting the Voronoi shapefile to {artifact}.")
+    cities_df = gpd.read_file(voronoi_dir / "cities_Voronoi.shp")
+    columns = {"geometry": pa.array(shapely.to_wkb(cities_df.geometry.values), type=pa.binary())}
+    for field in location_fields.values():
+        columns[field] = pa.array(cities_df[field], from_pandas=True)
+    table = pa.table(columns).replace_schema_metadata({"source_version": version})
+    # written under another name first, so that a reader never sees half a file
+    tmp_file = voronoi_dir / f".{ARTIFACT_NAME}.{os.getpid()}"
+    feather.write_feather(table, tmp_file)
+    os.replace(tmp_file, artifact)
+    return artifact
+
+def unit_vectors(lats, lons):
+    """Returns the points on the unit sphere of arrays of coordinates,
+    between which the straight (chord) distance grows with the
+    great circle distance."""
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    return np.column_stack([np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)])
+
+def chord_length(distance_km):
+    return 2 * math.sin(distance_km / EARTH_RADIUS_KM / 2)
+
+# the standardizers shared by all processors, by Voronoi directory
+_shared_standardizers = {}
+
+def shared_standardizer(voronoi_dir):
+    """Returns the LocationStandardizer of the process for "voronoi_dir",
+    creating it on the first call. Processes forked after that call
+    inherit it, along with the lookups it has cached."""
+    key = os.path.realpath(voronoi_dir)
+    if key not in _shared_standardizers:
+        _shared_standardizers[key] = LocationStandardizer(Path(voronoi_dir))
+    return _shared_standardizers[key]
 
 class LocationStandardizer:
-    def __init__(self, voronoi_dir):
+    """Maps coordinates to the city of the Voronoi polygon that contains them.
+    The polygons are kept in an STRtree, so that a lookup only tests the
+    few polygons whose bounding box holds the point.
+
+    Since the same coordinates come up again and again (e.g. every probe
+    in one datacenter), the polygon of the last "cache_size" coordinates
+    is remembered. The map is also split into grid cells of "cell_size"
+    degrees, and a point in a cell that lies entirely inside one polygon
+    gets that polygon without a test, so that only points in the cells
+    crossed by a polygon edge need an exact test. stats() reports how
+    often each of them answered.
+
+    A point outside of every polygon (e.g. just off the coast) gets the
+    city nearest to it, from a KD-tree of the cities on the unit sphere,
+    if that city is at most "max_nearest_km" away. Such results have
+    "APPROXIMATE" set to True. A "max_nearest_km" of None turns this off."""
+    def __init__(self, voronoi_dir, cache_size=DEFAULT_CACHE_SIZE, cell_size=DEFAULT_CELL_SIZE,
+            max_nearest_km=DEFAULT_MAX_NEAREST_KM):
         self.voronoi_dir = voronoi_dir
         self.voronoi_shapefile = self.voronoi_dir / "cities_Voronoi.shp"
+        self.cache_size = cache_size
+        self.cell_size = cell_size
+        self.max_nearest_km = max_nearest_km
+        self.memo = OrderedDict()
+        self.cells = OrderedDict()
+        self.lookups = 0
+        self.memo_hits = 0
+        self.cell_hits = 0
+        self.exact_lookups = 0
+        self.nearest_lookups = 0
+        self.approximate = 0
         self._read_cities_shapefile()
 
     def _read_cities_shapefile(self):
-        self.cities_df = gpd.read_file(self.voronoi_shapefile)
-        self.cities_series = gpd.GeoSeries(self.cities_df.geometry)
+        artifact = build_artifact(self.voronoi_dir)
+        table = feather.read_table(artifact)
+        polygons = shapely.from_wkb(table.column("geometry").to_numpy(zero_copy_only=False))
+        # building the tree takes a few milliseconds, less than unpickling one
+        self.cities_tree = shapely.STRtree(polygons)
+        columns = {k: table.column(v).to_pylist() for k, v in location_fields.items()}
+        self.locations = [dict(zip(columns.keys(), values)) for values in zip(*columns.values())]
+        # the cities are the points of city_points, one per polygon
+        self.city_tree = KDTree(unit_vectors(columns["LATITUDE"], columns["LONGITUDE"]))
+
+    def _remember(self, cache, key, value):
+        cache[key] = value
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _cell_polygon(self, coord):
+        """Returns the polygon that the whole grid cell of the (lat, lon)
+        "coord" lies in, or -1 when the cell is crossed by a polygon edge."""
+        cell = (math.floor(coord[0] / self.cell_size), math.floor(coord[1] / self.cell_size))
+        if cell in self.cells:
+            self.cells.move_to_end(cell)
+            return self.cells[cell]
+        min_lat, min_lon = cell[0] * self.cell_size, cell[1] * self.cell_size
+        box = shapely.box(min_lon, min_lat, min_lon + self.cell_size, min_lat + self.cell_size)
+        candidates = self.cities_tree.query(box)
+        inside = candidates[shapely.contains_properly(self.cities_tree.geometries[candidates], box)]
+        polygon = int(inside[0]) if len(inside) == 1 else -1
+        self._remember(self.cells, cell, polygon)
+        return polygon
+
+    def _query(self, coords):
+        """Returns the index of the polygon holding each (lat, lon) of "coords",
+        or -1, with one tree query for all of them."""
+        coords = np.asarray(coords, dtype=float)
+        points = shapely.points(coords[:, 1], coords[:, 0])
+        point_idx, polygon_idx = self.cities_tree.query(points, predicate='within')
+        # a point on the shared edge of two polygons gets the first of them
+        order = np.lexsort((polygon_idx, point_idx))
+        point_idx, polygon_idx = point_idx[order], polygon_idx[order]
+        first = np.ones(len(point_idx), dtype=bool)
+        first[1:] = point_idx[1:] != point_idx[:-1]
+        polygons = np.full(len(coords), -1)
+        polygons[point_idx[first]] = polygon_idx[first]
+        return polygons.tolist()
+
+    def _nearest(self, coords):
+        """Returns the index of the city nearest to each (lat, lon) of "coords",
+        or -1 when there is none within max_nearest_km."""
+        coords = np.asarray(coords, dtype=float)
+        _, nearest = self.city_tree.query(unit_vectors(coords[:, 0], coords[:, 1]),
+                distance_upper_bound=chord_length(self.max_nearest_km))
+        # a point without a city in range gets the number of cities
+        return np.where(nearest < len(self.locations), nearest, -1).tolist()
+
+    def _polygons(self, coords):
+        """Returns the (polygon index, approximate) of each coordinate."""
+        polygons = [(-1, False)] * len(coords)
+        pending = OrderedDict()
+        for i, c in enumerate(coords):
+            c = (float(c[0]), float(c[1]))
+            key = (round(c[0], KEY_DIGITS), round(c[1], KEY_DIGITS))
+            self.lookups += 1
+            if key in self.memo:
+                self.memo.move_to_end(key)
+                polygons[i] = self.memo[key]
+                self.memo_hits += 1
+            elif key in pending:
+                pending[key].append(i)
+                self.memo_hits += 1
+            else:
+                polygon = self._cell_polygon(c)
+                if polygon >= 0:
+                    polygons[i] = (polygon, False)
+                    self.cell_hits += 1
+                else:
+                    pending[key] = [i]
+        if pending:
+            self.exact_lookups += len(pending)
+            # each key is looked up at the coordinates of its first point
+            first = {key: coords[indices[0]] for key, indices in pending.items()}
+            found = {key: (polygon, False) for key, polygon in zip(pending, self._query(list(first.values())))}
+            outside = [key for key, (polygon, _) in found.items() if polygon < 0]
+            if outside and self.max_nearest_km:
+                self.nearest_lookups += len(outside)
+                for key, city in zip(outside, self._nearest([first[key] for key in outside])):
+                    found[key] = (city, city >= 0)
+            for key, result in found.items():
+                self._remember(self.memo, key, result)
+                for i in pending[key]:
+                    polygons[i] = result
+        self.approximate += sum(1 for _, approximate in polygons if approximate)
+        return polygons
+
+    def _location(self, polygon, approximate):
+        location = dict(self.locations[polygon])
+        location["APPROXIMATE"] = approximate
+        return location
 
     def standardize(self, node_coords):
-        my_point = Point(node_coords[1], node_coords[0])
-        contains = self.cities_series.contains(my_point)
-        result = np.where(contains.values == True)
-        if len(result) > 1:
-            print(f"Error with: {node_coords}")
-        try:
-            std_lat = self.cities_df.iloc[result[0]]["LATITUDE"].values[0]
-            std_lon = self.cities_df.iloc[result[0]]["LONGITUDE"].values[0]
-            city = self.cities_df.iloc[result[0]]["NAME"].values[0]
-            state = self.cities_df.iloc[result[0]]["ADM1NAME"].values[0]
-            cc = self.cities_df.iloc[result[0]]["ISO_A2"].values[0]
-            result_dict = {"LATITUDE":std_lat, "LONGITUDE":std_lon,
-                    "CITY":city, "STATE":state, "COUNTRY":cc}
-        except:
+        polygon, approximate = self._polygons([node_coords])[0]
+        if polygon < 0:
             print(f"\tNo lat/long for {node_coords}")
-            result_dict = {}
-        return result_dict
+            return {}
+        return self._location(polygon, approximate)
+
+    def standardize_many(self, coords):
+        """Standardizes a list of [lat, lon] coordinates with one spatial join.
+        Returns a list with the standardize() result of each coordinate,
+        in the same order."""
+        results = []
+        for c, (polygon, approximate) in zip(coords, self._polygons(coords)):
+            if polygon < 0:
+                print(f"\tNo lat/long for {list(c)}")
+                results.append({})
+            else:
+                results.append(self._location(polygon, approximate))
+        return results
+
+    def stats(self):
+        """Returns how many lookups were answered by the memo cache, by a
+        grid cell inside one polygon, and by an exact polygon test,
+        and how many got an approximate, nearest city."""
+        lookups = max(self.lookups, 1)
+        return {"lookups": self.lookups,
+                "memo_hits": self.memo_hits,
+                "cell_hits": self.cell_hits,
+                "exact_lookups": self.exact_lookups,
+                "nearest_lookups": self.nearest_lookups,
+                "approximate": self.approximate,
+                "memo_hit_rate": self.memo_hits / lookups,
+                "cell_hit_rate": self.cell_hits / lookups,
+                "cached_coordinates": len(self.memo),
+                "cached_cells": len(self.cells),
+                "inside_cells": sum(1 for p in self.cells.values() if p >= 0)}
 
 if __name__ == "__main__":
     voronoi_dir = Path("../helper_data/cities_Voronoi")
@@ -44,3 +268,7 @@ if __name__ == "__main__":
     print(f"Classifying a point ({madrid}) in Madrid.")
     result = my_standardizer.standardize(madrid)
     print(result)
+
+    print("Classifying both points at once.")
+    print(my_standardizer.standardize_many([chicago, madrid]))
+    print(my_standardizer.stats())
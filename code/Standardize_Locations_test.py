@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import geopandas as gpd
+import pyarrow as pa
+import pyarrow.feather as feather
+import shapely
+
+import Standardize_Locations
+
+
+def write_voronoi_artifact(voronoi_dir):
+    # two square cells, around cities at their centers, with nothing in between
+    polygons = [shapely.box(0, 0, 1, 1), shapely.box(2, 0, 3, 1)]
+    table = pa.table({"geometry": pa.array(shapely.to_wkb(polygons), type=pa.binary()),
+            "LATITUDE": [0.5, 0.5], "LONGITUDE": [0.5, 2.5],
+            "NAME": ["West", "East"], "ADM1NAME": [None, "State"], "ISO_A2": ["AA", "BB"]})
+    # without a shapefile, the artifact is current for an empty source version
+    table = table.replace_schema_metadata({"source_version": Standardize_Locations.source_version(voronoi_dir)})
+    feather.write_feather(table, voronoi_dir / Standardize_Locations.ARTIFACT_NAME)
+
+
+def test_standardize_many(tmp_path):
+    write_voronoi_artifact(tmp_path)
+    standardizer = Standardize_Locations.LocationStandardizer(tmp_path, max_nearest_km=None)
+    coords = [[0.5, 2.5], [0.25, 0.75], [0.5, 1.5], [0.9, 2.1], [0.25, 0.75]]
+    results = standardizer.standardize_many(coords)
+    # the batch gives each point what a lookup of its own would
+    assert [r.get("CITY") for r in results] == ["East", "West", None, "East", "West"]
+    assert results[0] == {"LATITUDE": 0.5, "LONGITUDE": 2.5, "CITY": "East", "STATE": "State",
+            "COUNTRY": "BB", "APPROXIMATE": False}
+    other = Standardize_Locations.LocationStandardizer(tmp_path, max_nearest_km=None)
+    assert [other.standardize(c) for c in coords] == results
+    assert standardizer.standardize_many([]) == []
+
+
+def test_exact_coordinates(tmp_path):
+    write_voronoi_artifact(tmp_path)
+    standardizer = Standardize_Locations.LocationStandardizer(tmp_path, max_nearest_km=None)
+    # rounded to the memo key, the point would fall on the edge of West
+    assert standardizer.standardize([0.5, 0.99996])["CITY"] == "West"
+    # a later point of the same key gets the remembered result
+    assert standardizer.standardize([0.5, 0.99995])["CITY"] == "West"
+    assert standardizer.stats()["memo_hits"] == 1
+
+
+def write_voronoi_shapefile(voronoi_dir, names):
+    polygons = [shapely.box(0, 0, 1, 1), shapely.box(2, 0, 3, 1)]
+    gpd.GeoDataFrame({"LATITUDE": [0.5, 0.5], "LONGITUDE": [0.5, 2.5], "NAME": names,
+            "ADM1NAME": ["", "State"], "ISO_A2": ["AA", "BB"]},
+            geometry=polygons, crs="EPSG:4326").to_file(voronoi_dir / "cities_Voronoi.shp")
+
+
+def test_voronoi_artifact(tmp_path, monkeypatch):
+    write_voronoi_shapefile(tmp_path, ["West", "East"])
+    reads = []
+    read_file = gpd.read_file
+    monkeypatch.setattr(gpd, "read_file", lambda f_name: reads.append(f_name) or read_file(f_name))
+
+    artifact = Standardize_Locations.build_artifact(tmp_path)
+    assert artifact == tmp_path / Standardize_Locations.ARTIFACT_NAME
+    standardizer = Standardize_Locations.LocationStandardizer(tmp_path)
+    assert standardizer.standardize([0.5, 2.5])["CITY"] == "East"
+    # the shapefile is read once, while the artifact is current
+    assert len(reads) == 1
+
+    # a changed shapefile is converted again
+    write_voronoi_shapefile(tmp_path, ["West", "Other"])
+    standardizer = Standardize_Locations.LocationStandardizer(tmp_path)
+    assert standardizer.standardize([0.5, 2.5])["CITY"] == "Other"
+    assert len(reads) == 2
+    assert [f.name for f in tmp_path.iterdir() if f.name.startswith(".")] == []
+
+
+def test_nearest_city_fallback(tmp_path):
+    write_voronoi_artifact(tmp_path)
+    standardizer = Standardize_Locations.LocationStandardizer(tmp_path, max_nearest_km=100)
+    inside, near_east, far = standardizer.standardize_many([[0.5, 0.25], [0.5, 3.2], [0.5, 10.0]])
+    assert inside["CITY"] == "West" and not inside["APPROXIMATE"]
+    # 0.2 degrees, about 22 km, east of the East cell
+    assert near_east["CITY"] == "East" and near_east["APPROXIMATE"]
+    assert far == {}
+    assert standardizer.stats()["approximate"] == 1
+
+    # the memo keeps the approximate flag
+    assert standardizer.standardize([0.5, 3.2])["APPROXIMATE"]
+
+
+def test_nearest_city_fallback_off(tmp_path):
+    write_voronoi_artifact(tmp_path)
+    standardizer = Standardize_Locations.LocationStandardizer(tmp_path, max_nearest_km=None)
+    assert standardizer.standardize([0.5, 3.2]) == {}
+    assert standardizer.standardize([0.5, 2.25])["CITY"] == "East"
@@ -0,0 +1,154 @@
+import json
+import re
+
+# characters read from the file at a time
+CHUNK_SIZE = 1 << 20
+# the levels that skip() walks through before decoding whole values, so
+# that skipping a table of a dump never decodes more than one record
+SKIP_DEPTH = 3
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+NUMBER_TAIL = re.compile(r'[0-9eE.+-]*')
+
+class JSONStream:
+    """Reads a JSON file a piece at a time.
+
+    array() and object() walk the items of a container, leaving the
+    stream at each item (after the key, for objects) for the caller to
+    decode with value(), step into, or skip(). value() decodes a single
+    item with the C decoder of the json module, so that only the item
+    being decoded, and not the whole file, is held in memory."""
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _read(self):
+        """Appends the next chunk of the file to the unread part of the buffer.
+        Returns False at the end of the file."""
+        if self.eof:
+            return False
+        # the chunks grow with a value that spans them, to read it in linear time
+        chunk = self.f.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Returns the next character that is not whitespace, or '' at the end."""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read():
+                return ''
+
+    def expect(self, chars):
+        ch = self.peek()
+        if not ch or ch not in chars:
+            raise ValueError(f"Expected one of {chars!r} but found {ch!r} in {self.f.name}.")
+        self.pos += 1
+        return ch
+
+    def value(self):
+        """Decodes the next value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._read():
+                    raise
+                continue
+            # a number at the end of the buffer may go on in the next chunk
+            if NUMBER_TAIL.match(self.buffer, end).end() == len(self.buffer) and self._read():
+                continue
+            self.pos = end
+            return value
+
+    def array(self):
+        """Yields once for each item of the array that comes next."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.expect(',]') == ']':
+                return
+
+    def object(self):
+        """Yields the key of each member of the object that comes next."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                self.expect('"')
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def skip(self, depth=SKIP_DEPTH):
+        """Reads past the next value."""
+        ch = self.peek()
+        if depth and ch == '[':
+            for _ in self.array():
+                self.skip(depth - 1)
+        elif depth and ch == '{':
+            for _ in self.object():
+                self.skip(depth - 1)
+        else:
+            self.value()
+
+    def find(self, path):
+        """Moves to the value at "path", a list of object keys and array indexes."""
+        for step in path:
+            if isinstance(step, int):
+                members = enumerate(self.array())
+            else:
+                members = ((key, None) for key in self.object())
+            for key, _ in members:
+                if key == step:
+                    break
+                self.skip()
+            else:
+                raise KeyError(step)
+
+def iter_items(f_name, path=()):
+    """Yields the items of the array at "path" in the JSON file f_name,
+    decoding one at a time. An empty path is the top-level array."""
+    with open(f_name, 'r') as f:
+        stream = JSONStream(f)
+        stream.find(path)
+        for _ in stream.array():
+            yield stream.value()
+
+def iter_tables(f_name, key='data', tables=None):
+    """Yields (table, item) for the items of the "key" array of each table
+    in a dump shaped like {table: {key: [item, ...], ...}, ...},
+    in the order they appear in the file. With "tables", the items of
+    the other tables are skipped without being decoded."""
+    with open(f_name, 'r') as f:
+        stream = JSONStream(f)
+        for table in stream.object():
+            if stream.peek() != '{' or (tables is not None and table not in tables):
+                stream.skip()
+                continue
+            for member in stream.object():
+                if member == key and stream.peek() == '[':
+                    for _ in stream.array():
+                        yield table, stream.value()
+                else:
+                    stream.skip()
+
+if __name__ == "__main__":
+    print("This script should not be run by itself. It is used by the Processing_ scripts.")
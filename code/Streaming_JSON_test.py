@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import json
+
+import Streaming_JSON
+
+dump = {
+    "fac": {"data": [{"id": 1, "latitude": "38.72", "longitude": -9.1e-1, "name": "Lisboa é \"1\""},
+                     {"id": 2, "latitude": None, "longitude": 12345678901234567890, "name": ""}],
+            "meta": {"generated": 1.5e9}},
+    "ix": {"data": [{"id": 7, "nested": [[], {}, [1, [2, {"a": [3]}]]]}]},
+    "empty": {"data": []},
+    "note": "not a table",
+    "net": {"meta": {}, "data": [{"asn": 64500, "aka": "A, B\\/C", "flag": True, "none": None}]},
+}
+
+
+def read_members(f_name, chunk_size, keep):
+    # the members of the top-level object, decoding those in "keep" and
+    # skipping the others, with chunks small enough for values to span them
+    with open(f_name, 'r') as f:
+        stream = Streaming_JSON.JSONStream(f, chunk_size)
+        members = {}
+        for key in stream.object():
+            if key in keep:
+                members[key] = stream.value()
+            else:
+                stream.skip()
+        return members
+
+
+def test_json_parity(tmp_path):
+    f_name = tmp_path / 'dump.json'
+    for indent in [None, 2]:
+        f_name.write_text(json.dumps(dump, indent=indent, ensure_ascii=False))
+        expected = [(t, item) for t, v in json.load(open(f_name)).items()
+                if isinstance(v, dict) for item in v.get('data', [])]
+        assert list(Streaming_JSON.iter_tables(f_name)) == expected
+        for chunk_size in [1, 3, 7, 64]:
+            assert read_members(f_name, chunk_size, dump.keys()) == dump
+            assert read_members(f_name, chunk_size, ['note', 'net']) == {'note': dump['note'], 'net': dump['net']}
+        # the skipped tables give nothing
+        assert list(Streaming_JSON.iter_tables(f_name, tables=['net'])) == \
+                [t for t in expected if t[0] == 'net']
+
+    f_name.write_text(json.dumps({"a": [{"b": [10, 2.5, "x"]}]}))
+    assert list(Streaming_JSON.iter_items(f_name, ['a', 0, 'b'])) == [10, 2.5, 'x']
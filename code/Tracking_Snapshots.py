@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import Saving_Tables
+
+# the folder of the processed directory that holds the manifests
+MANIFEST_DIR = "manifests"
+
+def file_stat(f_name):
+    st = os.stat(f_name)
+    return [st.st_size, st.st_mtime_ns]
+
+def hash_file(f_name):
+    sha = hashlib.sha256()
+    with open(f_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class SnapshotPlan:
+    """The snapshots that a processor has to read, and the asof dates of
+    the rows that the new rows replace in its outputs. "replaced_dates" is
+    None when the outputs are written again from all of the snapshots."""
+    def __init__(self, process, replaced_dates):
+        self.process = process
+        self.replaced_dates = replaced_dates
+
+    def up_to_date(self):
+        return not self.process and not self.replaced_dates
+
+class SnapshotManifest:
+    """Records which input snapshots (the dated folders that the crawlers
+    write) a processor has saved to its outputs, by the sha256 of their
+    files, so that running -p again only reads the snapshots that are new
+    or changed, and merges their rows into the outputs.
+
+    The manifest of processor "name" is a json file in
+    <out_dir>/manifests. The rows of a snapshot are found in the outputs
+    by their asof date. A file is only hashed again when its size or
+    modification time changed. If an output was changed or removed since
+    the manifest was saved, or its columns or format changed, all of the
+    snapshots are processed again."""
+    def __init__(self, out_dir, name):
+        self.out_dir = out_dir
+        self.f_name = out_dir / MANIFEST_DIR / f"{name}.json"
+        self.snapshots = {}
+        self.outputs = {}
+        if os.path.isfile(self.f_name):
+            with open(self.f_name, 'r') as f:
+                manifest = json.load(f)
+            self.snapshots = manifest["snapshots"]
+            self.outputs = manifest["outputs"]
+        # the files of the snapshots listed by plan()
+        self.current = {}
+
+    def hash_snapshot(self, snapshot_dir, snapshot):
+        """Returns {file name: [size, mtime, sha256]} of a snapshot folder."""
+        known = self.snapshots.get(snapshot, {}).get("files", {})
+        files = {}
+        for f in sorted(os.listdir(snapshot_dir)):
+            stat = file_stat(snapshot_dir / f)
+            if f in known and known[f][:2] == stat:
+                files[f] = known[f]
+            else:
+                files[f] = stat + [hash_file(snapshot_dir / f)]
+        return files
+
+    def output_name(self, f_name):
+        return Path(os.path.relpath(f_name, self.out_dir)).as_posix()
+
+    def digests(self, snapshot):
+        """Returns the asof date and the sha256 of each file of a snapshot entry."""
+        if snapshot is None:
+            return None
+        return snapshot["asof_date"], {f: v[2] for f, v in snapshot["files"].items()}
+
+    def outputs_intact(self, outputs):
+        """Checks that each output, a {csv file name: header} dict, was saved
+        with the same columns, in the current output format, and has not
+        been touched since."""
+        for f_name, header in outputs.items():
+            recorded = self.outputs.get(self.output_name(f_name))
+            saved_file = Saving_Tables.saved_file(f_name)
+            if recorded is None or saved_file is None:
+                return False
+            if saved_file.suffix != f".{Saving_Tables.output_format}":
+                return False
+            if recorded["header"] != list(header) or recorded["stat"] != file_stat(saved_file):
+                return False
+        return True
+
+    def plan(self, in_dir, snapshots, outputs):
+        """Compares "snapshots", a {folder: asof date} dict of the folders
+        in in_dir, with the manifest, and returns a SnapshotPlan."""
+        for s in snapshots:
+            self.current[s] = {"asof_date": snapshots[s], "files": self.hash_snapshot(in_dir / s, s)}
+        if not self.outputs_intact(outputs):
+            if self.snapshots or self.outputs:
+                print("\tThe outputs changed since they were last saved, processing every snapshot.")
+            return SnapshotPlan(list(snapshots), None)
+
+        changed = {s for s in snapshots if self.digests(self.snapshots.get(s)) != self.digests(self.current[s])}
+        removed = set(self.snapshots) - set(snapshots)
+        replaced_dates = {self.snapshots[s]["asof_date"] for s in (changed | removed) if s in self.snapshots}
+        replaced_dates |= {snapshots[s] for s in changed}
+        # the unchanged snapshots with the same asof date as a replaced one
+        # lose their rows too, so they are read again
+        process = [s for s in snapshots if s in changed or snapshots[s] in replaced_dates]
+        skipped = len(snapshots) - len(process)
+        if skipped:
+            print(f"\tSkipping {skipped} snapshots that are already processed.")
+        return SnapshotPlan(process, replaced_dates)
+
+    def save(self, outputs):
+        """Records the snapshots listed by plan() and the outputs as they are
+        now. It is called after the outputs are saved, so that a run that
+        stops part way processes the same snapshots again."""
+        manifest = {"snapshots": self.current,
+                "outputs": {self.output_name(f_name): {"header": list(header),
+                        "stat": file_stat(Saving_Tables.saved_file(f_name))}
+                    for f_name, header in outputs.items()}}
+        if not os.path.isdir(self.f_name.parent):
+            os.makedirs(self.f_name.parent)
+        tmp_file = self.f_name.with_name(f".{self.f_name.name}.{os.getpid()}")
+        with open(tmp_file, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.f_name)
+        self.snapshots = self.current
+        self.outputs = manifest["outputs"]
+
+if __name__ == "__main__":
+    print("This script should not be run by itself. It is used by the Processing_ scripts.")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os
+
+import Saving_Tables
+import Tracking_Snapshots
+
+
+def write_snapshot(in_dir, snapshot, text):
+    os.makedirs(in_dir / snapshot, exist_ok=True)
+    with open(in_dir / snapshot / 'dump.json', 'w') as f:
+        f.write(text)
+
+
+def save_outputs(outputs, snapshots, plan):
+    # the output gets one row per processed snapshot
+    for f_name, header in outputs.items():
+        os.makedirs(f_name.parent, exist_ok=True)
+        Saving_Tables.save_table([[64500, 'Org', 'PDB', snapshots[s]] for s in plan.process], header, f_name,
+                replaced_dates=plan.replaced_dates)
+
+
+def run_plan(in_dir, out_dir, snapshots, outputs, save=True):
+    manifest = Tracking_Snapshots.SnapshotManifest(out_dir, 'PDB')
+    plan = manifest.plan(in_dir, snapshots, outputs)
+    if save and not plan.up_to_date():
+        save_outputs(outputs, snapshots, plan)
+        manifest.save(outputs)
+    return plan
+
+
+def test_snapshot_plan(tmp_path, monkeypatch):
+    monkeypatch.setattr(Saving_Tables, 'output_format', 'csv')
+    in_dir = tmp_path / 'unprocessed'
+    out_dir = tmp_path / 'processed'
+    f_name = out_dir / 'asn_org' / 'PDB_asn_org.csv'
+    outputs = {f_name: ['asn', 'organization', 'source', 'asof_date']}
+    write_snapshot(in_dir, '2024_01_01', 'a')
+    write_snapshot(in_dir, '2024_02_01', 'b')
+    snapshots = {'2024_01_01': '2024-01-01', '2024_02_01': '2024-02-01'}
+
+    # the first run processes every snapshot
+    plan = run_plan(in_dir, out_dir, snapshots, outputs)
+    assert plan.process == ['2024_01_01', '2024_02_01']
+    assert plan.replaced_dates is None
+    assert run_plan(in_dir, out_dir, snapshots, outputs).up_to_date()
+
+    # a new snapshot is processed alone, and replaces nothing
+    write_snapshot(in_dir, '2024_03_01', 'c')
+    snapshots['2024_03_01'] = '2024-03-01'
+    plan = run_plan(in_dir, out_dir, snapshots, outputs)
+    assert plan.process == ['2024_03_01']
+    assert plan.replaced_dates == {'2024-03-01'}
+
+    # a changed snapshot replaces its rows, and a removed one loses them
+    write_snapshot(in_dir, '2024_01_01', 'changed')
+    del snapshots['2024_02_01']
+    plan = run_plan(in_dir, out_dir, snapshots, outputs)
+    assert plan.process == ['2024_01_01']
+    assert plan.replaced_dates == {'2024-01-01', '2024-02-01'}
+    with open(f_name, 'r') as f:
+        assert [row.split(',')[-1] for row in f.read().splitlines()[1:]] == ['2024-03-01', '2024-01-01']
+
+    # a touched file with the same content is not processed again
+    os.utime(in_dir / '2024_03_01' / 'dump.json', ns=(0, 0))
+    assert run_plan(in_dir, out_dir, snapshots, outputs).up_to_date()
+
+    # every snapshot is processed again when the output was changed,
+    # or is to be saved in another format
+    with open(f_name, 'a') as f:
+        f.write('64501,Other,PDB,2024-03-01\n')
+    assert run_plan(in_dir, out_dir, snapshots, outputs, save=False).replaced_dates is None
+    run_plan(in_dir, out_dir, snapshots, outputs)
+    monkeypatch.setattr(Saving_Tables, 'output_format', 'parquet')
+    plan = run_plan(in_dir, out_dir, snapshots, outputs, save=False)
+    assert plan.process == ['2024_01_01', '2024_03_01']
+    assert plan.replaced_dates is None
@@ -5,8 +5,8 @@ sql_create_city_points_table = """ CREATE TABLE IF NOT EXISTS city_points(
                                         city_name text,
                                         state_province text,
                                         country_code text,
-                                        city_latitude numeric,
-                                        city_longitude numeric
+                                        city_latitude real,
+                                        city_longitude real
                                     ); """
 
 sql_create_city_polygons_table = """ CREATE TABLE IF NOT EXISTS city_polygons(
@@ -44,7 +44,7 @@ sql_create_traceroutes_table = """ CREATE TABLE IF NOT EXISTS traceroutes(
                                         destination_ip text,
                                         hop_ip text,
                                         TTL integer,
-                                        RTT numeric,
+                                        RTT real,
                                         source text,
                                         timestamp integer,
                                         asof_date date
@@ -59,17 +59,18 @@ sql_create_asn_asname_table = """ CREATE TABLE IF NOT EXISTS asn_asname(
 
 sql_create_asn_loc_table = """ CREATE TABLE IF NOT EXISTS asn_loc(
                                         asn integer,
-                                        latitude numeric,
-                                        longitude numeric,
+                                        latitude real,
+                                        longitude real,
                                         source text,
                                         validated text,
-                                        standard_latitude numeric,
-                                        standard_longitude numeric,
+                                        standard_latitude real,
+                                        standard_longitude real,
                                         standard_city text,
                                         standard_state text,
                                         standard_country text,
                                         physical_presence text,
-                                        asof_date date
+                                        asof_date date,
+                                        approximate_location text
                                     ); """
 
 sql_create_asn_org_table = """ CREATE TABLE IF NOT EXISTS asn_org(
@@ -91,13 +92,14 @@ sql_create_asn_conn_table = """ CREATE TABLE IF NOT EXISTS asn_conn(
 sql_create_nodes_table = """ CREATE TABLE IF NOT EXISTS phys_nodes(
                                         organization text,
                                         node_name text,
-                                        latitude numeric,
-                                        longitude numeric,
+                                        latitude real,
+                                        longitude real,
                                         city text,
                                         state text,
                                         country text,
                                         source text,
-                                        asof_date date
+                                        asof_date date,
+                                        approximate_location text
                                     ); """
 
 sql_create_nodes_conn_table = """ CREATE TABLE IF NOT EXISTS phys_nodes_conn(
@@ -114,7 +116,7 @@ sql_create_standard_paths_table = """ CREATE TABLE IF NOT EXISTS standard_paths(
                                         to_city text,
                                         to_state text,
                                         to_country text,
-                                        distance_km numeric,
+                                        distance_km real,
                                         path_wkt text,
                                         asof_date date
                                     ); """
@@ -132,8 +134,8 @@ sql_create_landing_points_table = """ CREATE TABLE IF NOT EXISTS landing_points(
                                         city_name text,
                                         state_province text,
                                         country text,
-                                        latitude numeric,
-                                        longitude numeric,
+                                        latitude real,
+                                        longitude real,
                                         standard_city text,
                                         standard_state text,
                                         standard_country text,
@@ -151,6 +153,114 @@ sql_create_cable_landing_points_table = """ CREATE TABLE IF NOT EXISTS cable_lan
                                         asof_date date
                                     ); """
 
+# every (city, state, country) referenced by the other tables, so that
+# they can be joined on an integer city id instead of three text columns
+sql_create_cities_table = """ CREATE TABLE IF NOT EXISTS cities(
+                                        city_id integer PRIMARY KEY,
+                                        city_name text,
+                                        state_province text,
+                                        country_code text
+                                    ); """
+
+sql_create_cities_index = """ CREATE UNIQUE INDEX IF NOT EXISTS cities_name
+                                        ON cities(city_name, state_province, country_code); """
+
+# city id columns, added to the tables after loading and resolved from
+# their text columns, which are kept as they are.
+# table: {id column: (city column, state column, country column)}
+city_references = {
+        'city_points':{'city_id':('city_name', 'state_province', 'country_code')},
+        'city_polygons':{'city_id':('city_name', 'state_province', 'country_code')},
+        'ip_asn_dns':{'standard_city_id':('standard_city', 'standard_state', 'standard_country')},
+        'asn_loc':{'standard_city_id':('standard_city', 'standard_state', 'standard_country')},
+        'landing_points':{'standard_city_id':('standard_city', 'standard_state', 'standard_country')},
+        'standard_paths':{'from_city_id':('from_city', 'from_state', 'from_country'),
+                          'to_city_id':('to_city', 'to_state', 'to_country')},
+        'submarine_standard_paths':{'from_city_id':('from_city', 'from_state', 'from_country'),
+                                    'to_city_id':('to_city', 'to_state', 'to_country')},
+        'submarine_to_standard_paths':{'from_city_id':('from_city', 'from_state', 'from_country'),
+                                       'to_city_id':('to_city', 'to_state', 'to_country')}
+}
+
+# records which processed file was loaded into which table, so that
+# an incremental build only replaces the rows of files that changed.
+# A file whose size and modification time (in ns) are unchanged is not hashed again
+sql_create_load_manifest_table = """ CREATE TABLE IF NOT EXISTS load_manifest(
+                                        file_name text PRIMARY KEY,
+                                        table_name text,
+                                        sha256 text,
+                                        sources text,
+                                        file_size integer,
+                                        file_mtime integer
+                                    ); """
+
+# the fingerprint of the inputs of each build stage (see Building_Stages.py)
+# at its last successful run, so that a stage is skipped while they are unchanged
+sql_create_build_stages_table = """ CREATE TABLE IF NOT EXISTS build_stages(
+                                        stage_name text PRIMARY KEY,
+                                        fingerprint text,
+                                        outputs text,
+                                        seconds real
+                                    ); """
+
+# R*Tree indexes built next to the spatial tables, named <table>_rtree.
+# The id of each entry is the rowid of the indexed row, and the box is
+# the point itself or the bounding box of the wkt geometry.
+sql_create_rtree_table = """ CREATE VIRTUAL TABLE IF NOT EXISTS {}_rtree USING rtree(
+                                        id,
+                                        min_lon,
+                                        max_lon,
+                                        min_lat,
+                                        max_lat
+                                    ); """
+
+# table: (longitude column, latitude column) or (wkt column,)
+spatial_indexes = {
+        'city_points':('city_longitude', 'city_latitude'),
+        'asn_loc':('longitude', 'latitude'),
+        'landing_points':('longitude', 'latitude'),
+        'phys_nodes':('longitude', 'latitude'),
+        'standard_paths':('path_wkt',),
+        'submarine_cables':('cable_wkt',)
+}
+
+# FTS5 indexes over the name columns searched by substring, named <table>_fts.
+# They are external content tables that point at the rows of their table by
+# rowid, and the trigram tokenizer lets MATCH find any substring of three or
+# more characters, case insensitively, like LIKE '%text%' does.
+sql_create_fts_table = """ CREATE VIRTUAL TABLE IF NOT EXISTS {0}_fts USING fts5(
+                                        {1},
+                                        content='{0}',
+                                        content_rowid='rowid',
+                                        tokenize='trigram'
+                                    ); """
+
+# table: indexed text column
+text_indexes = {
+        'asn_asname':'asn_name',
+        'asn_org':'organization',
+        'phys_nodes':'organization'
+}
+
+# b-tree indexes on the columns that single rows are looked up by,
+# e.g. by the endpoints of Serving_API. table: [columns]
+lookup_indexes = {
+        'asn_loc':['asn'],
+        'ip_asn_dns':['ip_addr'],
+        'ip_inference':['ip_addr'],
+        'cable_landing_points':['cable_id'],
+        'landing_points':['city_name']
+}
+
+# binary (wkb) copies of the wkt columns, added to the tables after loading
+# so that readers can decode geometries without re-parsing text.
+# table: (wkt column, wkb column)
+geometry_columns = {
+        'city_polygons':('polygon_wkt', 'polygon_wkb'),
+        'standard_paths':('path_wkt', 'path_wkb'),
+        'submarine_cables':('cable_wkt', 'cable_wkb')
+}
+
 tables = {
         'city_points':sql_create_city_points_table,
         'city_polygons':sql_create_city_polygons_table,
@@ -1,5 +1,7 @@
 import sys
 import os
+import csv
+import json
 from pathlib import Path
 import dbStructure
 import ConvertToStandardPath_SubmarineCable
@@ -21,23 +23,50 @@ import Processing_RIPETraceroutes
 import Processing_Submarine
 import Processing_Voronoi
 import Processing_CloudRegions
+import Running_Processors
+import Saving_Tables
 import Creating_Database
+import Building_Stages
 import Creating_OrgKML
 import Querying_Database
+import Exporting_Parquet
 import Plotting_ASNLocs
 import Plotting_ShortestPath
 import Serving_API
 
+def add_cloud_regions_stage(db_creator, cloud_regions_csv, reload):
+    # with "reload", the regions added by the last build are dropped first,
+    # by reloading the tables that the load of this run did not already reload
+    if reload:
+        db_creator.reload_tables(['standard_paths', 'city_points'])
+        db_creator.add_geometry_blobs(['standard_paths'])
+    Processing_CloudRegions.add_cloud_regions_to_standard_paths(db_creator.db_file, cloud_regions_csv)
+    db_creator.build_spatial_indexes(['standard_paths', 'city_points'])
+
+query_delimiters = {'csv': ',', 'tsv': '\t'}
+
+def printable_value(value):
+    # blobs, such as the wkb geometries, are written as hex
+    return value.hex() if isinstance(value, bytes) else value
+
 class iGDB:
     def __init__(self, cli_args):
         self.print_help = False
         self.create_db = False
         self.create_db_name = ""
+        self.incremental = False
         self.process_data = False
         self.update_db = False
         self.update_location = ""
         self.query_db = False
         self.query_string = ""
+        self.query_format = "csv"
+        self.query_limit = None
+        self.query_profile = False
+        self.query_suggest_indexes = False
+        self.jobs = 1
+        self.export_parquet = False
+        self.export_dir = ""
         self.graph_asn = False
         self.graph_asn_num = ""
         self.hull_choice = False
@@ -55,7 +84,23 @@ class iGDB:
         self.database_path = Path("../database")
         self.plot_path = Path("../plots")
         self.helper_path = Path("../helper_data")
+        self.parquet_path = Path("../parquet")
+        self.log_path = Path("../logs")
+        option = None
         for a in cli_args:
+            # the value of an option given as "--option value"
+            if option == "--format":
+                self.query_format = a.lower()
+                option = None
+                continue
+            elif option == "--limit":
+                self.query_limit = a
+                option = None
+                continue
+            elif option == "--jobs":
+                self.jobs = a
+                option = None
+                continue
             if a == "-h" or "--help" in a:
                 self.print_help = True
                 break
@@ -67,6 +112,8 @@ class iGDB:
                 self.update_db = True
             elif a == "-q" or "--query" in a:
                 self.query_db = True
+            elif a == "-e" or "--export-parquet" in a:
+                self.export_parquet = True
             elif a == "-ga" or a == "--graph-asn":
                 self.graph_asn = True
             elif a == "-gab" or "--graph-asn-buffer" in a:
@@ -81,6 +128,27 @@ class iGDB:
                 self.create_kml = True
             elif a == "-api" or "--api" in a:
                 self.serve_api = True
+            elif a == "--incremental":
+                self.incremental = True
+            elif a == "--profile":
+                self.query_profile = True
+            elif a == "--suggest-indexes":
+                self.query_suggest_indexes = True
+            elif a.startswith("--format"):
+                if "=" in a:
+                    self.query_format = a.split("=", 1)[1].lower()
+                else:
+                    option = "--format"
+            elif a.startswith("--jobs"):
+                if "=" in a:
+                    self.jobs = a.split("=", 1)[1]
+                else:
+                    option = "--jobs"
+            elif a.startswith("--limit"):
+                if "=" in a:
+                    self.query_limit = a.split("=", 1)[1]
+                else:
+                    option = "--limit"
             elif self.update_db and self.update_location == "":
                 if a.lower() in self.valid_remote_locations:
                     self.update_location = a.lower()
@@ -94,6 +162,8 @@ class iGDB:
                 self.create_db_name = a
             elif self.query_db:
                 self.query_string += a + " "
+            elif self.export_parquet and self.export_dir == "":
+                self.export_dir = a
             elif self.graph_asn:
                 self.graph_asn_num = a
             elif self.graph_shortest_path and self.start_loc == "":
@@ -120,6 +190,30 @@ class iGDB:
             self.graph_shortest_path = False
             print(f"Please specify starting and ending locations to graph.")
 
+        if self.query_db and self.query_format not in query_delimiters and self.query_format != "jsonl":
+            self.query_db = False
+            print(f"{self.query_format} is an invalid output format. Please use csv, tsv or jsonl.")
+
+        if self.query_db and self.query_limit is not None:
+            try:
+                self.query_limit = int(self.query_limit)
+            except ValueError:
+                self.query_db = False
+                print(f"{self.query_limit} is an invalid limit. Please specify a number of rows.")
+
+        if self.process_data and self.query_format not in Saving_Tables.OUTPUT_FORMATS:
+            self.process_data = False
+            print(f"{self.query_format} is an invalid output format. Please use csv or parquet.")
+
+        if self.process_data:
+            try:
+                self.jobs = int(self.jobs)
+                if self.jobs < 1:
+                    raise ValueError
+            except ValueError:
+                self.process_data = False
+                print(f"{self.jobs} is an invalid number of jobs. Please specify a positive number.")
+
         if self.create_kml and self.organization == "":
             self.create_kml = False
             print(f"Please specify an organization.")
@@ -136,6 +230,8 @@ class iGDB:
             self.update_db_func()
         elif self.query_db:
             self.query_db_func()
+        elif self.export_parquet:
+            self.export_parquet_func()
         elif self.graph_asn:
             self.plot_asn_locations()
         elif self.graph_shortest_path:
@@ -167,6 +263,15 @@ class iGDB:
         print("\t\tcreates a new database from local files.")
         print("\t\t<name> is the filename, created in the default location.")
         print("\t\tNOTE: Unformatted data must be processed with '-p' before this can be run.")
+        print("\t-c or --create_db <name> --incremental")
+        print("\t\tupdates an existing database in place, replacing only the rows of ", end='')
+        print("processed files that changed\n\t\tsince the last load and ", end='')
+        print("recomputing only the derived tables whose inputs changed.")
+        print("\t-e or --export-parquet [<directory>]")
+        print("\t\texports every table of the database to a parquet file in <directory>, ", end='')
+        print("default '../parquet'.")
+        print("\t\tGeometries are written as wkb. Use Exporting_Parquet.parquetTables ", end='')
+        print("to load the tables as pandas or Arrow frames.")
         print("\t-ga or --graph-asn <ASN> ")
         print("\t\tplot the nodes of <ASN> on a map.")
         print("\t-gab or --graph-asn-buffer <ASN> ")
@@ -178,12 +283,24 @@ class iGDB:
         print("\t\tplot the shortest inferred physical fiber between the specified cities on a map.")
         print("\t-k or --create_kml <ORGANIZATION>")
         print("\t\tcreate a KML file with the <ORGANIZATION> nodes and edges.")
-        print("\t-p or --process")
+        print("\t-p or --process [--jobs <n>] [--format csv|parquet]")
         print("\t\tconverts unformatted local data files ", end='')
         print("into a format that can be added to the database")
-        print("\t-q or --query <sql>")
+        print("\t\t--jobs runs up to <n> source processors at once, ", end='')
+        print("each logging to its own file in '../logs/processing'.")
+        print("\t\t--format parquet saves the processed tables as typed parquet files ", end='')
+        print("instead of csv; -c loads either.")
+        print("\t-q or --query <sql> [--format csv|tsv|jsonl] [--limit <n>]")
         print("\t\texecutes a query of the iGIS database.")
         print("\t\t<sql> should be a valid SQL query")
+        print("\t\tRows are streamed as they are read, as csv with a header line by default, ", end='')
+        print("or as tab separated values or one json object per line.")
+        print("\t\t--limit stops after <n> rows.")
+        print("\t-q or --query <sql> --profile")
+        print("\t\talso prints the query plan, flagging full table scans and temporary B-trees, ", end='')
+        print("the wall time,\n\t\tthe rows returned and the rows of the fully scanned tables to stderr.")
+        print("\t-q or --query <sql> --suggest-indexes")
+        print("\t\tprints the query plan and proposes indexes for it, without running the query.")
         print("\t-u or --update <location>")
         print("\t\tqueries remote <location> ", end='')
         print("for updates to the local unprocessed information.")
@@ -203,22 +320,51 @@ class iGDB:
         print("\t\t* networkx")
         print("\t\t* numpy")
         print("\t\t* pandas")
+        print("\t\t* pyarrow")
         print("\t\t* requests")
         print("\t\t* ripe.atlas.cousteau")
         print("\t\t* rtree")
+        print("\t\t* scipy")
         print("\t\t* selenium")
         print("\t\t* shapely")
 
     def create_db_func(self):
         db_creator = Creating_Database.CreatingDatabase(self.processed_path,
-                self.database_path, self.create_db_name)
-        Processing_CloudRegions.add_cloud_regions_to_standard_paths(
-            self.database_path / self.create_db_name,
-            self.helper_path / 'cloud_regions' / 'cloud_region_coordinates.csv')
-        ConvertToStandardPath_SubmarineCable.add_submarine_cable_like_standard_path(
-            self.database_path / self.create_db_name)
-        ConvertToStandardPath_MergeSubmarineWithLandCable.connect_submarine_cable_to_standard_path(
-            self.database_path / self.create_db_name)
+                self.database_path, self.create_db_name, incremental=self.incremental)
+        changed = db_creator.changed_tables
+        # only the rows loaded by this run are missing their wkb geometry
+        db_creator.add_geometry_blobs()
+        db_creator.build_lookup_indexes()
+        if self.incremental:
+            db_creator.build_spatial_indexes([t for t in dbStructure.spatial_indexes
+                if t in changed or not db_creator.table_exists(f"{t}_rtree")])
+            db_creator.build_text_indexes([t for t in dbStructure.text_indexes
+                if t in changed or not db_creator.table_exists(f"{t}_fts")])
+        else:
+            db_creator.build_spatial_indexes()
+            db_creator.build_text_indexes()
+        db_file = self.database_path / self.create_db_name
+        cloud_regions_csv = self.helper_path / 'cloud_regions' / 'cloud_region_coordinates.csv'
+        # the cloud regions are added to the rows of standard_paths and city_points,
+        # so both tables are inputs and outputs of their stage
+        stages = [
+            Building_Stages.Stage('cloud_regions', add_cloud_regions_stage,
+                (db_creator, cloud_regions_csv, self.incremental),
+                inputs=['standard_paths', 'city_points'], input_files=[cloud_regions_csv],
+                outputs=['standard_paths', 'city_points']),
+            Building_Stages.Stage('submarine_standard_paths',
+                ConvertToStandardPath_SubmarineCable.add_submarine_cable_like_standard_path, (db_file,),
+                inputs=['submarine_cables', 'cable_landing_points', 'landing_points'],
+                outputs=['submarine_standard_paths']),
+            Building_Stages.Stage('submarine_to_standard_paths',
+                ConvertToStandardPath_MergeSubmarineWithLandCable.connect_submarine_cable_to_standard_path,
+                (db_file,), inputs=['standard_paths', 'cable_landing_points', 'landing_points'],
+                outputs=['submarine_to_standard_paths'])
+        ]
+        stage_builder = Building_Stages.BuildingStages(db_file, stages)
+        stage_builder.run_steps()
+        # only the rows added by this run are missing their city ids
+        db_creator.resolve_city_ids()
 
     def update_db_func(self):
         if not os.path.isdir(self.unprocessed_path):
@@ -253,75 +399,143 @@ class iGDB:
     def process_local_data_func(self):
         if not os.path.isdir(self.processed_path):
             os.makedirs(self.processed_path)
+        # one standardizer, loaded from the prebuilt Voronoi artifact,
+        # is shared by the processors that standardize locations
+        voronoi_dir = self.helper_path / 'cities_Voronoi'
 
-        # CAIDA ASRank processing
-        asrank_processor = Processing_ASRank.ProcessingASRank(self.unprocessed_path / "ASRank",
-                self.processed_path)
-        asrank_processor.run_steps()
-
-        # EuroIX processing
-        print()
-        euroix_processor = Processing_EuroIX.ProcessingEuroIX(self.unprocessed_path / "EuroIX",
-                self.processed_path)
-        euroix_processor.run_steps()
-
-        # Packet Clearinghouse processing
-        print()
-        pch_processor = Processing_PCH.ProcessingPCH(self.unprocessed_path / 'PCH',
-                self.processed_path)
-        pch_processor.run_steps()
-
-        # PeeringDB processing
-        print()
-        pdb_processor = Processing_PDB.ProcessingPDB(self.unprocessed_path / 'PeeringDB',
-                self.processed_path)
-        pdb_processor.run_steps()
-
-        # RIPE Atlas anchors and probes processing
-        print()
-        ripe_processor = Processing_RIPEAtlas.ProcessingRIPEAtlas(self.unprocessed_path / 'RIPEAtlas',
-                self.processed_path)
-        ripe_processor.run_steps()
-
-        # RIPE Atlas traceroute processing
-        print()
-        trace_processor = Processing_RIPETraceroutes.ProcessingRIPETraceroutes(self.unprocessed_path / 'RIPETraceroutes',
-                self.processed_path)
-        trace_processor.run_steps()
-
-        # Telegeography submarine cables processing
-        print()
-        telegeography_processor = Processing_Submarine.ProcessingSubmarine(self.unprocessed_path / 'Telegeography',
-                self.processed_path, self.helper_path / 'cities_Voronoi')
-        telegeography_processor.run_steps()
-
-        # Process the Voronoi diagram for the cities relations
-        print()
-        voronoi_processor = Processing_Voronoi.ProcessingVoronoi(self.helper_path / 'cities_Voronoi',
-                self.processed_path)
-        voronoi_processor.run_steps()
+        processors = [
+            # CAIDA ASRank processing
+            Running_Processors.Processor('ASRank', Processing_ASRank.ProcessingASRank,
+                (self.unprocessed_path / "ASRank", self.processed_path)),
+            # EuroIX processing
+            Running_Processors.Processor('EuroIX', Processing_EuroIX.ProcessingEuroIX,
+                (self.unprocessed_path / "EuroIX", self.processed_path)),
+            # Packet Clearinghouse processing
+            Running_Processors.Processor('PCH', Processing_PCH.ProcessingPCH,
+                (self.unprocessed_path / 'PCH', self.processed_path, voronoi_dir)),
+            # PeeringDB processing
+            Running_Processors.Processor('PeeringDB', Processing_PDB.ProcessingPDB,
+                (self.unprocessed_path / 'PeeringDB', self.processed_path, voronoi_dir)),
+            # RIPE Atlas anchors and probes processing
+            Running_Processors.Processor('RIPEAtlas', Processing_RIPEAtlas.ProcessingRIPEAtlas,
+                (self.unprocessed_path / 'RIPEAtlas', self.processed_path, voronoi_dir)),
+            # RIPE Atlas traceroute processing, which parses its files with one
+            # process per CPU, unless --jobs already runs processors at once
+            Running_Processors.Processor('RIPETraceroutes', Processing_RIPETraceroutes.ProcessingRIPETraceroutes,
+                (self.unprocessed_path / 'RIPETraceroutes', self.processed_path, 1 if self.jobs > 1 else None)),
+            # Telegeography submarine cables processing
+            Running_Processors.Processor('Telegeography', Processing_Submarine.ProcessingSubmarine,
+                (self.unprocessed_path / 'Telegeography', self.processed_path, voronoi_dir)),
+            # Process the Voronoi diagram for the cities relations
+            Running_Processors.Processor('Voronoi', Processing_Voronoi.ProcessingVoronoi,
+                (voronoi_dir, self.processed_path))
+        ]
+        # the output format and the standardizer are set up again in each
+        # process of --jobs, however it was started
+        runner = Running_Processors.RunningProcessors(processors, self.jobs, self.log_path / 'processing',
+                self.query_format, voronoi_dir)
+        runner.run_steps()
 
-    def query_db_func(self):
+        # with --jobs, the lookups were made by copies in the other processes
+        loc_standardizer = runner.loc_standardizer
+        if loc_standardizer and loc_standardizer.lookups:
+            stats = loc_standardizer.stats()
+            print(f"\nStandardized {stats['lookups']} locations: {stats['memo_hit_rate']:.1%} from the cache, "
+                    f"{stats['cell_hit_rate']:.1%} from grid cells, {stats['exact_lookups']} exact lookups, "
+                    f"{stats['approximate']} approximate.")
+
+    def find_database(self):
         # we assume the first file in the database directory
         # is the database we care about
         try:
-            f_name = os.listdir(self.database_path)[0]
+            return self.database_path / os.listdir(self.database_path)[0]
         except:
+            return None
+
+    def query_db_func(self):
+        db_file = self.find_database()
+        if db_file is None:
             print("Database does not exist. Create database before querying. ", end='')
             print("Consult help menu (-h) for detailed instructions.")
-            return ''
+            return
+
+        my_querier = Querying_Database.queryDatabase(db_file)
+        if self.query_suggest_indexes:
+            # only the plan is needed, the query itself is not run
+            self.print_query_plan(my_querier.query_plan(self.query_string), sys.stdout)
+            suggestions = my_querier.suggest_indexes(self.query_string)
+            print("Suggested indexes:")
+            for create in suggestions:
+                print(f"\t{create}")
+            if not suggestions:
+                print("\tnone")
+            return
+
+        # rows are written as they are fetched, so the output can be piped
+        if self.query_profile:
+            rows, profile = my_querier.profile_query(self.query_string, header=True, limit=self.query_limit)
+        else:
+            rows = my_querier.iter_query(self.query_string, header=True, limit=self.query_limit)
+        try:
+            if self.query_format == "jsonl":
+                columns = next(rows, ())
+                for row in rows:
+                    print(json.dumps(dict(zip(columns, row)), default=printable_value))
+            else:
+                writer = csv.writer(sys.stdout, delimiter=query_delimiters[self.query_format],
+                        lineterminator='\n')
+                for row in rows:
+                    writer.writerow([printable_value(v) for v in row])
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # the reader, e.g. head, stopped early
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+        if self.query_profile:
+            rows.close()
+            # the report goes to stderr, to keep it out of piped results
+            self.print_query_plan(profile['plan'], sys.stderr)
+            print(f"Wall time: {profile['seconds']:.3f} s", file=sys.stderr)
+            print(f"Rows returned: {profile['rows_returned']}", file=sys.stderr)
+            print(f"Rows in fully scanned tables: {profile['rows_scanned']}", file=sys.stderr)
+            if profile['vm_steps'] is not None:
+                print(f"Virtual machine steps: about {profile['vm_steps']}", file=sys.stderr)
+
+    def print_query_plan(self, plan, out):
+        print("Query plan:", file=out)
+        depth = {0: 0}
+        for step in plan:
+            depth[step['id']] = depth.get(step['parent'], 0) + 1
+            flags = []
+            if step['full_scan']:
+                flags.append("FULL SCAN")
+            if step['temp_btree']:
+                flags.append("TEMP B-TREE")
+            flag = f"  <-- {', '.join(flags)}" if flags else ""
+            print(f"{'  ' * depth[step['id']]}{step['detail']}{flag}", file=out)
 
-        #print(f"Querying {f_name} DB for '{self.query_string}'.")
-        my_querier = Querying_Database.queryDatabase(self.database_path / f_name)
-        my_results = my_querier.execute_query(self.query_string)
-        # uncomment to print the results of the query
-        print(f"{my_results}")
-        return my_results
+    def export_parquet_func(self):
+        db_file = self.find_database()
+        if db_file is None:
+            print("Database does not exist. Create database before exporting. ", end='')
+            print("Consult help menu (-h) for detailed instructions.")
+            return
+        out_path = Path(self.export_dir) if self.export_dir else self.parquet_path
+        my_exporter = Exporting_Parquet.ExportingParquet(db_file, out_path)
+        my_exporter.run_steps()
 
     def plot_asn_locations(self):
-        self.query_string = "SELECT latitude, longitude FROM asn_loc "
-        self.query_string += f"WHERE asn={self.graph_asn_num}; "
-        asn_coords = self.query_db_func()
+        try:
+            asn = int(self.graph_asn_num)
+        except ValueError:
+            print(f"{self.graph_asn_num} is not a valid ASN.")
+            return
+        db_file = self.find_database()
+        if db_file is None:
+            print("Database does not exist. Create database before querying. ", end='')
+            print("Consult help menu (-h) for detailed instructions.")
+            return
+        asn_coords = Querying_Database.queryDatabase(db_file).execute_named('asn_locations', (asn,))
         if asn_coords:
             asn_plotter = Plotting_ASNLocs.PlottingASNLocs(self.graph_asn_num,
                     self.hull_choice, self.buffer_choice, asn_coords, self.plot_path)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+import json
+import sqlite3
+
+import iGDB
+
+
+def setup_database(tmp_path):
+    database_path = tmp_path / 'database'
+    database_path.mkdir()
+    conn = sqlite3.connect(database_path / 'test.db')
+    conn.execute("CREATE TABLE asn_loc(asn integer, latitude real, source text, geom blob)")
+    conn.executemany("INSERT INTO asn_loc VALUES(?, ?, ?, ?)",
+            [(64500, 38.72, 'PDB', b'\x01\x02'), (64501, None, 'P\tC,H', None), (64502, 1.5, 'PDB', None)])
+    conn.commit()
+    conn.close()
+    return database_path
+
+
+def run_query(database_path, capsys, *args):
+    my_igdb = iGDB.iGDB(['iGDB.py', '-q', 'SELECT * FROM asn_loc ORDER BY asn'] + list(args))
+    my_igdb.database_path = database_path
+    my_igdb.run_steps()
+    return capsys.readouterr().out
+
+
+def test_query_formats(tmp_path, capsys):
+    database_path = setup_database(tmp_path)
+    out = run_query(database_path, capsys)
+    assert out.split('\n') == ['asn,latitude,source,geom', '64500,38.72,PDB,0102',
+            '64501,,"P\tC,H",', '64502,1.5,PDB,', '']
+
+    out = run_query(database_path, capsys, '--format', 'tsv', '--limit', '1')
+    assert out == 'asn\tlatitude\tsource\tgeom\n64500\t38.72\tPDB\t0102\n'
+
+    out = run_query(database_path, capsys, '--format=jsonl')
+    rows = [json.loads(line) for line in out.splitlines()]
+    assert rows[0] == {'asn': 64500, 'latitude': 38.72, 'source': 'PDB', 'geom': '0102'}
+    assert rows[1]['latitude'] is None
+    assert len(rows) == 3
+
+    # an unknown format is refused before the query runs
+    assert not iGDB.iGDB(['iGDB.py', '-q', 'SELECT 1', '--format', 'xml']).query_db
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-import sqlite3
+from Querying_Database import read_connection
 import sys
 import networkx as nx
 import matplotlib.pyplot as plt
@@ -8,8 +8,8 @@ from networkx.exception import NetworkXNoPath
 from collections import defaultdict
 
 def find_shortest_path(db_file, start_city, start_state, start_country, end_city, end_state, end_country):
-    # Connect to the SQLite database
-    conn = sqlite3.connect(db_file)
+    # the pooled read-only connection to the SQLite database
+    conn = read_connection(db_file)
     cursor = conn.cursor()
 
     # Query the nodes and connections from the database
@@ -79,8 +79,6 @@ def find_shortest_path(db_file, start_city, start_state, start_country, end_city
     #plt.show()
     """
 
-    # Close the database connection
-    conn.close()
 
 def parse_location(location):
     parts = location.split('/')